@@ -0,0 +1,118 @@
+"""
+Moving a user to the next level in one conditional UPDATE.
+
+    UPDATE user SET current_level = :next, ...
+    WHERE id = :id AND current_level = :expected
+    RETURNING id, username, current_level, ...
+
+Only the request that finds the row still on `expected` advances it, so a
+double-tapped submit or two workers racing on the same user can't both move
+it, and a change made elsewhere in between can't be overwritten. The statement
+also returns the updated row, so there's no read before or after it.
+When nothing matched, one SELECT tells a retry of a level that is already done
+(reported as such, and safe to treat as success) from a stale request.
+
+The ranking key is microseconds since the epoch. Unlike the old HHMMSSmmm
+number it doesn't wrap at midnight, so it orders finishes across days. Within
+a process it strictly increases, even if the wall clock steps back. Ties
+between processes fall back to the user id, as they do on the leaderboard.
+Rows written before that keep a time of day only; `migrate_legacy_keys` turns
+them into epoch keys at startup.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+
+ADVANCED = 'advanced'
+ALREADY_DONE = 'already_done'
+CONFLICT = 'conflict'
+
+# Old HHMMSSmmm keys are at most 235959999; epoch microseconds passed 10**12 in 1970
+LEGACY_KEY_LIMIT = 10 ** 12
+
+
+class RankingClock:
+    """Strictly increasing epoch microseconds for this process."""
+
+    def __init__(self):
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def __call__(self) -> int:
+        now = time.time_ns() // 1000
+        with self._lock:
+            self._last = now if now > self._last else self._last + 1
+            return self._last
+
+
+def display_time(key: int) -> str:
+    """The finish time shown on the leaderboard for a ranking key."""
+    return datetime.fromtimestamp(key / 1e6).strftime('%H:%M:%S:%f')[:-3]
+
+
+def legacy_key(display: Optional[str], serialized: int, now: Optional[datetime] = None) -> int:
+    """The epoch key for a finish stored as a time of day: its latest occurrence before `now`.
+
+    The time comes from the displayed HH:MM:SS:mmm, or the old key's digits if that doesn't parse.
+    """
+    now = now or datetime.now()
+    try:
+        finished = datetime.strptime(display or '', '%H:%M:%S:%f')
+    except ValueError:
+        finished = datetime.strptime(f'{serialized:09d}', '%H%M%S%f')
+    when = datetime.combine(now.date(), finished.time())
+    if when > now:
+        when -= timedelta(days=1)
+    return int(when.timestamp()) * 1000000 + when.microsecond
+
+
+def migrate_legacy_keys(conn, table) -> int:
+    """Rewrite the user table's time-of-day keys as epoch keys. Returns how many rows changed."""
+    rows = conn.execute(
+        select(table.c.id, table.c.last_correct_submission, table.c.last_correct_submission_serialized)
+        .where(table.c.last_correct_submission.isnot(None),
+               table.c.last_correct_submission_serialized < LEGACY_KEY_LIMIT)
+    ).all()
+    now = datetime.now()
+    for row in rows:
+        key = legacy_key(row.last_correct_submission, row.last_correct_submission_serialized or 0, now)
+        conn.execute(table.update()
+                     .where(table.c.id == row.id, table.c.last_correct_submission_serialized < LEGACY_KEY_LIMIT)
+                     .values(last_correct_submission_serialized=key))
+    return len(rows)
+
+
+class Advance(NamedTuple):
+    outcome: str
+    # The user's row after the attempt, None if the user doesn't exist
+    user: Optional[object]
+
+
+class LevelAdvancer:
+    def __init__(self, table, clock: Optional[RankingClock] = None):
+        """`table` is the user table; rows come back with its id, username and ranking columns."""
+        self.table = table
+        self.clock = clock or RankingClock()
+        self.columns = (table.c.id, table.c.username, table.c.current_level,
+                        table.c.last_correct_submission, table.c.last_correct_submission_serialized)
+
+    def advance(self, conn, user_id: int, expected: int) -> Advance:
+        """Move `user_id` from level `expected` to the next one, on connection `conn`."""
+        key = self.clock()
+        table = self.table
+        row = conn.execute(
+            table.update()
+            .where(table.c.id == user_id, table.c.current_level == expected)
+            .values(current_level=expected + 1, last_correct_submission=display_time(key),
+                    last_correct_submission_serialized=key)
+            .returning(*self.columns)
+        ).first()
+        if row is not None:
+            return Advance(ADVANCED, row)
+        row = conn.execute(select(*self.columns).where(table.c.id == user_id)).first()
+        if row is not None and (row.current_level or 0) > expected:
+            return Advance(ALREADY_DONE, row)
+        return Advance(CONFLICT, row)
@@ -4,28 +4,219 @@ from flask_login import LoginManager, UserMixin, login_user, login_required, log
 from datetime import datetime
 import pytz
 import os
-import bcrypt
 import shlex
-from riddles import riddle_manager
+from riddles import RiddleManager
 import io
 import math
 import json
-from config.flags import LEVEL_FLAGS
+from catalog import CatalogLoader
+from vfs import TerminalSessions
+from sandbox import SandboxPool, SandboxBusy, SandboxError
+from progress_store import MemoryProgressStore, SQLAlchemyProgressStore, ProgressCache
+from leaderboard import RankedLeaderboard
+from broadcaster import Broadcaster
+from passwords import PasswordHasher, PasswordPoolBusy
+from ratelimit import AdmissionController
+from user_cache import UserCache
+from sqlite_tuning import GroupCommitWriter, apply_pragmas, writer_engine, engine_options as sqlite_engine_options
+from assets import AssetManifest
+from artifacts import ArtifactStore
+from page_cache import FragmentCache
+from jinja2 import FileSystemBytecodeCache
+from metrics import Registry, ActiveUsers, instrument_app
+from logsetup import setup_logging, stop_logging, get_logger
+from scheduler import make_scheduler
+from eventlog import EventLog
+from advancement import LevelAdvancer, ADVANCED, ALREADY_DONE, migrate_legacy_keys
+from profiling import ProfileStore, RequestProfiler, install_profiler
+import atexit
+import hashlib
+import hmac
+import logging
 
 from datetime import datetime
 import random
+import time
+from array import array
+from functools import wraps, lru_cache
+from flask import g, make_response, session, Response, send_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 
 
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ctf3.db'
+# Workers must share the key, otherwise sessions only work on the worker that issued them
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(24)
+# Set by events.py when several hunts run side by side; each gets its own shard, files and cookies
+app.config['EVENT_NAME'] = os.environ.get('EVENT_NAME', '')
+# Directory holding config/hunt.json and challenges/ for this hunt
+app.config['CATALOG_ROOT'] = os.environ.get('CATALOG_ROOT', os.path.dirname(os.path.abspath(__file__)))
+if app.config['EVENT_NAME']:
+    event_name = app.config['EVENT_NAME']
+    # A cookie signed for one event is worthless in another, even for the same user id
+    secret = app.config['SECRET_KEY']
+    app.config['SECRET_KEY'] = hmac.new(secret if isinstance(secret, bytes) else secret.encode('utf-8'),
+                                        f'event:{event_name}'.encode('utf-8'), hashlib.sha256).hexdigest()
+    app.config['SESSION_COOKIE_NAME'] = f'session_{event_name}'
+    app.config['REMEMBER_COOKIE_NAME'] = f'remember_token_{event_name}'
+    os.makedirs(os.path.join(app.instance_path, 'shards'), exist_ok=True)
+# Reverse proxies (nginx, a load balancer) in front of the app. Each one appends to X-Forwarded-For,
+# and the client address is read that many hops back. Leave at 0 when clients connect directly,
+# since otherwise anyone could pick their own address
+app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', '0'))
+if app.config['TRUSTED_PROXIES']:
+    proxies = app.config['TRUSTED_PROXIES']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+# Any SQLAlchemy URL, e.g. a scratch SQLite file for load tests; each event defaults to its own shard
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///shards/{app.config['EVENT_NAME']}.db" if app.config['EVENT_NAME'] else 'sqlite:///ctf3.db')
+# Opt-in SQLite mode for big events: WAL, pragmas, a connection pool and group-committed writes
+app.config['SQLITE_TUNED'] = os.environ.get('SQLITE_TUNED', '0') == '1'
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000'))
+app.config['SQLITE_POOL_SIZE'] = int(os.environ.get('SQLITE_POOL_SIZE', '8'))
+# Most writes committed together and how long (seconds) the writer waits to fill a batch
+app.config['SQLITE_COMMIT_BATCH'] = int(os.environ.get('SQLITE_COMMIT_BATCH', '64'))
+app.config['SQLITE_COMMIT_DELAY'] = float(os.environ.get('SQLITE_COMMIT_DELAY', '0.002'))
+if app.config['SQLITE_TUNED']:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options(app.config['SQLITE_BUSY_TIMEOUT_MS'],
+                                                                    app.config['SQLITE_POOL_SIZE'])
+# 'sqlite' keeps progress in the database, 'memory' keeps it in this process only
+app.config['PROGRESS_BACKEND'] = os.environ.get('PROGRESS_BACKEND', 'sqlite')
+# Seconds a worker trusts its cached copy of someone's progress before re-reading it
+app.config['PROGRESS_CACHE_TTL'] = float(os.environ.get('PROGRESS_CACHE_TTL', '1.0'))
+# Seconds a worker serves current_user from memory before re-reading the users table
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', '10.0'))
+# Seconds without a request before a worker drops someone's progress from memory
+app.config['PROGRESS_IDLE_TIMEOUT'] = float(os.environ.get('PROGRESS_IDLE_TIMEOUT', '1800'))
+# Seeds each contestant's location order; keep it fixed for the whole event
+app.config['EVENT_SEED'] = os.environ.get('EVENT_SEED') or os.environ.get('SECRET_KEY', 'quicksnatch')
+# How the next location is picked: 'least_loaded', 'random' or 'seeded' (the user's own order)
+app.config['LOCATION_SCHEDULER'] = os.environ.get('LOCATION_SCHEDULER', 'least_loaded')
+# Contestants heading to one location before others are preferred; a hint's "capacity" overrides it
+app.config['LOCATION_CAPACITY'] = int(os.environ.get('LOCATION_CAPACITY', '10'))
+# Seconds after which someone who hasn't reached their location stops counting towards its load
+app.config['LOCATION_STALE_AFTER'] = float(os.environ.get('LOCATION_STALE_AFTER', '3600'))
+# Directory for the submission event log (see eventlog.py), empty turns it off
+app.config['EVENT_LOG_DIR'] = os.environ.get('EVENT_LOG_DIR', os.path.join(app.instance_path, 'events',
+                                                                          app.config['EVENT_NAME']))
+# asgi.py: threads running Flask views and the largest request body it reads into memory
+app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', '32'))
+app.config['ASGI_MAX_BODY'] = int(os.environ.get('ASGI_MAX_BODY', str(1024 * 1024)))
+# Seconds before a worker rebuilds its leaderboard to pick up other workers' results
+app.config['LEADERBOARD_MAX_AGE'] = float(os.environ.get('LEADERBOARD_MAX_AGE', '5.0'))
+# Rows rendered on /leaderboard, the JSON API pages through the rest
+app.config['LEADERBOARD_PAGE_SIZE'] = int(os.environ.get('LEADERBOARD_PAGE_SIZE', '100'))
+# bcrypt cost factor, existing hashes are upgraded on the next successful login
+app.config['BCRYPT_ROUNDS'] = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+# Threads doing bcrypt work and how many more jobs may queue behind them
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('PASSWORD_WORKERS', str(os.cpu_count() or 2)))
+app.config['PASSWORD_MAX_PENDING'] = int(os.environ.get('PASSWORD_MAX_PENDING', '64'))
+# Submissions allowed per second (and burst) per user and per IP, plus in-flight cap, per route
+# Seconds between checks for edited catalog files, 0 turns hot reloading off
+app.config['CATALOG_RELOAD_INTERVAL'] = float(os.environ.get('CATALOG_RELOAD_INTERVAL', '2.0'))
+app.config['ADMISSION_LIMITS'] = {
+    'check_flag': {'user_rate': 1.0, 'user_burst': 5, 'ip_rate': 5.0, 'ip_burst': 30, 'concurrency': 64},
+    'verify_location': {'user_rate': 0.5, 'user_burst': 5, 'ip_rate': 3.0, 'ip_burst': 20, 'concurrency': 16},
+    'terminal': {'user_rate': 5.0, 'user_burst': 20, 'ip_rate': 20.0, 'ip_burst': 100, 'concurrency': 64},
+    'sandbox': {'user_rate': 0.5, 'user_burst': 5, 'ip_rate': 2.0, 'ip_burst': 20, 'concurrency': 32},
+}
+# Warm worker processes running bash_compiler commands, and how many jobs may wait for them
+app.config['SANDBOX_WORKERS'] = int(os.environ.get('SANDBOX_WORKERS', '2'))
+app.config['SANDBOX_QUEUE_SIZE'] = int(os.environ.get('SANDBOX_QUEUE_SIZE', '32'))
+app.config['SANDBOX_TIMEOUT'] = float(os.environ.get('SANDBOX_TIMEOUT', '5.0'))
+# Sandbox jobs run in their own namespaces (needs util-linux unshare); 0 is for development only.
+# When the server runs as root, jobs also switch to SANDBOX_USER
+app.config['SANDBOX_ISOLATION'] = os.environ.get('SANDBOX_ISOLATION', '1') == '1'
+app.config['SANDBOX_USER'] = os.environ.get('SANDBOX_USER', 'nobody')
+# Terminal sessions (copy-on-write overlays over each level's files) kept per worker
+app.config['TERMINAL_MAX_SESSIONS'] = int(os.environ.get('TERMINAL_MAX_SESSIONS', '10000'))
+# Comma-separated usernames allowed on the organizer-only pages
+app.config['ADMIN_USERNAMES'] = frozenset(
+    name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip())
+# Rebuild the static bundles on startup when a source file is newer than static/dist/manifest.json
+app.config['ASSET_AUTO_BUILD'] = os.environ.get('ASSET_AUTO_BUILD', '1') == '1'
+# Challenge downloads are built once at deploy time (`python artifacts.py`, see artifacts.py);
+# 1 also rebuilds them on startup when a challenge file changed, for development
+app.config['DOWNLOADS_AUTO_BUILD'] = os.environ.get('DOWNLOADS_AUTO_BUILD', '0') == '1'
+# Where level pages tell contestants to fetch downloads from, default: this server's /downloads
+app.config['DOWNLOAD_MIRROR'] = os.environ.get('DOWNLOAD_MIRROR', '').rstrip('/')
+# Compiled templates are kept here so new workers skip compiling them, empty turns it off
+app.config['JINJA_BYTECODE_CACHE'] = os.environ.get('JINJA_BYTECODE_CACHE',
+                                                    os.path.join(app.instance_path, 'jinja_cache'))
+# Rendered level/hint/landing page fragments kept per worker
+app.config['PAGE_CACHE_SIZE'] = int(os.environ.get('PAGE_CACHE_SIZE', '1024'))
+# If set, /metrics needs 'Authorization: Bearer <token>'. Without one, /metrics only answers local
+# scrapes, and only with TRUSTED_PROXIES set, since through a proxy on this host every request looks local
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# Share of requests profiled without an X-Profile header, with which modes (cpu, stack, memory),
+# limited to these comma-separated endpoints if set
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+app.config['PROFILE_SAMPLE_MODES'] = frozenset(
+    mode.strip() for mode in os.environ.get('PROFILE_SAMPLE_MODES', 'stack').split(',') if mode.strip())
+app.config['PROFILE_ROUTES'] = frozenset(
+    name.strip() for name in os.environ.get('PROFILE_ROUTES', '').split(',') if name.strip())
+# Where request profiles are written and how many of the newest are kept
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles',
+                                                                      app.config['EVENT_NAME']))
+app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', '200'))
+# Log level, and the share of debug records that are actually written
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
 db = SQLAlchemy(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# Hot writes (progress, level completions) go through this when SQLITE_TUNED is on
+db_writer = None
+if app.config['SQLITE_TUNED']:
+    with app.app_context():
+        apply_pragmas(db.engine, busy_timeout_ms=app.config['SQLITE_BUSY_TIMEOUT_MS'],
+                      cache_size_kb=app.config['SQLITE_CACHE_SIZE_KB'])
+        db_writer = GroupCommitWriter(writer_engine(db.engine.url, app.config['SQLITE_BUSY_TIMEOUT_MS'],
+                                                    app.config['SQLITE_CACHE_SIZE_KB']),
+                                      max_batch=app.config['SQLITE_COMMIT_BATCH'],
+                                      max_delay=app.config['SQLITE_COMMIT_DELAY'])
+
+setup_logging(level=getattr(logging, app.config['LOG_LEVEL'], logging.INFO),
+              sample_rate=app.config['LOG_SAMPLE_RATE'])
+atexit.register(stop_logging)
+log = get_logger('quicksnatch.app')
+
+# Registered before the other hooks so its after_request runs last and sees all their queries
+metrics = Registry()
+# Each event app has its own engine; listening on the Engine class would count every app's SQL
+with app.app_context():
+    instrument_app(app, metrics, db.engine)
+profiler = RequestProfiler(ProfileStore(app.config['PROFILE_DIR'], keep=app.config['PROFILE_KEEP']),
+                           sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+                           sample_modes=app.config['PROFILE_SAMPLE_MODES'],
+                           routes=app.config['PROFILE_ROUTES'])
+# Only consulted when a request carries X-Profile, so other requests don't load the user
+install_profiler(app, profiler, lambda: current_user.is_authenticated and
+                 current_user.username in app.config['ADMIN_USERNAMES'])
+submissions = metrics.counter('submissions_total', 'Answers submitted, by kind and outcome',
+                              ('kind', 'outcome'))
+submission_log = EventLog(app.config['EVENT_LOG_DIR']) if app.config['EVENT_LOG_DIR'] else None
+if submission_log is not None:
+    atexit.register(submission_log.flush)
+
+
+def record_submission(kind, level, correct, location=None):
+    """Count a flag or location answer and append it to the event log."""
+    submissions.inc(kind, 'correct' if correct else 'incorrect')
+    if submission_log is not None:
+        started = g.get('request_started')
+        submission_log.record(current_user.id, level, kind, correct, location,
+                              latency=time.perf_counter() - started if started else 0.0)
+active_users = ActiveUsers()
+
 TOTAL_LVL = 6
 
+password_hasher = PasswordHasher(rounds=app.config['BCRYPT_ROUNDS'],
+                                 workers=app.config['PASSWORD_WORKERS'],
+                                 max_pending=app.config['PASSWORD_MAX_PENDING'])
+
 
 # Database Models
 class User(UserMixin, db.Model):
@@ -34,250 +225,113 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(120), nullable=False)
     current_level = db.Column(db.Integer, default=1)
     last_correct_submission = db.Column(db.String(20), nullable=True)
-    last_correct_submission_serialized = db.Column(db.Integer, default=1)
+    # Microseconds since the epoch of the last verified location (see advancement.py)
+    last_correct_submission_serialized = db.Column(db.BigInteger, default=1)
 
+    __table_args__ = (
+        # Matches the leaderboard ordering and holds every column it reads, so the
+        # leaderboard is one scan of this index without touching the table
+        db.Index('ix_user_leaderboard', current_level.desc(), last_correct_submission_serialized, id,
+                 username, last_correct_submission),
+    )
 
-# Level sections and their corresponding hints
 
+class ProgressRecord(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.Float, default=time.time)
 
 
-LEVEL_SECTIONS = {
-    1: {
-        'title': 'Hidden in Kanishk Plain Sight',
-        'description': """
-        "A secret is hidden in plain sight, though not immediately obvious. Can you find the hidden file within this directory and reveal its contents?"
+class RiddleRecord(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.Float, default=time.time)
 
-Intended User Thought Process:
 
-The user should realize that there are hidden files.
+# Level sections, location hints, flags and challenge files, reloaded when they change on disk
+catalog_loader = CatalogLoader(app.config['CATALOG_ROOT'],
+                               check_interval=app.config['CATALOG_RELOAD_INTERVAL'])
 
-They should use ls -al to list files.
 
-They should use cat to reveal the flag.
-        """,
-        'curl_command': 'curl -s https://raw.githubusercontent.com/nst-sdc/cli_ctf/refs/heads/main/level1.sh | bash',
-    },
-    2: {
-        'title': 'The Hidden Path',
-        'description': """
-        "A flag is tucked away, hidden from a simple list of files. It's said that a special directory hides the key. Can you navigate your way through and find what lies within and reveal the flag?"
+def get_catalog():
+    return catalog_loader.get()
 
-Intended User Thought Process:
 
-The user should realize that there are hidden directories.
+# Fingerprinted CSS/JS bundles, linked from templates with asset_url('name')
+asset_manifest = AssetManifest(app.static_folder).load(build_if_stale=app.config['ASSET_AUTO_BUILD'])
 
-They should use ls -al to list files and discover the hidden directory.
 
-They should use cat to reveal the flag file contents.
-        """,
-        'curl_command': 'curl -s https://raw.githubusercontent.com/nst-sdc/cli_ctf/refs/heads/main/level2.sh | bash',
-    },
-    3: {
-        'title': 'Following the Links',
-        'description': """
-"A complex path leads to the flag. The flag itself is hidden in a file, and its path includes a symbolic link. Your job is to navigate through the file structure, follow the link and then obtain the flag"
+@app.template_global()
+def asset_url(name):
+    return url_for('asset', filename=asset_manifest.filename(name))
 
-Intended User Thought Process:
 
-The user should be aware of the symbolic link and the hint.
+if app.config['JINJA_BYTECODE_CACHE']:
+    os.makedirs(app.config['JINJA_BYTECODE_CACHE'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE'])
 
-They should navigate into the hidden directory and locate the symlink.
+# Pages that look the same for everyone are rendered once per catalog version
+page_cache = FragmentCache(app.jinja_env, max_entries=app.config['PAGE_CACHE_SIZE'])
+catalog_loader.listeners.append(page_cache.clear)
 
-They should then use the script to reveal the flag.""",
-        'curl_command': 'curl -s https://raw.githubusercontent.com/nst-sdc/cli_ctf/refs/heads/main/level3.sh | bash',
-    },
-    4: {
-        'title': 'Permission Granted',
-        'description': """
-        "A direct path is needed, but you must use special permissions to read the content. You have to read the contents of the script to understand how to access the flag. "
 
-Intended User Thought Process:
+def location_capacities(catalog):
+    return {index: int(location['capacity'])
+            for index, location in enumerate(catalog.locations) if 'capacity' in location}
 
-The user should attempt to read the flag and find out that they don't have the permissions.
 
-They should read the content of the script.
+location_scheduler = make_scheduler(app.config['LOCATION_SCHEDULER'],
+                                    capacity=app.config['LOCATION_CAPACITY'],
+                                    capacities=location_capacities(get_catalog()),
+                                    stale_after=app.config['LOCATION_STALE_AFTER'])
+catalog_loader.listeners.append(
+    lambda catalog: setattr(location_scheduler, 'capacities', location_capacities(catalog)))
 
-They should execute the script.
-        """,
-        'curl_command': 'curl -s https://raw.githubusercontent.com/nst-sdc/cli_ctf/refs/heads/main/level4.sh | bash',
-    },
-    5: {
-        'title': 'Decode the Message',
-        'description': """
-        "A message has been encoded, and the key is available within the directory. You must use command line tools to decode the message. Explore the directory, find the message and decode it."
 
-Intended User Thought Process:
+def render_cached_page(template_name, key, **context):
+    """Render a page whose content only depends on `key`, reusing cached fragments."""
+    # Links in the page depend on where the app is mounted (see events.py)
+    return render_template('cached_page.html',
+                           fragments=page_cache.get(template_name, (request.script_root, key), **context))
 
-The user should realize that they are given a command and a file, then will need to use it.
 
-The user must find the encoded file, and then realize that they need to use the base64 command to decode it.
-        """,
-        'curl_command': 'curl -s https://raw.githubusercontent.com/nst-sdc/cli_ctf/refs/heads/main/level5.sh | bash',
-    }
-}
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    found = asset_manifest.resolve(filename, request.accept_encodings)
+    if found is None:
+        return jsonify({'success': False, 'message': 'Not found'}), 404
 
+    path, mimetype, encoding, etag = found
+    response = send_file(path, mimetype=mimetype, etag=etag, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # The file name changes with its content, so a cached copy never goes stale
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 
-# Location hints and their QR codes
-LOCATION_HINTS = [
-    {
-        'title': 'The Silent The Object Guardian',
-        'description': """A silent guardian bides her time.   
-Seek the lady, her story profound,  
-A mother, a founder, forever renowned.  
-Who is she, and what wisdom does she share?  
-Her presence whispers a legacy rare.""",
-        'code': 'HTML5GoldRush',
-        'is_hint': False
-    },
-    {
-        'title': 'The Rising Temple',
-        'description': """At the edge where paths converge and bend,  
-A temple is rising, on which peace depends.  
-Cradled by green, with a view so vast,  
-A quiet refuge, where moments last.  
-
-What place is blooming, serene and bright,  
-A haven of calm, bathed in light?""",
-        'code': 'CSSMysticTrail',
-        'is_hint': False
-    },
-    {
-        'title': 'The Rising Temple',
-        'description': """Where worth rest and shadows blend,  
-Beside the lot where pathways end.  
-Facing knowledge, calm and wide,  
-What is this place where peace resides?""",
-        'code': 'BugBountyHunt',
-        'is_hint': False
-    },
-        {
-        'title': 'The Rising Temple',
-        'description': """Where whispers of luxury fill the air,
-And every corner breathes beauty rare.
-A place where elegance and taste collide,
-With each sip, a world unfolds,
-A treasure trove that quietly holds.
-What is this space, where time stands still,
-A haven of grace, both rich and tranquil?""",
-        'code': 'BackendBandits',
-        'is_hint': False
-    },
-            {
-        'title': 'The Rising Temple',
-        'description': """Once alive with chatter and cheer,  
-Now silent, its purpose unclear.  
-A lone printer hums where meals once lay,  
-What is this place of a bygone day?""",
-        'code': 'NirmaanKnights',
-        'is_hint': False
-    },
-                {
-        'title': 'The Rising Temple',
-        'description': """Where the cobblestones meet the sea breeze, and the quiet hum of the city fades, a warm corner invites with the scent of roasted beans and a touch of something fresh from the oven, waiting to be discovered.""",
-        'code': 'XtremeDebugger',
-        'is_hint': False
-    },
-     {
-        'title': 'The Rising Temple',
-        'description': """Beside the field where the ball does fly,  
-A quiet refuge, where footsteps lie.  
-A hidden haven where knowledge align.  
-What place is this, where echoes cease,  
-A secret shelter, a moment of peace?""",
-        'code': 'APIExplorer22',
-        'is_hint': False
-    },
-         {
-        'title': 'The Rising Temple',
-        'description': """A heaven of calm, both deep and wide,
-Where whispers and silence collide.
-A place for the bold, a retreat for the still,
-A shimmering jewel that tests your will.
-What is this space, so serene and grand?""",
-        'code': 'DOMVoyagers',
-        'is_hint': False
-    },
-
-             {
-        'title': 'The Rising Temple',
-        'description': """Patience Is All The Strength That Man Need's""",
-        'code': 'BugBountyHunt',
-        'is_hint': False
-    },
-
-             {
-        'title': 'The Rising Temple',
-        'description': """Steps of color, bright and rare,
-A lively path beyond compare.
-A place of cheer, where stories unfold,
-What is this spot so vibrant and bold?""",
-        'code': 'TreasureInCode',
-        'is_hint': False
-    },
-                 {
-        'title': 'The Rising Temple',
-        'description': """Right by the halls, where footsteps fade,  
-A patch of green, like a scene in *Sholay*'s shade.  
-Amidst the hustle, a quiet space,  
-Like a tale, full of grace.  
-What spot is this, where calm is found,  
-A green escape, where peace resounds?""",
-        'code': 'JSPathfinder',
-        'is_hint': False
-    },
-                     {
-        'title': 'The Rising Temple',
-        'description': """At the gate where daily steps converge,  
-A threshold where journeys and minds emerge.    
-Yet here, a stillness, softly embraced.  
-What is this space, where time slows down,  
-A fleeting moment, just beyond the town?""",
-        'code': 'CodeQuest2025',
-        'is_hint': False
-    },
-                         {
-        'title': 'The Rising Temple',
-        'description': """Steel beams rise where once was plain,""",
-        'code': 'SyntaxSurvivours',
-        'is_hint': False
-    },
-                             {
-        'title': 'The Rising Temple',
-        'description': """I once had lines,now i dont, Goals and grasses, soon to be,but not. my surface was smooth,but now its torn,  In time,I'll be ready, but for now ,I'm worn.""",
-        'code': 'HackTheProtocol',
-        'is_hint': False
-    },
-                                 {
-        'title': 'The Rising Temple',
-        'description': """Where hunger meets a daily need,  
-A bustling spot where students feed.  
-Coupons in hand, the rule is clear,  
-What is this place we hold so dear?""",
-        'code': 'PixelPirates',
-        'is_hint': False
-    },
-                                     {
-        'title': 'The Rising Temple',
-        'description': """Where the arena roars, but wheels stand still,
-A parking lot where calmness fills.
-In front of the game, where energy flows,
-What is this spot where quietness grows?""",
-        'code': 'FullStackFury',
-        'is_hint': False
-    },
-                                         {
-        'title': 'The Rising Temple',
-        'description': """In front of the building where the name stands tall,  
-A statue of pride, a symbol for all.  
-Beside the waters, where ripples play,  
-A quiet corner to end your day.  
-What place is this, where stillness flows,  
-A monument of pride where calmness grows?""",
-        'code': 'SupabaseSeekers',
-        'is_hint': False
-    },
-]
+downloads = ArtifactStore(app.config['CATALOG_ROOT'],
+                          os.path.join(app.instance_path, 'downloads', app.config['EVENT_NAME'])).load(
+    build_if_stale=app.config['DOWNLOADS_AUTO_BUILD'])
+
+
+def download_mirror():
+    return app.config['DOWNLOAD_MIRROR'] or request.url_root.rstrip('/') + '/downloads'
+
+
+@app.route('/downloads/<path:filename>')
+def download(filename):
+    found = downloads.resolve(filename)
+    if found is None:
+        return jsonify({'success': False, 'message': 'Not found'}), 404
+
+    path, mimetype, etag = found
+    # conditional=True answers If-None-Match and Range requests; the file body goes out
+    # through the server's wsgi.file_wrapper (sendfile) where it has one
+    response = send_file(path, mimetype=mimetype, etag=etag, conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 
 
@@ -286,38 +340,209 @@ A monument of pride where calmness grows?""",
 def get_current_time_now():
     return datetime.now().strftime("%H:%M:%S:%f")[:-3]
 
-def get_current_time_now_serialized():
-    return int(datetime.now().strftime("%H%M%S%f")[:-3])
+
+def location_order(user_id, count, picks=()):
+    """The order a user visits the catalog's locations in, the same on every worker and restart.
+
+    The seeded shuffle is the starting point; each scheduler pick in `picks` was
+    swapped into the slot the user was at when it was made.
+    """
+    order = array('B' if count <= 256 else 'H', range(count))
+    random.Random(f"{app.config['EVENT_SEED']}:{user_id}").shuffle(order)
+    for cursor, location in enumerate(picks):
+        start = cursor % count
+        if location in order[start:]:
+            chosen = order.index(location, start)
+            order[start], order[chosen] = order[chosen], order[start]
+    return order
 
 
 class KUserProgress:
-    def __init__(self):
-        self.current_req = {}
+    # A contestant's whole hunt state: a few ints, a timestamp and their location order
+    __slots__ = ('user_id', 'cursor', 'current_level', 'is_hint', 'completed', 'last_currect_submission',
+                 'picks', '_order')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.cursor = 0
         self.last_currect_submission = get_current_time_now()
         self.current_level = 0
         self.is_hint = False
-        self.locations = LOCATION_HINTS[::]
-        self.completed_levels = set()
-        self.move_to_next_lvl()
-
+        # Bit n is set once level n is completed
+        self.completed = 0
+        # The location the scheduler chose at each cursor position, enough to rebuild the order
+        self.picks = []
+        self._order = None
+        self.assign_location()
+
+    @property
+    def order(self):
+        # Rebuilt when first needed or when the catalog's location count changes
+        count = len(get_catalog().locations)
+        if self._order is None or len(self._order) != count:
+            self._order = location_order(self.user_id, count, self.picks)
+        return self._order
+
+    @property
+    def current_location(self):
+        # Locations are tracked by index into the catalog so hint edits show up straight away
+        order = self.order
+        if not order:
+            return None
+        # Hunts longer than the location list start over from the beginning of the user's order
+        return order[self.cursor % len(order)]
+
+    @property
+    def current_req(self):
+        locations = get_catalog().locations
+        if self.current_location is None or self.current_location >= len(locations):
+            return {}
+        return locations[self.current_location]
+
+    @property
+    def completed_levels(self):
+        return {level for level in range(self.completed.bit_length()) if self.completed >> level & 1}
+
+    def complete_level(self, level):
+        self.completed |= 1 << level
+
+    def assign_location(self):
+        # Let the scheduler choose among the locations left in this pass and move it under the cursor
+        order = self.order
+        if not order:
+            return
+        start = self.cursor % len(order)
+        location = location_scheduler.choose(self.user_id, order[start:])
+        chosen = order.index(location, start)
+        order[start], order[chosen] = order[chosen], order[start]
+        self.picks.append(location)
 
     def move_to_next_lvl(self):
-        random_index = random.randint(0, len(self.locations) - 1)
-        random_element = self.locations.pop(random_index)  
-        self.current_req = random_element
-
+        self.cursor += 1
+        if self.current_level > TOTAL_LVL:
+            location_scheduler.release(self.user_id)
+        else:
+            self.assign_location()
+
+    def to_state(self):
+        return {
+            'user_id': self.user_id,
+            'cursor': self.cursor,
+            'last_currect_submission': self.last_currect_submission,
+            'current_level': self.current_level,
+            'is_hint': self.is_hint,
+            'completed': self.completed,
+            'picks': self.picks,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        if 'cursor' not in state:
+            # Saved before location orders were seeded; the user starts a fresh order
+            return None
+        progress = cls.__new__(cls)
+        progress.user_id = state['user_id']
+        progress.cursor = state['cursor']
+        progress.last_currect_submission = state['last_currect_submission']
+        progress.current_level = state['current_level']
+        progress.is_hint = state['is_hint']
+        progress.completed = state['completed']
+        progress.picks = list(state.get('picks', ()))
+        progress._order = None
+        return progress
+
+
+# One per app rather than riddles.riddle_manager, so each event keeps its own riddle state
+riddle_manager = RiddleManager()
+
+if app.config['PROGRESS_BACKEND'] == 'memory':
+    progress_backend = MemoryProgressStore()
+else:
+    progress_backend = SQLAlchemyProgressStore(db, ProgressRecord, writer=db_writer)
+    riddle_manager.use_store(SQLAlchemyProgressStore(db, RiddleRecord, writer=db_writer))
+
+progress_cache = ProgressCache(progress_backend,
+                               create=KUserProgress,
+                               from_state=KUserProgress.from_state,
+                               to_state=KUserProgress.to_state,
+                               ttl=app.config['PROGRESS_CACHE_TTL'],
+                               idle_timeout=app.config['PROGRESS_IDLE_TIMEOUT'])
 
 
 def Kget_user_progress(user_id='default'):
-    if user_id not in user_progress:
-        user_progress[user_id] = KUserProgress()
-    return user_progress[user_id]
+    progress = progress_cache.get(user_id)
+    # Remember who was touched so their changes get written back after the request
+    g.setdefault('progress_ids', set()).add(user_id)
+    return progress
+
 
+@app.after_request
+def save_user_progress(response):
+    for user_id in g.pop('progress_ids', ()):
+        progress_cache.sync(user_id)
+    return response
 
 
 # kanishk function end
 user_progress = {}
 
+leaderboard_events = Broadcaster()
+
+
+def publish_leaderboard_change(entry):
+    leaderboard_events.publish({
+        'user': entry.username,
+        'level': entry.current_level,
+        'time': entry.last_correct_submission,
+        'key': entry.last_correct_submission_serialized,
+    })
+
+
+leaderboard_board = RankedLeaderboard(max_age=app.config['LEADERBOARD_MAX_AGE'],
+                                      on_change=publish_leaderboard_change)
+
+
+def get_leaderboard():
+    if leaderboard_board.is_stale():
+        leaderboard_board.load(db.session.query(
+            User.id, User.username, User.current_level,
+            User.last_correct_submission, User.last_correct_submission_serialized,
+        ).order_by(User.current_level.desc(), User.last_correct_submission_serialized.asc(), User.id.asc()).all())
+    return leaderboard_board
+
+
+def update_leaderboard(user):
+    leaderboard_board.update(user.id, user.username, user.current_level,
+                             user.last_correct_submission, user.last_correct_submission_serialized)
+
+
+level_advancer = LevelAdvancer(User.__table__)
+
+
+def advance_user(user_id, level):
+    """Move a user past `level` with one conditional UPDATE; see advancement.py."""
+    if db_writer is None:
+        result = level_advancer.advance(db.session.connection(), user_id, level)
+        db.session.commit()
+    else:
+        result = db_writer.run(lambda conn: level_advancer.advance(conn, user_id, level))
+    if result.user is not None:
+        user_cache.put(result.user)
+        if result.outcome == ADVANCED:
+            update_leaderboard(result.user)
+    return result
+
+
+def leaderboard_entry_json(rank, entry):
+    return {
+        'rank': rank,
+        'username': entry.username,
+        'current_level': entry.current_level,
+        'last_correct_submission': entry.last_correct_submission,
+        # Ranking key, so live clients can slot stream deltas into a fetched page
+        'key': entry.last_correct_submission_serialized,
+    }
+
 class UserProgress:
     def __init__(self):
         self.current_level = 1
@@ -331,16 +556,20 @@ def get_user_progress(user_id='default'):
         user_progress[user_id] = UserProgress()
     return user_progress[user_id]
 
+user_cache = UserCache(lambda user_id: db.session.get(User, user_id), ttl=app.config['USER_CACHE_TTL'])
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return  db.session.get(User, int(user_id))
+    return user_cache.get(int(user_id))
 
 @app.route('/')
 def index():
     if current_user.is_authenticated:
         progress = Kget_user_progress(current_user.id)
         return redirect(url_for('level', level_number=progress.current_level))
-    return render_template('index.html')
+    # Only anonymous visitors get here, so the page is the same for all of them
+    return render_cached_page('index.html', (), current_user=current_user)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -348,8 +577,22 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
-        
-        if user and bcrypt.checkpw(password.encode('utf-8'), user.password):
+
+        try:
+            valid = user is not None and password_hasher.verify(password, user.password)
+        except PasswordPoolBusy:
+            flash('Too many people are logging in right now. Please try again in a moment.', 'warning')
+            return render_template('login.html'), 503
+
+        if valid:
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                    user_cache.invalidate(user.id)
+                except PasswordPoolBusy:
+                    # Not worth failing the login over, it will be retried next time
+                    pass
             login_user(user)
             flash('Successfully logged in!', 'success')
             progress = Kget_user_progress(user.id)
@@ -381,10 +624,15 @@ def register():
             flash('Username already exists', 'warning')
             return render_template('register.html')
         
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        try:
+            hashed_password = password_hasher.hash(password)
+        except PasswordPoolBusy:
+            flash('Too many people are signing up right now. Please try again in a moment.', 'warning')
+            return render_template('register.html'), 503
         user = User(username=username, password=hashed_password)
         db.session.add(user)
         db.session.commit()
+        update_leaderboard(user)
         
         flash('Registration successful! Please login.', 'success')
         return redirect(url_for('login'))
@@ -403,7 +651,7 @@ def level(level_number):
     try:
         progress = Kget_user_progress(current_user.id)
     except Exception:
-        return redirect('/')
+        return redirect(url_for('index'))
     # If user is at hint page, redirect back to hint
     #LASTOPTION
     if progress.is_hint:
@@ -418,25 +666,132 @@ def level(level_number):
     if level_number != progress.current_level:
         flash('You can only access your current level!', 'danger')
         return redirect(url_for('level', level_number=progress.current_level))
-    print(level_number ,progress.current_level )
-    level_data = LEVEL_SECTIONS.get(level_number, {})
-    return render_template(f'challenges/level_{level_number}.html', 
-                         level=level_number,
-                         level_data=level_data)
+    log.debug('level view', user=current_user.id, level=level_number)
+    catalog = get_catalog()
+    level_data = catalog.sections.get(level_number, {})
+    mirror = download_mirror()
+    setup_command = downloads.setup_command(level_number, mirror)
+    if setup_command:
+        level_data = {**level_data, 'curl_command': setup_command}
+    return render_cached_page(f'challenges/level_{level_number}.html',
+                              (catalog.version, level_number, downloads.version, mirror),
+                              level=level_number,
+                              level_data=level_data,
+                              # The level's practice files are served by /terminal, not shipped to the page
+                              terminal=level_number in catalog.terminal_levels)
 
 @app.route('/leaderboard')
 @login_required
 def leaderboard():
     # user = User.query.get(current_user.id) 
     # users = User.query.order_by(User.current_level.desc(), User.username).all() #DELETE
-    users = User.query.order_by(User.current_level.desc(), User.last_correct_submission_serialized.asc()).all()
+    board = get_leaderboard()
+
+    # The page also shows who is logged in, so the ETag has to cover that too
+    etag = f'{board.etag}-{current_user.id}-{current_user.current_level}'
+    if '_flashes' not in session and etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    users = [entry for _, entry in board.top(0, app.config['LEADERBOARD_PAGE_SIZE'])]
+    response = make_response(render_template('leaderboard.html', users=users,
+                                              total_users=board.total_users,
+                                              total_levels=board.total_levels,
+                                              page_size=app.config['LEADERBOARD_PAGE_SIZE']))
+    if '_flashes' not in session:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/leaderboard/stream')
+@login_required
+def leaderboard_stream():
+    last_version = request.headers.get('Last-Event-ID', request.args.get('last_version'))
+    last_version = int(last_version) if last_version and last_version.isdigit() else None
+
+    def refresh_board():
+        # Picks up results recorded by other workers while this client sits idle. The stream
+        # runs outside the request, so this gets its own app context and session each time
+        with app.app_context():
+            get_leaderboard()
+
+    # The stream can stay open for hours; don't hold a pooled connection (or the request
+    # context) for all of it
+    db.session.remove()
+    stream = leaderboard_events.stream(last_version, on_idle=refresh_board)
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@app.route('/api/leaderboard')
+@login_required
+def leaderboard_api():
+    board = get_leaderboard()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+
+    response = jsonify({
+        'success': True,
+        'page': page,
+        'per_page': per_page,
+        'total': board.total_users,
+        'users': [leaderboard_entry_json(rank, entry)
+                  for rank, entry in board.top((page - 1) * per_page, per_page)],
+    })
+    response.set_etag(f'{board.etag}-{page}-{per_page}')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
-    # print(user_progress)
-    for usr in user_progress.keys():
-        print(usr, user_progress[usr].locations)
-    return render_template('leaderboard.html', users=users)
+@app.route('/api/leaderboard/me')
+@login_required
+def leaderboard_rank():
+    board = get_leaderboard()
+    rank = board.rank(current_user.id)
+    if rank is None:
+        return jsonify({'success': False, 'message': 'You are not on the leaderboard yet'})
+
+    response = jsonify({
+        'success': True,
+        'total': board.total_users,
+        **leaderboard_entry_json(rank, board.get(current_user.id)),
+    })
+    response.set_etag(f'{board.etag}-{current_user.id}')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+admission_controllers = {}
+
+
+def admission_controlled(route):
+    """Reject submissions over the route's rate or concurrency limits before doing any work."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            controller = admission_controllers.get(route)
+            if controller is None:
+                controller = admission_controllers.setdefault(
+                    route, AdmissionController(**app.config['ADMISSION_LIMITS'][route]))
+
+            status, retry_after = controller.admit(current_user.get_id(), request.remote_addr)
+            if status is not None:
+                submissions.inc(route, 'throttled' if status == 429 else 'overloaded')
+                message = ('Too many attempts. Slow down and try again shortly.' if status == 429
+                           else 'Server is busy. Please try again in a moment.')
+                response = jsonify({'success': False, 'message': message})
+                response.status_code = status
+                response.headers['Retry-After'] = str(math.ceil(retry_after))
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.done()
+        return wrapper
+    return decorator
 
 @app.route('/check_flag/<int:level>', methods=['POST'])
+@admission_controlled('check_flag')
 def check_flag(level):
     progress = Kget_user_progress(current_user.id)
     data = request.get_json()
@@ -445,18 +800,25 @@ def check_flag(level):
     if not submitted_flag:
         return jsonify({'success': False, 'message': 'No flag submitted'})
     
-    if level not in LEVEL_FLAGS:
+    catalog = get_catalog()
+    if level not in catalog.level_flags:
         return jsonify({'success': False, 'message': 'Invalid level'})
     
-    if submitted_flag == LEVEL_FLAGS[level]:
-        # print(progress.)
+    if catalog.check_flag(level, submitted_flag):
+        record_submission('flag', level, True)
         progress.is_hint = True
         return jsonify({
             'success': True,
             'message': 'Flag correct! Proceed to find the location.',
-            'redirect': f'/location_hint/{level}'
+            'redirect': url_for('location_hint', level=level)
         })
     
+    record_submission('flag', level, False)
+    if catalog.level_for_flag(submitted_flag) is not None:
+        return jsonify({
+            'success': False,
+            'message': "That's another level's flag. Try again!"
+        })
     return jsonify({
         'success': False,
         'message': 'Incorrect flag. Try again!'
@@ -473,7 +835,7 @@ def level_complete(level):
         return redirect(url_for('level', level_number=progress.current_level))
     
     if request.method == 'POST':
-        print("Hello World")
+        log.debug('level complete posted', user=current_user.id, level=level)
         # print(progress.locations)
         # print("This could be nothing")
         # user = User.query.get(current_user.id) 
@@ -499,6 +861,80 @@ def level_time(level):
     time_spent = current_user.format_time_spent(level)
     return jsonify({'time_spent': time_spent})
 
+terminal_sessions = TerminalSessions(max_sessions=app.config['TERMINAL_MAX_SESSIONS'])
+
+@app.route('/terminal/<int:level>', methods=['POST'])
+@login_required
+@admission_controlled('terminal')
+def terminal(level):
+    progress = Kget_user_progress(current_user.id)
+    if level != progress.current_level:
+        return jsonify({'success': False, 'message': 'You can only use the terminal of your current level!'}), 403
+
+    catalog = get_catalog()
+    level_info = catalog.terminal_levels.get(level)
+    if level_info is None:
+        return jsonify({'success': False, 'message': 'This level has no terminal'}), 404
+
+    data = request.get_json(silent=True) or {}
+    command = str(data.get('command', '')).strip()
+    session = terminal_sessions.get(current_user.id, level, catalog.version, level_info)
+    output = session.execute(command) if command else ''
+    return jsonify({
+        'success': True,
+        'output': output,
+        'cwd': session.cwd,
+        'prompt': level_info.get('prompt', 'user@quicksnatch'),
+    })
+
+sandbox_pool = SandboxPool(workers=app.config['SANDBOX_WORKERS'],
+                           queue_size=app.config['SANDBOX_QUEUE_SIZE'],
+                           timeout=app.config['SANDBOX_TIMEOUT'],
+                           isolate=app.config['SANDBOX_ISOLATION'],
+                           run_as=app.config['SANDBOX_USER'])
+
+@app.route('/bash_compiler/<int:level>/run', methods=['POST'])
+@login_required
+@admission_controlled('sandbox')
+def bash_compiler_run(level):
+    if level != Kget_user_progress(current_user.id).current_level:
+        return jsonify({'success': False, 'message': 'You can only run commands for your current level!'}), 403
+    challenge = get_catalog().compiler_challenges.get(level)
+    if challenge is None:
+        return jsonify({'success': False, 'message': 'Invalid level'}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        argv = shlex.split(str(data.get('command', '')))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    challenge_dir = os.path.join(catalog_loader.root, 'challenges', 'bash_compiler', f'level{level}')
+    scripts = [name for name in os.listdir(challenge_dir) if name.endswith('.sh')]
+    scripts += [name for name in challenge.get('initial_files', {}) if name.endswith('.sh')]
+    try:
+        sandbox_pool.check_command(argv, challenge.get('validation', {}).get('commands', []), scripts)
+        result = sandbox_pool.run(argv, source_dir=challenge_dir,
+                                  files=challenge.get('initial_files', {}),
+                                  exclude=['challenge.json'])
+    except SandboxError as e:
+        submissions.inc('sandbox', 'rejected')
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except SandboxBusy:
+        response = jsonify({'success': False, 'message': 'Sandbox is busy. Please try again in a moment.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '2'
+        return response
+
+    submissions.inc('sandbox', 'timed_out' if result['timed_out'] else 'ran')
+    return jsonify({
+        'success': True,
+        'output': result['output'],
+        'exit_code': result['exit_code'],
+        'timed_out': result['timed_out'],
+        'truncated': result['truncated'],
+    })
+
 @app.route('/location_hint/<int:level>')
 @login_required
 def location_hint(level):
@@ -516,13 +952,31 @@ def location_hint(level):
     hint_data = progress.current_req 
     
     # print(hint_data.title)
-    return render_template('location_hint.html', 
-                         level=level,
-                         hint_title=hint_data.get('title', ''),
-                         location_hint=hint_data.get('description', ''))
+    hint_title = hint_data.get('title', '')
+    location_hint = hint_data.get('description', '')
+    return render_cached_page('location_hint.html', (level, hint_title, location_hint),
+                              level=level,
+                              hint_title=hint_title,
+                              location_hint=location_hint)
+
+def location_verified(level, current_level):
+    # Move to next level
+    if level > TOTAL_LVL:
+        return jsonify({
+            'success': True,
+            'message': 'Congratulations! You have completed all levels!',
+            'redirect': request.script_root + '/congratulations'
+        })
+
+    return jsonify({
+        'success': True,
+        'message': f'Location verified! Moving to level {current_level}',
+        'redirect': url_for('level', level_number=current_level)
+    })
 
 @app.route('/verify_location/<int:level>', methods=['POST'])
 @login_required
+@admission_controlled('verify_location')
 def verify_location(level):
     progress = Kget_user_progress(current_user.id)
     data = request.get_json()
@@ -534,6 +988,10 @@ def verify_location(level):
             'message': 'No location code provided'
         })
     
+    if level < progress.current_level:
+        # A retry of a level this user already finished, e.g. a double-tapped submit
+        return location_verified(level, progress.current_level)
+
     hint_data = progress.current_req 
 
     if not hint_data:
@@ -542,54 +1000,152 @@ def verify_location(level):
             'message': 'Invalid level'
         })
     
-    expected_code = hint_data['code']
-    print(submitted_code , expected_code)
-    if submitted_code == expected_code:
+    catalog = get_catalog()
+    if catalog.check_location(progress.current_location, submitted_code):
         # Mark current level as completed
-
-        progress.current_level = level+1
-        # print(progress.locations)
-        print("This could be nothing")
-        user = db.session.get(User, current_user.id)
-        user.current_level = progress.current_level
-        user.last_correct_submission = get_current_time_now()
-        user.last_correct_submission_serialized = get_current_time_now_serialized() #UPDATE
-        print(user_progress)
+        # Logged once the outcome is known: only an actual advance counts as a correct location
         try:
-            db.session.commit()
-            progress.completed_levels.add(level)
-            progress.is_hint = False 
-            progress.move_to_next_lvl() #MOVE
+            result = advance_user(current_user.id, level) #UPDATE
         except Exception :
+            log.exception('saving a verified location failed', user=current_user.id, level=level)
+            record_submission('location', level, False, progress.current_location)
             return jsonify({
                 'success': False,
                 'message': 'Server Internal Issue. Reload and try again!'
             })
 
-
-        # Move to next level
-        if level > TOTAL_LVL:
+        if result.outcome == ALREADY_DONE:
+            # A concurrent request (or another worker) advanced this user first, and logged it
+            return location_verified(level, result.user.current_level)
+        if result.outcome != ADVANCED:
+            record_submission('location', level, False, progress.current_location)
             return jsonify({
-                'success': True,
-                'message': 'Congratulations! You have completed all levels!',
-                'redirect': '/congratulations'
+                'success': False,
+                'message': 'Your progress changed in another tab. Reload and try again!'
             })
-            
-        return jsonify({
-            'success': True,
-            'message': f'Location verified! Moving to level {progress.current_level}',
-            'redirect': f'/level/{progress.current_level}'
-        })
+
+        record_submission('location', level, True, progress.current_location)
+        progress.current_level = level+1
+        progress.complete_level(level)
+        progress.is_hint = False 
+        progress.move_to_next_lvl() #MOVE
+        return location_verified(level, progress.current_level)
 
     
+    record_submission('location', level, False, progress.current_location)
+    log.debug('wrong location code', user=current_user.id, level=level)
+    if catalog.locations_for_code(submitted_code):
+        return jsonify({
+            'success': False,
+            'message': "That code is from a different location. Keep hunting!"
+        })
     return jsonify({
         'success': False,
         'message': 'Incorrect location code. Try again!'
     })
 
+def admin_required(view):
+    """Only let usernames listed in ADMIN_USERNAMES through."""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if current_user.username not in app.config['ADMIN_USERNAMES']:
+            return jsonify({'success': False, 'message': 'Organizers only'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@lru_cache(maxsize=64)
+def render_qr_png(location_number, data):
+    # qrcode and Pillow are only needed by organizers, so import them on first use
+    import generate_qr_codes
+    return generate_qr_codes.render_qr_png(data, location_number), generate_qr_codes.qr_hash(data, location_number)
+
+@app.route('/qr/<int:location_number>.png')
+@admin_required
+def qr_code(location_number):
+    # Encode the code verify_location checks, numbered like the catalog's locations (from 0)
+    locations = get_catalog().locations
+    if location_number >= len(locations):
+        return jsonify({'success': False, 'message': 'Unknown location'}), 404
+    try:
+        png, digest = render_qr_png(location_number, locations[location_number]['code'])
+    except ImportError:
+        return jsonify({'success': False, 'message': 'QR rendering needs the qrcode and Pillow packages'}), 503
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response.make_conditional(request)
+
+@app.route('/admin/profiles')
+@admin_required
+def profiles():
+    return render_template('profiles.html', reports=profiler.store.list())
+
+@app.route('/admin/profiles/<profile_id>')
+@admin_required
+def profile_detail(profile_id):
+    report = profiler.store.get(profile_id)
+    if report is None:
+        return jsonify({'success': False, 'message': 'Unknown profile'}), 404
+    return render_template('profiles.html', report=report)
+
+@app.route('/admin/profiles/<profile_id>/<suffix>')
+@admin_required
+def profile_file(profile_id, suffix):
+    path = profiler.store.path(profile_id, suffix)
+    if path is None:
+        return jsonify({'success': False, 'message': 'Unknown profile'}), 404
+    return send_file(path, mimetype='text/plain' if suffix == 'folded' else 'application/octet-stream',
+                     as_attachment=suffix == 'prof')
+
+# Scrape-time readings of the worker's caches, pools and sessions
+metrics.gauge('active_users', 'Signed-in users seen in the last 5 minutes', active_users.count)
+metrics.gauge('progress_cache_entries', 'Progress entries held in this worker', lambda: len(progress_cache))
+metrics.gauge('terminal_sessions', 'Terminal sessions held in this worker', lambda: len(terminal_sessions))
+metrics.gauge('page_cache_entries', 'Rendered page fragments held in this worker', lambda: len(page_cache))
+metrics.gauge('page_cache_lookups', 'Rendered page cache hits and misses', lambda: {
+    ('hit',): page_cache.hits, ('miss',): page_cache.misses}, ('result',))
+metrics.gauge('user_cache_entries', 'Signed-in users cached in this worker', lambda: len(user_cache))
+metrics.gauge('user_cache_lookups', 'User cache hits and misses', lambda: {
+    ('hit',): user_cache.hits, ('miss',): user_cache.misses}, ('result',))
+metrics.gauge('location_load', 'Contestants this worker has sent to each location who haven\'t arrived yet',
+              lambda: {(str(location),): load for location, load in location_scheduler.loads().items()},
+              ('location',))
+metrics.gauge('leaderboard_users', 'Users on this worker\'s leaderboard', lambda: get_leaderboard().total_users)
+if submission_log is not None:
+    metrics.gauge('event_log', 'Submission log records written, dropped and queued',
+                  lambda: {(name,): value for name, value in submission_log.stats().items()}, ('stat',))
+if db_writer is not None:
+    metrics.gauge('db_writer', 'Group-commit writer batches, jobs, retries and queue depth',
+                  lambda: {(name,): value for name, value in db_writer.stats().items()}, ('stat',))
+metrics.gauge('bcrypt', 'Password pool counts and p50/p99 seconds for hash, verify and queue wait',
+              lambda: {(name,): value for name, value in password_hasher.stats().items()}, ('stat',))
+
+
+@app.after_request
+def track_active_user(response):
+    # Only count users this request already loaded, so static files don't cost a query
+    user = g.get('_login_user')
+    if user is not None and user.is_authenticated:
+        active_users.touch(user.id)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        # remote_addr is only the real client once ProxyFix has read the proxies' headers
+        allowed = bool(app.config['TRUSTED_PROXIES']) and request.remote_addr in ('127.0.0.1', '::1')
+    if not allowed:
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/congratulations')
 def congratulations():
-    print("This function was called ")
     return render_template('congratulations.html')
 
 @app.route('/levels')
@@ -597,7 +1153,20 @@ def levels():
     progress = get_user_progress()
     return render_template('levels.html', progress=progress)
 
-if __name__ == '__main__':
+def create_tables():
+    """Create missing tables and bring an existing database up to date."""
     with app.app_context():
-        db.create_all()    
+        db.create_all()
+        with db.engine.begin() as conn:
+            # Replaced by ix_user_leaderboard
+            conn.execute(db.text('DROP INDEX IF EXISTS ix_user_ranking'))
+            # create_all skips tables that already exist, so add any newer indexes by hand
+            for index in User.__table__.indexes:
+                index.create(bind=conn, checkfirst=True)
+            migrated = migrate_legacy_keys(conn, User.__table__)
+        if migrated:
+            log.info('migrated ranking keys', users=migrated)
+
+if __name__ == '__main__':
+    create_tables()
     app.run(host='0.0.0.0', port=7771, debug=True)
@@ -0,0 +1,295 @@
+"""
+Prebuilt challenge downloads served by the app itself.
+
+Each level's curl_command used to fetch a setup script from GitHub, so every
+contestant's setup depended on the venue's uplink. `build()` instead packs the
+level's files into the output directory:
+
+* levelN.<hash>.tar.gz: the home tree from challenges/levelN/level_info.json
+  (with its permissions and symlinks), the other files in challenges/levelN
+  at the same paths, and the bash_compiler player files for that level. Its
+  scripts ship only as binaries compiled with shc, never as source, and flag
+  files or anything containing the challenge's flag are left out. Compiled
+  binaries are cached by source hash, so shc runs once per script change.
+* levelN.<hash>.sh: a setup script that downloads the tarball from the mirror
+  URL it is given, checks its sha256 and unpacks it into ~/quicksnatch/levelN.
+
+Archives are built reproducibly (sorted entries, fixed mtimes and owners), so
+the same sources always give the same names and the files can be cached
+forever. manifest.json maps levels to their files.
+
+Level pages show the setup script's curl line in place of the section's
+curl_command for every level that has one.
+
+Run `python artifacts.py` once as a deploy step; workers only read the
+manifest, and without one the level pages keep their configured commands.
+With DOWNLOADS_AUTO_BUILD=1 the app rebuilds on startup when a source is newer
+than the manifest, which is meant for development.
+"""
+import argparse
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from typing import Dict, Iterator, Optional, Tuple
+
+from assets import _write_atomic
+
+SETUP_SCRIPT = '''#!/bin/bash
+# QuickSnatch level {level}: fetches the level files and unpacks them into ~/quicksnatch/level{level}
+# Usage: curl -fsS MIRROR/<this file> | bash -s -- MIRROR
+set -euo pipefail
+MIRROR="${{1:-${{QUICKSNATCH_MIRROR:?pass the download URL as the first argument}}}}"
+ARCHIVE="{archive}"
+SHA256="{sha256}"
+DEST="${{QUICKSNATCH_HOME:-$HOME/quicksnatch}}/level{level}"
+
+TMP="$(mktemp)"
+trap 'rm -f "$TMP"' EXIT
+curl -fsS "$MIRROR/$ARCHIVE" -o "$TMP"
+if command -v sha256sum >/dev/null 2>&1; then
+    echo "$SHA256  $TMP" | sha256sum -c --quiet -
+fi
+mkdir -p "$DEST"
+tar -xzf "$TMP" -C "$DEST"
+echo "Level {level} is ready in $DEST"
+'''
+
+MIMETYPES = {'.gz': 'application/gzip', '.sh': 'text/x-shellscript'}
+
+
+def _level_number(path: str) -> Optional[int]:
+    match = re.search(r'level(\d+)$', path)
+    return int(match.group(1)) if match else None
+
+
+def _mode(value, default: int) -> int:
+    try:
+        return int(str(value), 8)
+    except ValueError:
+        return default
+
+
+class ArtifactStore:
+    def __init__(self, root: str, out_dir: str, shc: Optional[str] = None):
+        """`root` holds challenges/; `shc` is the shc binary, looked up on PATH by default."""
+        self.root = root
+        self.out_dir = out_dir
+        self.cache_dir = os.path.join(out_dir, 'shc-cache')
+        self.manifest_path = os.path.join(out_dir, 'manifest.json')
+        self.shc = shc or shutil.which('shc')
+        self.levels: Dict[int, Dict] = {}
+        # Content-hashed file name -> manifest entry, used when serving
+        self.files: Dict[str, Dict] = {}
+        self.version = ''
+
+    def _level_dirs(self) -> Dict[int, Dict[str, str]]:
+        dirs: Dict[int, Dict[str, str]] = {}
+        for kind, pattern in (('terminal', ('challenges', 'level*')),
+                              ('compiler', ('challenges', 'bash_compiler', 'level*'))):
+            for path in glob.glob(os.path.join(self.root, *pattern)):
+                level = _level_number(path)
+                if level is not None and os.path.isdir(path):
+                    dirs.setdefault(level, {})[kind] = path
+        return dirs
+
+    def _sources(self) -> Iterator[str]:
+        for dirs in self._level_dirs().values():
+            for path in dirs.values():
+                for parent, _, names in os.walk(path):
+                    for name in names:
+                        yield os.path.join(parent, name)
+
+    def is_stale(self) -> bool:
+        try:
+            built = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return True
+        return any(os.stat(path).st_mtime > built for path in self._sources())
+
+    def compile_script(self, source: bytes) -> Optional[bytes]:
+        """The shc binary for a script, compiled once per distinct source."""
+        digest = hashlib.sha256(source).hexdigest()
+        cached = os.path.join(self.cache_dir, digest)
+        if os.path.exists(cached):
+            with open(cached, 'rb') as f:
+                return f.read()
+        if self.shc is None:
+            return None
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, 'script.sh')
+            with open(script, 'wb') as f:
+                f.write(source)
+            try:
+                # -r: the binary has to run on contestants' machines, not just this one
+                subprocess.run([self.shc, '-r', '-f', script, '-o', script + '.x'], cwd=tmp,
+                               capture_output=True, timeout=120, check=True)
+            except (OSError, subprocess.SubprocessError):
+                return None
+            with open(script + '.x', 'rb') as f:
+                binary = f.read()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        _write_atomic(cached, binary)
+        return binary
+
+    def _members(self, level: int, dirs: Dict[str, str]) -> Dict[str, Tuple[bytes, int, Optional[str]]]:
+        """Archive path -> (content, mode, symlink target) for one level."""
+        members: Dict[str, Tuple[bytes, int, Optional[str]]] = {}
+        terminal = dirs.get('terminal')
+        if terminal:
+            info_path = os.path.join(terminal, 'level_info.json')
+            info = {}
+            if os.path.exists(info_path):
+                with open(info_path) as f:
+                    info = json.load(f)
+            permissions = info.get('permissions', {})
+            for path, content in info.get('files', {}).items():
+                members[path.lstrip('/')] = (content.encode('utf-8'), _mode(permissions.get(path, '644'), 0o644), None)
+            for path, target in info.get('symlinks', {}).items():
+                members[path.lstrip('/')] = (b'', 0o777, target)
+            for parent, _, names in os.walk(terminal):
+                for name in names:
+                    full = os.path.join(parent, name)
+                    if full == info_path:
+                        continue
+                    # The tree already mirrors the home directory (home/user/...), so paths stay as they are
+                    relative = os.path.relpath(full, terminal).replace(os.sep, '/')
+                    with open(full, 'rb') as f:
+                        members.setdefault(relative, (f.read(), 0o644, None))
+
+        compiler = dirs.get('compiler')
+        if compiler:
+            challenge_path = os.path.join(compiler, 'challenge.json')
+            challenge = {}
+            if os.path.exists(challenge_path):
+                with open(challenge_path) as f:
+                    challenge = json.load(f)
+            flag = challenge.get('validation', {}).get('flag', '').encode('utf-8')
+            files: Dict[str, bytes] = {}
+            for parent, _, names in os.walk(compiler):
+                for name in names:
+                    full = os.path.join(parent, name)
+                    if full == challenge_path:
+                        continue
+                    with open(full, 'rb') as f:
+                        files[os.path.relpath(full, compiler).replace(os.sep, '/')] = f.read()
+            for name, content in challenge.get('initial_files', {}).items():
+                files.setdefault(name, content.encode('utf-8'))
+            for relative, content in files.items():
+                path = posixpath.join('compiler', relative)
+                if relative.endswith('.sh'):
+                    # Scripts carry the flag, so only their compiled binary ships
+                    binary = self.compile_script(content)
+                    if binary is not None:
+                        members[path + '.x'] = (binary, 0o755, None)
+                elif 'flag' not in posixpath.basename(relative).lower() and not (flag and flag in content):
+                    members[path] = (content, 0o644, None)
+        return members
+
+    @staticmethod
+    def _archive(members: Dict[str, Tuple[bytes, int, Optional[str]]]) -> bytes:
+        raw = io.BytesIO()
+        # mtime=0 and fixed owners keep the archive byte-identical across rebuilds
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0, filename='') as gz:
+            with tarfile.open(fileobj=gz, mode='w', format=tarfile.PAX_FORMAT) as tar:
+                for name in sorted(members):
+                    content, mode, target = members[name]
+                    info = tarfile.TarInfo(name)
+                    info.mode = mode
+                    info.mtime = 0
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = ''
+                    if target is not None:
+                        info.type = tarfile.SYMTYPE
+                        info.linkname = target
+                        tar.addfile(info)
+                    else:
+                        info.size = len(content)
+                        tar.addfile(info, io.BytesIO(content))
+        return raw.getvalue()
+
+    def build(self) -> Dict[int, Dict]:
+        """Write every level's archive and setup script, then the manifest."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        levels = {}
+        for level, dirs in sorted(self._level_dirs().items()):
+            members = self._members(level, dirs)
+            if not members:
+                continue
+            archive = self._archive(members)
+            sha256 = hashlib.sha256(archive).hexdigest()
+            archive_name = f'level{level}.{sha256[:12]}.tar.gz'
+
+            script = SETUP_SCRIPT.format(level=level, archive=archive_name, sha256=sha256).encode('utf-8')
+            script_hash = hashlib.sha256(script).hexdigest()
+            script_name = f'level{level}.{script_hash[:12]}.sh'
+
+            for name, content in ((archive_name, archive), (script_name, script)):
+                path = os.path.join(self.out_dir, name)
+                if not os.path.exists(path):
+                    _write_atomic(path, content)
+            levels[level] = {
+                'archive': {'file': archive_name, 'sha256': sha256, 'size': len(archive)},
+                'script': {'file': script_name, 'sha256': script_hash, 'size': len(script)},
+                'binaries': sorted(name for name in members if name.endswith('.sh.x')),
+            }
+
+        # Old files are left in place for pages rendered before the deploy
+        _write_atomic(self.manifest_path, json.dumps({str(level): entry for level, entry in levels.items()},
+                                                     indent=2, sort_keys=True).encode('utf-8'))
+        self._use(levels)
+        return levels
+
+    def load(self, build_if_stale: bool = True) -> 'ArtifactStore':
+        if build_if_stale and self.is_stale():
+            self.build()
+            return self
+        try:
+            with open(self.manifest_path) as f:
+                self._use({int(level): entry for level, entry in json.load(f).items()})
+        except FileNotFoundError:
+            # Not built for this deploy: serve nothing and keep the configured commands
+            self._use({})
+        return self
+
+    def _use(self, levels: Dict[int, Dict]):
+        self.levels = levels
+        self.files = {entry[kind]['file']: entry[kind] for entry in levels.values() for kind in ('archive', 'script')}
+        self.version = hashlib.sha256(''.join(sorted(self.files)).encode('utf-8')).hexdigest()[:12]
+
+    def resolve(self, filename: str) -> Optional[Tuple[str, str, str]]:
+        """(path, mimetype, etag) of a built file, or None for unknown files."""
+        entry = self.files.get(filename)
+        if entry is None:
+            return None
+        return os.path.join(self.out_dir, filename), MIMETYPES[os.path.splitext(filename)[1]], entry['sha256']
+
+    def setup_command(self, level: int, mirror: str) -> Optional[str]:
+        """The curl | bash line for a level, or None if it has no artifacts."""
+        entry = self.levels.get(level)
+        if entry is None:
+            return None
+        return f"curl -fsS {mirror}/{entry['script']['file']} | bash -s -- {mirror}"
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description='Build the challenge downloads served under /downloads.')
+    parser.add_argument('out_dir', nargs='?', default=os.path.join(here, 'instance', 'downloads'),
+                        help='default: instance/downloads; an event reads instance/downloads/<event>')
+    parser.add_argument('--root', default=here, help="the directory holding challenges/ (an event's root)")
+    args = parser.parse_args()
+    store = ArtifactStore(args.root, args.out_dir)
+    for level, entry in store.build().items():
+        print(f"level {level:<3} {entry['script']['file']:28s} {entry['archive']['file']} "
+              f"({entry['archive']['size']} bytes, {len(entry['binaries'])} shc binaries)")
+    if store.shc is None:
+        print('\nNote: install shc to also ship compiled bash_compiler binaries')
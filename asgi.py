@@ -0,0 +1,297 @@
+"""
+ASGI entry point for big events:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 7771
+
+`python app.py` keeps one thread per connection for the whole request, so
+phones on slow Wi-Fi tie up a thread while they upload a submission or download
+a page. Here the event loop does all the network I/O:
+
+* request bodies are read and responses written asynchronously; a Flask view
+  (check_flag, verify_location, location_hint, leaderboard, ...) only holds a
+  pool thread while it runs, and that is also where its blocking bcrypt and
+  SQLite work happens. Responses reach the loop through a small bounded queue,
+  so a large body (a level download, say) is read from Flask only as fast as
+  the client takes it, and its thread waits on the queue meanwhile;
+* /leaderboard/stream is served on the loop itself, so thousands of open
+  leaderboard pages don't need a thread each.
+
+Any ASGI 3 server works. No extra packages are needed.
+"""
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from http.cookies import SimpleCookie
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import HTTPException
+
+from app import app, create_tables, get_leaderboard, leaderboard_events, log, user_cache
+
+# Response messages buffered between a Flask thread and the loop, per request
+RESPONSE_QUEUE_SIZE = 8
+
+
+def _latin1(value: str) -> str:
+    # WSGI carries paths as bytes decoded as latin-1
+    return value.encode('utf-8').decode('latin-1')
+
+
+def _app_path(scope) -> str:
+    """The request path below the app's mount point (ASGI paths include root_path)."""
+    path, root = scope['path'], scope.get('root_path', '')
+    return path[len(root):] if root and path.startswith(root) else path
+
+
+def wsgi_environ(scope, body: bytes) -> dict:
+    """The PEP 3333 environ for an ASGI http scope with a fully read body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _latin1(scope.get('root_path', '')),
+        'PATH_INFO': _latin1(_app_path(scope)),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class FlaskASGI:
+    def __init__(self, flask_app, threads: int = 32, max_body: int = 1024 * 1024,
+                 heartbeat: float = 15.0):
+        self.flask_app = flask_app
+        self.max_body = max_body
+        self.heartbeat = heartbeat
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def http(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            await send_plain(send, 413, b'Request body too large')
+            return
+        if scope['method'] == 'GET' and self.endpoint(scope) == 'leaderboard_stream':
+            if await self.run(self.signed_in, scope):
+                await self.leaderboard_stream(scope, receive, send)
+                return
+        await self.call_flask(scope, body, receive, send)
+
+    def endpoint(self, scope) -> Optional[str]:
+        """The Flask endpoint a request would be routed to, None if it matches no route."""
+        adapter = self.flask_app.url_map.bind(
+            'localhost', script_name=scope.get('root_path') or '/', url_scheme=scope.get('scheme', 'http'))
+        try:
+            return adapter.match(_app_path(scope), method=scope['method'])[0]
+        except HTTPException:
+            return None
+
+    async def read_body(self, receive) -> Optional[bytes]:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    async def call_flask(self, scope, body: bytes, receive, send):
+        loop = asyncio.get_running_loop()
+        messages: asyncio.Queue = asyncio.Queue(maxsize=RESPONSE_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def post(message):
+            # Blocks the Flask thread while the queue is full, i.e. while the client is behind
+            future = asyncio.run_coroutine_threadsafe(messages.put(message), loop)
+            while True:
+                try:
+                    future.result(timeout=1.0)
+                    return
+                except FuturesTimeout:
+                    # Nobody will drain the queue once the request is abandoned
+                    if stop.is_set():
+                        future.cancel()
+                        return
+
+        job = loop.run_in_executor(self.executor, self.serve_flask, wsgi_environ(scope, body), post, stop)
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while True:
+                message = await messages.get()
+                if message is None:
+                    break
+                if stop.is_set():
+                    # Client gone: keep draining so the thread can finish
+                    continue
+                try:
+                    await send(message)
+                except OSError:
+                    stop.set()
+                if disconnected.done():
+                    # Tells a streamed response to stop once its current chunk is done
+                    stop.set()
+        finally:
+            stop.set()
+            disconnected.cancel()
+        await job
+
+    def serve_flask(self, environ, post: Callable[[Optional[dict]], None], stop: threading.Event):
+        """Run the view on a pool thread and hand the response to the loop with `post`.
+
+        A streamed response keeps this thread until it ends, because Flask's
+        request context lives on the thread that started it.
+        """
+        started = []
+
+        def start_response(status, response_headers, exc_info=None):
+            started[:] = [status, response_headers]
+
+        result = None
+        responded = False
+        try:
+            result = self.flask_app(environ, start_response)
+            status, response_headers = started
+            post({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                  'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                              for name, value in response_headers]})
+            responded = True
+            for chunk in result:
+                if chunk:
+                    post({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if stop.is_set():
+                    break
+            post({'type': 'http.response.body', 'body': b''})
+        except Exception:
+            log.exception('serving a request failed', path=environ['PATH_INFO'])
+            if not responded:
+                post({'type': 'http.response.start', 'status': 500,
+                      'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+                post({'type': 'http.response.body', 'body': b'Internal Server Error'})
+        finally:
+            if result is not None:
+                close_iterator(result)
+            post(None)
+
+    def signed_in(self, scope) -> bool:
+        """Whether the request's session cookie belongs to an existing user."""
+        cookies = SimpleCookie()
+        for name, value in scope.get('headers', ()):
+            if name == b'cookie':
+                cookies.load(value.decode('latin-1'))
+        morsel = cookies.get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if morsel is None or serializer is None:
+            return False
+        try:
+            session = serializer.loads(morsel.value,
+                                       max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+            user_id = int(session.get('_user_id'))
+        except Exception:
+            # Bad or expired cookies and remember-me logins go through Flask, which redirects or restores them
+            return False
+        with self.flask_app.app_context():
+            return user_cache.get(user_id) is not None
+
+    async def leaderboard_stream(self, scope, receive, send):
+        headers = dict(scope.get('headers', ()))
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        last_version = headers.get(b'last-event-id', b'').decode('latin-1') or query.get('last_version', [''])[0]
+        last_version = int(last_version) if last_version and last_version.isdigit() else None
+
+        def refresh_board():
+            # Picks up results recorded by other workers while this client sits idle
+            with self.flask_app.app_context():
+                get_leaderboard()
+
+        async def on_idle():
+            await self.run(refresh_board)
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        stream = leaderboard_events.astream(last_version, self.heartbeat, on_idle=on_idle)
+        try:
+            async for text in stream:
+                if disconnected.done():
+                    break
+                await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+        except OSError:
+            pass
+        except Exception:
+            log.exception('leaderboard stream failed')
+        finally:
+            disconnected.cancel()
+            await stream.aclose()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_plain(send, status: int, text: bytes):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                            (b'content-length', str(len(text)).encode())]})
+    await send({'type': 'http.response.body', 'body': text})
+
+
+def close_iterator(iterator):
+    close = getattr(iterator, 'close', None)
+    if close is not None:
+        close()
+
+
+create_tables()
+application = FlaskASGI(app, threads=app.config['ASGI_THREADS'], max_body=app.config['ASGI_MAX_BODY'])
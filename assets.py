@@ -0,0 +1,147 @@
+"""
+Fingerprinted, precompressed static bundles.
+
+The page CSS/JS lives in static/css and static/js. `build()` concatenates them into
+the bundles listed in BUNDLES, names each output after a hash of its content
+(leaderboard.3f2a9c1e04b7.js) and writes a .gz copy next to it, plus a .br copy
+when the brotli package is installed. static/dist/manifest.json maps bundle names
+to those files.
+
+Because a file's name changes whenever its content does, the files can be cached
+forever. Browsers only fetch the HTML again on repeat visits.
+
+Run `python assets.py` as a deploy step. The app also rebuilds on startup when a
+source is newer than the manifest.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Mapping, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bundle name -> source files under static/, concatenated in this order
+BUNDLES: Mapping[str, List[str]] = {
+    'base.css': ['css/style.css', 'css/base.css'],
+    'level.css': ['css/level.css'],
+    'level.js': ['js/level.js'],
+    'main.js': ['js/main.js'],
+    'location_hint.css': ['css/location_hint.css'],
+    'location_hint.js': ['js/location_hint.js'],
+    'leaderboard.css': ['css/leaderboard.css'],
+    'leaderboard.js': ['js/leaderboard.js'],
+}
+
+MIMETYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AssetManifest:
+    def __init__(self, static_folder: str, bundles: Mapping[str, List[str]] = BUNDLES,
+                 out_dir: str = 'dist'):
+        self.static_folder = static_folder
+        self.bundles = bundles
+        self.out_dir = os.path.join(static_folder, out_dir)
+        self.manifest_path = os.path.join(self.out_dir, 'manifest.json')
+        self.entries: Dict[str, Dict] = {}
+        # Fingerprinted file name -> manifest entry, used when serving
+        self.files: Dict[str, Dict] = {}
+
+    def _sources(self):
+        for sources in self.bundles.values():
+            for source in sources:
+                yield os.path.join(self.static_folder, source)
+
+    def is_stale(self) -> bool:
+        try:
+            built = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            return True
+        return any(os.stat(path).st_mtime > built for path in self._sources())
+
+    def build(self) -> Dict[str, Dict]:
+        """Write every bundle and its compressed copies, then the manifest."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        entries = {}
+        for name, sources in self.bundles.items():
+            parts = []
+            for source in sources:
+                with open(os.path.join(self.static_folder, source), 'rb') as f:
+                    parts.append(f.read().rstrip(b'\n') + b'\n')
+            content = b'\n'.join(parts)
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            stem, ext = os.path.splitext(name)
+            filename = f'{stem}.{digest}{ext}'
+            path = os.path.join(self.out_dir, filename)
+
+            encodings = ['gzip']
+            if not os.path.exists(path):
+                _write_atomic(path, content)
+                # mtime=0 keeps the .gz byte-identical across rebuilds
+                _write_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                if not os.path.exists(path + '.br'):
+                    _write_atomic(path + '.br', brotli.compress(content))
+                encodings.insert(0, 'br')
+            entries[name] = {'file': filename, 'hash': digest, 'size': len(content),
+                             'encodings': encodings}
+
+        # Old fingerprinted files are left in place for pages rendered before the deploy
+        _write_atomic(self.manifest_path, json.dumps(entries, indent=2, sort_keys=True).encode('utf-8'))
+        self._use(entries)
+        return entries
+
+    def load(self, build_if_stale: bool = True) -> 'AssetManifest':
+        if build_if_stale and self.is_stale():
+            self.build()
+            return self
+        with open(self.manifest_path) as f:
+            self._use(json.load(f))
+        return self
+
+    def _use(self, entries: Dict[str, Dict]):
+        self.entries = entries
+        self.files = {entry['file']: entry for entry in entries.values()}
+
+    def filename(self, name: str) -> str:
+        """Fingerprinted file name of a bundle, e.g. 'base.css' -> 'base.1a2b3c4d5e6f.css'."""
+        return self.entries[name]['file']
+
+    def resolve(self, filename: str, accept_encoding) -> Optional[Tuple[str, str, Optional[str], str]]:
+        """Pick the best file for a request.
+
+        `accept_encoding` is the request's parsed Accept-Encoding header. Returns
+        (path, mimetype, content encoding or None, etag), or None for unknown files.
+        """
+        entry = self.files.get(filename)
+        if entry is None:
+            return None
+        path = os.path.join(self.out_dir, filename)
+        mimetype = MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+        for encoding, suffix in ENCODINGS:
+            if encoding in entry['encodings'] and accept_encoding[encoding] and os.path.exists(path + suffix):
+                return path + suffix, mimetype, encoding, f"{entry['hash']}-{encoding}"
+        return path, mimetype, None, entry['hash']
+
+
+if __name__ == '__main__':
+    static_folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'static')
+    for name, entry in AssetManifest(static_folder).build().items():
+        print(f"{name:20s} -> dist/{entry['file']} ({entry['size']} bytes, {', '.join(entry['encodings'])})")
+    if brotli is None:
+        print('\nNote: install the brotli package to also write .br files')
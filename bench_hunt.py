@@ -0,0 +1,260 @@
+"""
+Offline load test that plays a whole hunt against the real app.
+
+Every simulated contestant runs in its own thread with its own test client:
+register -> login -> for each level: /level/<n> -> /check_flag/<n> ->
+/location_hint/<n> -> /verify_location/<n> -> /leaderboard. Contestants take
+random think times between steps and send wrong answers at the configured rate.
+The app runs against a scratch SQLite file, so the real database is never touched.
+
+The admission limits are lifted for the run by default, so the numbers measure
+the app rather than the rate limiter. --rate-limits production keeps them.
+Contestants then wait out Retry-After like the real page does, and 429s are
+counted as throttled, separately from errors.
+
+Latency percentiles, throughput and error rates per route are printed as JSON
+(or written with --output). Pass --baseline with an earlier report to add
+per-route p95 ratios for spotting regressions:
+
+    python bench_hunt.py --contestants 50 --output before.json
+    python bench_hunt.py --contestants 50 --baseline before.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.unexpected: Dict[str, int] = defaultdict(int)
+        self.throttled: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float, status: int, unexpected: bool = False):
+        with self._lock:
+            self.timings[route].append(seconds)
+            self.statuses[route][status] += 1
+            if status == 429:
+                self.throttled[route] += 1
+            if unexpected:
+                self.unexpected[route] += 1
+
+    def report(self, elapsed: float) -> Dict:
+        routes = {}
+        total = errors = throttled = 0
+        for route, values in sorted(self.timings.items()):
+            values = sorted(values)
+            # 429s are the admission limits doing their job, not failures
+            route_errors = sum(count for status, count in self.statuses[route].items()
+                               if status >= 400 and status != 429)
+            route_errors += self.unexpected[route]
+            total += len(values)
+            errors += route_errors
+            throttled += self.throttled[route]
+            routes[route] = {
+                'count': len(values),
+                'errors': route_errors,
+                'error_rate': route_errors / len(values),
+                'throttled': self.throttled[route],
+                'throughput_rps': len(values) / elapsed,
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p50_ms': 1000 * percentile(values, 50),
+                'p95_ms': 1000 * percentile(values, 95),
+                'p99_ms': 1000 * percentile(values, 99),
+                'max_ms': 1000 * values[-1],
+                'statuses': {str(status): count for status, count in sorted(self.statuses[route].items())},
+            }
+        return {
+            'elapsed_s': elapsed,
+            'requests': total,
+            'throughput_rps': total / elapsed if elapsed else 0.0,
+            'errors': errors,
+            'error_rate': errors / total if total else 0.0,
+            'throttled': throttled,
+            'throttle_rate': throttled / total if total else 0.0,
+            'routes': routes,
+        }
+
+
+class Contestant:
+    def __init__(self, number: int, app_module, recorder: Recorder, args):
+        self.name = f'bench_{number}_{random.getrandbits(32):08x}'
+        self.A = app_module
+        self.recorder = recorder
+        self.args = args
+        self.rng = random.Random(args.seed + number)
+        self.client = app_module.app.test_client()
+        # One address per contestant so the per-IP admission limits see separate phones
+        self.environ = {'REMOTE_ADDR': f'10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'}
+
+    def think(self):
+        if self.args.think_time > 0:
+            time.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    def call(self, route: str, method: str, url: str, expect=None, **kwargs):
+        for _ in range(self.args.max_retries + 1):
+            started = time.perf_counter()
+            response = self.client.open(url, method=method, environ_base=self.environ, **kwargs)
+            elapsed = time.perf_counter() - started
+            if response.status_code != 429:
+                break
+            self.recorder.record(route, elapsed, response.status_code)
+            time.sleep(min(float(response.headers.get('Retry-After', 1)), 10.0))
+        else:
+            return response
+        unexpected = False
+        if expect is not None and response.status_code < 400:
+            body = response.get_json(silent=True) or {}
+            unexpected = bool(body.get('success')) != expect
+        self.recorder.record(route, elapsed, response.status_code, unexpected)
+        return response
+
+    def current_location_code(self) -> str:
+        # Stands in for walking to the spot and scanning the printed QR code
+        A = self.A
+        with A.app.app_context():
+            user = A.User.query.filter_by(username=self.name).first()
+            return A.progress_cache.get(user.id).current_req.get('code', '')
+
+    def wrong(self) -> bool:
+        return self.rng.random() < self.args.wrong_ratio
+
+    def run(self, levels: List[int], flags: Dict[int, str]):
+        password = 'bench-password'
+        self.call('register', 'POST', '/register',
+                  data={'username': self.name, 'password': password, 'confirm_password': password})
+        self.call('login', 'POST', '/login', data={'username': self.name, 'password': password})
+        for level in levels:
+            self.think()
+            self.call('level', 'GET', f'/level/{level}')
+            while self.wrong():
+                self.think()
+                self.call('check_flag', 'POST', f'/check_flag/{level}', expect=False,
+                          json={'flag': 'QS{definitely-wrong}'})
+            self.think()
+            self.call('check_flag', 'POST', f'/check_flag/{level}', expect=True, json={'flag': flags[level]})
+            self.call('location_hint', 'GET', f'/location_hint/{level}')
+            while self.wrong():
+                self.think()
+                self.call('verify_location', 'POST', f'/verify_location/{level}', expect=False,
+                          json={'code': 'NOT_A_REAL_SPOT'})
+            self.think()
+            self.call('verify_location', 'POST', f'/verify_location/{level}', expect=True,
+                      json={'code': self.current_location_code()})
+            self.call('leaderboard', 'GET', '/leaderboard')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--contestants', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=0,
+                        help='contestants playing at once (default: all of them)')
+    parser.add_argument('--levels', type=int, default=5, help='levels each contestant plays')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean seconds between steps')
+    parser.add_argument('--wrong-ratio', type=float, default=0.2,
+                        help='chance of each extra wrong answer before the right one')
+    parser.add_argument('--bcrypt-rounds', type=int, default=None,
+                        help='override BCRYPT_ROUNDS (lower it to focus on the other routes)')
+    parser.add_argument('--rate-limits', choices=('off', 'production'), default='off',
+                        help="'off' lifts the admission limits, 'production' keeps the app's settings")
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='times a throttled (429) request is retried after its Retry-After')
+    parser.add_argument('--database', default=None, help='SQLite file to use (default: a temp file)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', default=None, help='earlier report to compare against')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='qs-bench-')
+    database = os.path.abspath(args.database or os.path.join(workdir, 'bench.db'))
+    # Must be set before app is imported, it reads its configuration at import time
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    if args.bcrypt_rounds is not None:
+        os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+
+    A.create_tables()
+    if args.rate_limits == 'off':
+        # Controllers are built from this on first use, so it takes effect for the whole run
+        for limits in A.app.config['ADMISSION_LIMITS'].values():
+            limits.update(user_rate=1e9, user_burst=10 ** 9, ip_rate=1e9, ip_burst=10 ** 9,
+                          concurrency=max(limits['concurrency'], args.contestants * 2))
+    catalog = A.get_catalog()
+    levels = [level for level in sorted(catalog.level_flags) if level in catalog.sections][:args.levels]
+    flags = dict(catalog.level_flags)
+
+    recorder = Recorder()
+    failures = []
+    slots = threading.Semaphore(args.concurrency or args.contestants)
+
+    def play(number):
+        with slots:
+            try:
+                Contestant(number, A, recorder, args).run(levels, flags)
+            except Exception as e:
+                failures.append(f'{type(e).__name__}: {e}')
+
+    threads = [threading.Thread(target=play, args=(n,)) for n in range(args.contestants)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'commit': git_commit(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'levels': levels,
+        'failed_contestants': len(failures),
+        'failures': failures[:10],
+        **recorder.report(elapsed),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['baseline_commit'] = baseline.get('commit', '')
+        report['p95_ratio'] = {
+            route: stats['p95_ms'] / baseline['routes'][route]['p95_ms']
+            for route, stats in report['routes'].items()
+            if baseline.get('routes', {}).get(route, {}).get('p95_ms')
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+In-process publish/subscribe channel for Server-Sent Events.
+
+Every published event is serialised once and appended to a shared ring buffer
+tagged with a version number. Subscribers only remember the last version they
+sent, so publishing costs the same no matter how many clients are connected,
+and a reconnecting client can resume from the version it last saw.
+
+stream() blocks a thread per client; astream() is the asyncio equivalent, where
+all clients on one event loop share a single wake-up per published event.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+class Broadcaster:
+    def __init__(self, history: int = 1024):
+        self._events: "deque[Tuple[int, str]]" = deque(maxlen=history)
+        self._version = 0
+        self._cond = threading.Condition()
+        # One future per event loop with async subscribers, resolved on the next publish
+        self._loop_futures: Dict[asyncio.AbstractEventLoop, asyncio.Future] = {}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def publish(self, data: dict) -> int:
+        """Append an event and wake up waiting subscribers. Returns its version."""
+        with self._cond:
+            self._version += 1
+            payload = json.dumps({**data, 'version': self._version}, separators=(',', ':'))
+            self._events.append((self._version, payload))
+            self._cond.notify_all()
+            loop_futures, self._loop_futures = self._loop_futures, {}
+        for loop, future in loop_futures.items():
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # The loop has been closed
+                pass
+        return self._version
+
+    def events_since(self, version: int) -> Optional[List[Tuple[int, str]]]:
+        """Events newer than `version`, or None if the client can't catch up from the buffer."""
+        with self._cond:
+            if version > self._version:
+                return None
+            if version == self._version:
+                return []
+            if not self._events or self._events[0][0] > version + 1:
+                return None
+            # Versions are contiguous, so the offset into the buffer is known
+            start = version + 1 - self._events[0][0]
+            return list(self._events)[start:]
+
+    def wait(self, version: int, timeout: float) -> Optional[List[Tuple[int, str]]]:
+        """Block until there is something newer than `version` or `timeout` passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout=timeout)
+        return self.events_since(version)
+
+    async def wait_async(self, version: int, timeout: float) -> Optional[List[Tuple[int, str]]]:
+        """wait() for coroutines: suspends instead of blocking the thread."""
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            future = None
+            if self._version == version:
+                future = self._loop_futures.get(loop)
+                if future is None:
+                    future = self._loop_futures[loop] = loop.create_future()
+        if future is not None:
+            try:
+                # Shielded because every subscriber on this loop shares the future
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.events_since(version)
+
+    def _frame(self, version: int, events: Optional[List[Tuple[int, str]]]) -> Tuple[int, str]:
+        """SSE text for `events` and the version the client is at afterwards."""
+        if events is None:
+            version = self._version
+            return version, f'id: {version}\nevent: reset\ndata: {{"version":{version}}}\n\n'
+        if events:
+            return events[-1][0], ''.join(f'id: {event_version}\ndata: {payload}\n\n'
+                                          for event_version, payload in events)
+        return version, ': keep-alive\n\n'
+
+    def stream(self, last_version: Optional[int] = None, heartbeat: float = 15.0,
+               on_idle=None) -> Iterator[str]:
+        """Yield SSE-formatted text for a single client.
+
+        `last_version` is the Last-Event-ID a reconnecting client sent. If it can't
+        be resumed the client is told to `reset` and refetch the full board.
+        `on_idle` is called after each quiet heartbeat interval.
+        """
+        yield 'retry: 3000\n\n'
+        version = self._version if last_version is None else last_version
+        events = self.events_since(version)
+        while True:
+            version, text = self._frame(version, events)
+            yield text
+            if events == [] and on_idle is not None:
+                on_idle()
+            events = self.wait(version, heartbeat)
+
+    async def astream(self, last_version: Optional[int] = None, heartbeat: float = 15.0,
+                      on_idle: Optional[Callable[[], Awaitable]] = None) -> AsyncIterator[str]:
+        """stream() for asyncio servers. `on_idle` is a coroutine function."""
+        yield 'retry: 3000\n\n'
+        version = self._version if last_version is None else last_version
+        events = self.events_since(version)
+        while True:
+            version, text = self._frame(version, events)
+            yield text
+            if events == [] and on_idle is not None:
+                await on_idle()
+            events = await self.wait_async(version, heartbeat)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
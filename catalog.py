@@ -0,0 +1,237 @@
+"""
+Compiled challenge catalog.
+
+All level content is read once into an immutable Catalog: the level sections and
+location hints from config/hunt.json, the flags from config/flags.py, the terminal
+levels from challenges/levelN/level_info.json and the compiler challenges from
+challenges/bash_compiler/levelN/challenge.json. Lookup tables (code -> locations,
+flag -> level) and a validator for every `validation` block are built up front
+so requests only do dictionary lookups.
+
+CatalogLoader watches the source files' mtimes and swaps in a fresh Catalog when
+one changes, so organizers can fix a hint mid-event without restarting workers.
+"""
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import runpy
+import threading
+import time
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, Mapping, Optional, Tuple
+
+log = logging.getLogger('quicksnatch.catalog')
+
+
+class CatalogError(Exception):
+    """Raised when a catalog source file is missing or malformed."""
+
+
+def _freeze(value):
+    """Recursively turn dicts/lists into read-only mappings and tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _flag_validator(flag: str) -> Callable[[str], bool]:
+    expected = flag.encode('utf-8')
+
+    def validate(submitted: str) -> bool:
+        return hmac.compare_digest(submitted.strip().encode('utf-8'), expected)
+    return validate
+
+
+def _code_validator(codes) -> Callable[[str], bool]:
+    codes = frozenset(codes)
+
+    def validate(submitted: str) -> bool:
+        return submitted.strip() in codes
+    return validate
+
+
+# Builds a validator from a `validation` block. Hunt levels and locations without one get a
+# flag_check of their LEVEL_FLAGS entry and a code_check of their printed code
+VALIDATOR_FACTORIES = {
+    'flag_check': lambda block: _flag_validator(block['flag']),
+    'code_check': lambda block: _code_validator(block['codes']),
+}
+
+
+def compile_validator(block: Mapping) -> Callable[[str], bool]:
+    factory = VALIDATOR_FACTORIES.get(block.get('type'))
+    if factory is None:
+        raise CatalogError(f"Unknown validation type: {block.get('type')!r}")
+    try:
+        return factory(block)
+    except KeyError as e:
+        raise CatalogError(f"{block['type']} validation needs {e}") from e
+
+
+def _level_number(path: str) -> int:
+    match = re.search(r'level(\d+)', os.path.basename(os.path.dirname(path)))
+    if match is None:
+        raise CatalogError(f'Cannot tell the level number of {path}')
+    return int(match.group(1))
+
+
+class Catalog:
+    def __init__(self, sections, locations, level_flags, terminal_levels, compiler_challenges,
+                 version: str):
+        self.version = version
+        self.sections: Mapping[int, Mapping] = _freeze(sections)
+        self.locations: Tuple[Mapping, ...] = _freeze(locations)
+        self.level_flags: Mapping[int, str] = MappingProxyType(dict(level_flags))
+        self.terminal_levels: Mapping[int, Mapping] = _freeze(terminal_levels)
+        self.compiler_challenges: Mapping[int, Mapping] = _freeze(compiler_challenges)
+
+        code_locations: Dict[str, set] = {}
+        for index, location in enumerate(self.locations):
+            code_locations.setdefault(location['code'], set()).add(index)
+        # A code may be printed at more than one spot, so it maps to a set of indices
+        self.code_locations: Mapping[str, FrozenSet[int]] = MappingProxyType(
+            {code: frozenset(indices) for code, indices in code_locations.items()})
+
+        self.flag_levels: Mapping[str, int] = MappingProxyType(
+            {flag: level for level, flag in self.level_flags.items()})
+
+        self.flag_validators: Mapping[int, Callable[[str], bool]] = MappingProxyType(
+            {level: compile_validator(self.sections.get(level, {}).get('validation')
+                                      or {'type': 'flag_check', 'flag': flag})
+             for level, flag in self.level_flags.items()})
+        self.location_validators: Tuple[Callable[[str], bool], ...] = tuple(
+            compile_validator(location.get('validation') or {'type': 'code_check', 'codes': [location['code']]})
+            for location in self.locations)
+        self.terminal_validators: Mapping[int, Callable[[str], bool]] = MappingProxyType(
+            {level: compile_validator(info.get('validation') or {'type': 'flag_check', 'flag': info['flag']})
+             for level, info in self.terminal_levels.items() if 'validation' in info or 'flag' in info})
+        self.compiler_validators: Mapping[int, Callable[[str], bool]] = MappingProxyType(
+            {level: compile_validator(challenge['validation'])
+             for level, challenge in self.compiler_challenges.items() if 'validation' in challenge})
+
+    def check_flag(self, level: int, flag: str) -> bool:
+        validator = self.flag_validators.get(level)
+        return validator is not None and validator(flag)
+
+    def check_location(self, location_index: int, code: str) -> bool:
+        if not 0 <= location_index < len(self.location_validators):
+            return False
+        return self.location_validators[location_index](code)
+
+    def level_for_flag(self, flag: str) -> Optional[int]:
+        """The hunt level a flag belongs to, if any."""
+        return self.flag_levels.get(flag.strip())
+
+    def locations_for_code(self, code: str) -> FrozenSet[int]:
+        """Indices of the locations a printed code belongs to."""
+        return self.code_locations.get(code.strip(), frozenset())
+
+    @classmethod
+    def load(cls, root: str) -> 'Catalog':
+        digest = hashlib.sha1()
+
+        def read_json(path):
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                digest.update(raw)
+                return json.loads(raw)
+            except (OSError, ValueError) as e:
+                raise CatalogError(f'Cannot load {path}: {e}') from e
+
+        hunt = read_json(os.path.join(root, 'config', 'hunt.json'))
+        try:
+            sections = {int(level): section for level, section in hunt['level_sections'].items()}
+            locations = hunt['location_hints']
+        except (KeyError, ValueError, AttributeError) as e:
+            raise CatalogError(f'Malformed config/hunt.json: {e}') from e
+
+        flags_path = os.path.join(root, 'config', 'flags.py')
+        try:
+            with open(flags_path, 'rb') as f:
+                digest.update(f.read())
+            level_flags = runpy.run_path(flags_path)['LEVEL_FLAGS']
+        except (OSError, KeyError, SyntaxError) as e:
+            raise CatalogError(f'Cannot load {flags_path}: {e}') from e
+
+        terminal_levels = {}
+        for path in sorted(glob.glob(os.path.join(root, 'challenges', 'level*', 'level_info.json'))):
+            terminal_levels[_level_number(path)] = read_json(path)
+
+        compiler_challenges = {}
+        for path in sorted(glob.glob(os.path.join(root, 'challenges', 'bash_compiler', 'level*',
+                                                  'challenge.json'))):
+            compiler_challenges[_level_number(path)] = read_json(path)
+
+        return cls(sections, locations, level_flags, terminal_levels, compiler_challenges,
+                   version=digest.hexdigest()[:12])
+
+
+def catalog_sources(root: str):
+    yield os.path.join(root, 'config', 'hunt.json')
+    yield os.path.join(root, 'config', 'flags.py')
+    yield from glob.glob(os.path.join(root, 'challenges', 'level*', 'level_info.json'))
+    yield from glob.glob(os.path.join(root, 'challenges', 'bash_compiler', 'level*', 'challenge.json'))
+
+
+class CatalogLoader:
+    """Holds the current Catalog and reloads it when a source file's mtime changes.
+
+    Files are stat'ed at most once every `check_interval` seconds (0 turns reloading off).
+    A broken edit keeps the previous catalog in place instead of taking the site down.
+    """
+
+    def __init__(self, root: str, check_interval: float = 2.0):
+        self.root = root
+        self.check_interval = check_interval
+        self._mtimes = self._scan()
+        self._catalog = Catalog.load(root)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.listeners = []
+
+    def _scan(self) -> Dict[str, float]:
+        mtimes = {}
+        for path in catalog_sources(self.root):
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return mtimes
+
+    def get(self) -> Catalog:
+        if self.check_interval and time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload_if_changed()
+        return self._catalog
+
+    def reload_if_changed(self) -> Optional[Catalog]:
+        """Reload if any source changed. Returns the new catalog, or None if nothing changed."""
+        # Only one thread rescans, the others keep using the current catalog meanwhile
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self._checked_at = time.monotonic()
+            mtimes = self._scan()
+            if mtimes == self._mtimes:
+                return None
+            # Remember these even if loading fails, the next edit will bump them again
+            self._mtimes = mtimes
+            try:
+                catalog = Catalog.load(self.root)
+            except Exception as e:
+                log.warning('Catalog reload failed, keeping version %s: %s', self._catalog.version, e)
+                return None
+            changed = catalog.version != self._catalog.version
+            self._catalog = catalog
+        finally:
+            self._lock.release()
+        if changed:
+            for listener in self.listeners:
+                listener(catalog)
+        return catalog
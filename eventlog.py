@@ -0,0 +1,289 @@
+"""
+Append-only log of every flag and location submission, right or wrong.
+
+Each submission is a fixed-size binary record (see RECORD). Requests only put
+the record on a queue. A background thread packs whatever is queued and writes
+it with a single write() call. If the queue is full the record is dropped and
+counted; a request never waits for the disk.
+
+Every process appends to its own file in the log directory, so workers never
+interleave writes, and a crash can only truncate the last record of its own
+file. Readers skip a truncated tail.
+
+    python eventlog.py instance/events              # funnel, solve times, locations
+    python eventlog.py instance/events --json
+
+The analysis makes one pass over the files, merged by timestamp. Memory is
+bounded by the number of contestants, not the number of submissions.
+"""
+import argparse
+import glob
+import heapq
+import json
+import math
+import os
+import queue
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+MAGIC = b'QSEV\x01\x00\x00\x00'
+# timestamp, user id, level, kind, correct, location index (-1: none), latency in microseconds
+RECORD = struct.Struct('<dIHBBhI')
+KINDS = ('flag', 'location')
+
+
+class Submission(NamedTuple):
+    ts: float
+    user_id: int
+    level: int
+    kind: str
+    correct: bool
+    location: Optional[int]
+    latency: float
+
+
+class EventLog:
+    def __init__(self, directory: str, max_batch: int = 512, max_delay: float = 0.2,
+                 queue_size: int = 50000):
+        self.directory = directory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "queue.Queue[bytes]" = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        # Records accepted onto the queue that have been written or given up on
+        self._settled = 0
+
+    def record(self, user_id: int, level: int, kind: str, correct: bool,
+               location: Optional[int] = None, latency: float = 0.0):
+        """Queue one submission. `latency` is how long the request took, in seconds."""
+        packed = RECORD.pack(time.time(), user_id, level, KINDS.index(kind), bool(correct),
+                             -1 if location is None else location, min(int(latency * 1e6), 0xFFFFFFFF))
+        self.start()
+        try:
+            self._queue.put_nowait(packed)
+            self.accepted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        # A forked worker inherits the object but not the thread, so check the pid too
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._file = None
+                self._thread = threading.Thread(target=self._loop, name='event-log', daemon=True)
+                self._thread.start()
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'submissions-{int(time.time())}-{os.getpid()}.qsev')
+        self._file = open(path, 'ab', buffering=0)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def _next_batch(self) -> List[bytes]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                if self._file is None:
+                    self._open()
+                self._file.write(b''.join(batch))
+            except OSError:
+                self.dropped += len(batch)
+                self._file = None
+            else:
+                self.written += len(batch)
+                self.batches += 1
+            self._settled += len(batch)
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything queued so far is written. For shutdown and tests."""
+        target = self.accepted
+        deadline = time.monotonic() + timeout
+        while self._settled < target and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> Dict[str, int]:
+        return {'written': self.written, 'dropped': self.dropped, 'batches': self.batches,
+                'queued': self._queue.qsize()}
+
+
+def read_file(path: str) -> Iterator[Submission]:
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            # A crash can leave a partial record at the end; it is skipped
+            for fields in RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % RECORD.size]):
+                ts, user_id, level, kind, correct, location, latency_us = fields
+                yield Submission(ts, user_id, level, KINDS[kind], bool(correct),
+                                 None if location < 0 else location, latency_us / 1e6)
+            if len(chunk) < RECORD.size * 4096:
+                return
+
+
+def read_log(directory: str) -> Iterator[Submission]:
+    """Every submission in the directory, in timestamp order."""
+    files = sorted(glob.glob(os.path.join(directory, '*.qsev')))
+    return heapq.merge(*(read_file(path) for path in files), key=lambda submission: submission.ts)
+
+
+class Distribution:
+    """Log-bucketed histogram: fixed memory, percentiles within about 5%."""
+
+    BASE = 1.1
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.buckets[math.floor(math.log(max(value, 0.001), self.BASE))] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # Middle of the bucket
+                return self.BASE ** (bucket + 0.5)
+        return self.BASE ** (max(self.buckets) + 0.5)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'mean_s': self.total / self.count if self.count else 0.0,
+            'p50_s': self.percentile(50),
+            'p90_s': self.percentile(90),
+            'p99_s': self.percentile(99),
+        }
+
+
+def analyse(submissions: Iterator[Submission]) -> Dict:
+    """Funnel, solve times and attempt counts in one pass.
+
+    A level starts when the previous one's location is verified, or at the
+    user's first submission for the first level they appear on.
+    """
+    # user -> [level, started_at, flag_solved_at]
+    current: Dict[int, list] = {}
+    funnel = defaultdict(lambda: {'attempted': set(), 'flag_solved': set(), 'location_found': set()})
+    flag_time = defaultdict(Distribution)
+    location_time = defaultdict(Distribution)
+    level_time = defaultdict(Distribution)
+    flag_attempts = defaultdict(lambda: {'attempts': 0, 'wrong': 0})
+    location_attempts = defaultdict(lambda: {'attempts': 0, 'wrong': 0})
+    latency = {kind: Distribution() for kind in KINDS}
+
+    for s in submissions:
+        latency[s.kind].add(s.latency)
+        state = current.get(s.user_id)
+        if state is None or state[0] != s.level:
+            state = current[s.user_id] = [s.level, state[1] if state else s.ts, None]
+        stage = funnel[s.level]
+        stage['attempted'].add(s.user_id)
+
+        if s.kind == 'flag':
+            counts = flag_attempts[s.level]
+            counts['attempts'] += 1
+            counts['wrong'] += not s.correct
+            if s.correct and state[2] is None:
+                state[2] = s.ts
+                flag_time[s.level].add(s.ts - state[1])
+                stage['flag_solved'].add(s.user_id)
+        else:
+            counts = location_attempts[s.location]
+            counts['attempts'] += 1
+            counts['wrong'] += not s.correct
+            if s.correct:
+                location_time[s.level].add(s.ts - (state[2] or state[1]))
+                level_time[s.level].add(s.ts - state[1])
+                stage['location_found'].add(s.user_id)
+                current[s.user_id] = [s.level + 1, s.ts, None]
+
+    levels = sorted(funnel)
+    return {
+        'users': len(current),
+        'funnel': [{'level': level, **{name: len(users) for name, users in funnel[level].items()}}
+                   for level in levels],
+        'solve_time': {level: {'flag': flag_time[level].summary(),
+                               'location': location_time[level].summary(),
+                               'level': level_time[level].summary()} for level in levels},
+        'flag_attempts': {level: dict(counts) for level, counts in sorted(flag_attempts.items())},
+        'location_attempts': {location: dict(counts) for location, counts in
+                              sorted(location_attempts.items(), key=lambda item: -item[1]['attempts'])},
+        'latency': {kind: distribution.summary() for kind, distribution in latency.items()},
+    }
+
+
+def print_report(report: Dict):
+    print(f"{report['users']} contestants\n")
+    print('Funnel          attempted  flag solved  location found  drop-off')
+    previous = None
+    for row in report['funnel']:
+        # Share of the previous level's finishers who never tried this one
+        drop = f"{1 - row['attempted'] / previous:.0%}" if previous else ''
+        print(f"  level {row['level']:<7} {row['attempted']:>9} {row['flag_solved']:>12} "
+              f"{row['location_found']:>15}  {drop:>8}")
+        previous = row['location_found']
+
+    print('\nSolve time (s)      p50      p90      p99   count')
+    for level, parts in report['solve_time'].items():
+        for part, stats in parts.items():
+            print(f"  level {level:<3} {part:<8} {stats['p50_s']:>7.0f}  {stats['p90_s']:>7.0f}  "
+                  f"{stats['p99_s']:>7.0f}  {stats['count']:>6}")
+
+    print('\nFlag attempts     attempts   wrong')
+    for level, counts in report['flag_attempts'].items():
+        print(f"  level {level:<10} {counts['attempts']:>8} {counts['wrong']:>7}")
+
+    print('\nLocation attempts attempts   wrong')
+    for location, counts in report['location_attempts'].items():
+        print(f"  location {str(location):<7} {counts['attempts']:>8} {counts['wrong']:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarise the submission event log.')
+    parser.add_argument('directory', nargs='?', default=os.path.join('instance', 'events'))
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = analyse(read_log(args.directory))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Several hunts served side by side, each on its own SQLite shard.
+
+config/events.json names the events:
+
+    {
+        "north": {"hosts": ["north.hunt.example"]},
+        "south": {"root": "events/south", "env": {"LOCATION_CAPACITY": "6"}}
+    }
+
+Every event gets a separate copy of app.py, imported as its own module with
+EVENT_NAME set. That copy has its own catalog (from "root", default this
+directory), progress cache, leaderboard, scheduler, caches and database
+(instance/shards/<event>.db). Writes in one event never wait on another's lock,
+and an old event can be archived as a single file. "env" sets any other app
+setting for that event only.
+
+A request goes to the event whose "hosts" list contains its Host header. If
+none matches, a /e/<event>/... prefix selects the event (mounted like any other
+script root), and anything else goes to the "default" event if one is set.
+
+    gunicorn events:application
+    python events.py serve --port 7771
+    python events.py archive north archive/north-2024.db
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sqlite3
+import sys
+import threading
+from html import escape
+from typing import Dict, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get('EVENTS_CONFIG', os.path.join(HERE, 'config', 'events.json'))
+
+_import_lock = threading.Lock()
+
+
+def load_config(path: str = CONFIG_PATH) -> Dict[str, Dict]:
+    with open(path) as f:
+        events = json.load(f)
+    for name in events:
+        if name == 'default':
+            continue
+        if not name.replace('-', '').replace('_', '').isalnum():
+            raise ValueError(f'Event names may only use letters, digits, - and _: {name!r}')
+    return events
+
+
+def load_event_app(name: str, settings: Dict):
+    """Import a fresh copy of app.py configured for one event and return its module."""
+    env = {'EVENT_NAME': name, **{key: str(value) for key, value in settings.get('env', {}).items()}}
+    if settings.get('root'):
+        env['CATALOG_ROOT'] = os.path.join(HERE, settings['root'])
+    module_name = f'quicksnatch_event_{name}'
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(HERE, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    # app.py reads its settings from the environment while it is imported
+    with _import_lock:
+        saved = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+            module.create_tables()
+        except Exception:
+            sys.modules.pop(module_name, None)
+            raise
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+    return module
+
+
+class EventDispatcher:
+    """WSGI app that hands each request to its event's Flask app."""
+
+    def __init__(self, apps: Dict[str, object], hosts: Optional[Dict[str, str]] = None,
+                 default: Optional[str] = None):
+        self.apps = apps
+        self.hosts = hosts or {}
+        self.default = default
+
+    def __call__(self, environ, start_response):
+        host = environ.get('HTTP_HOST', '').rsplit(':', 1)[0].lower()
+        name = self.hosts.get(host)
+        if name is None:
+            path = environ.get('PATH_INFO', '')
+            parts = path.split('/', 3)
+            if len(parts) >= 3 and parts[1] == 'e' and parts[2] in self.apps:
+                name = parts[2]
+                prefix = f'/e/{name}'
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + prefix
+                environ['PATH_INFO'] = path[len(prefix):] or '/'
+            else:
+                name = self.default
+        if name is None:
+            return self.index(environ, start_response)
+        return self.apps[name](environ, start_response)
+
+    def index(self, environ, start_response):
+        root = escape(environ.get('SCRIPT_NAME', ''))
+        links = ''.join(f'<li><a href="{root}/e/{escape(name)}/">{escape(name)}</a></li>'
+                        for name in sorted(self.apps))
+        body = f'<!doctype html><title>QuickSnatch</title><h1>Choose your hunt</h1><ul>{links}</ul>'.encode()
+        start_response('404 Not Found' if environ.get('PATH_INFO', '/') != '/' else '200 OK',
+                       [('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', str(len(body)))])
+        return [body]
+
+
+def build(config: Optional[Dict[str, Dict]] = None) -> EventDispatcher:
+    config = load_config() if config is None else config
+    default = config.get('default')
+    events = {name: settings for name, settings in config.items() if name != 'default'}
+    apps, hosts = {}, {}
+    for name, settings in events.items():
+        apps[name] = load_event_app(name, settings).app
+        for host in settings.get('hosts', ()):
+            hosts[host.lower()] = name
+    return EventDispatcher(apps, hosts, default)
+
+
+def shard_path(name: str) -> str:
+    return os.path.join(HERE, 'instance', 'shards', f'{name}.db')
+
+
+def archive(name: str, destination: str):
+    """Copy an event's shard into one self-contained file, safe while the event is running."""
+    source = sqlite3.connect(shard_path(name))
+    target = sqlite3.connect(destination)
+    try:
+        # The backup API takes a consistent snapshot and folds in any WAL contents
+        source.backup(target)
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run every event with the development server')
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=7771)
+    commands.add_parser('list', help='show the configured events and their shards')
+    archiver = commands.add_parser('archive', help="copy an event's database into a single file")
+    archiver.add_argument('event')
+    archiver.add_argument('destination')
+    args = parser.parse_args(argv)
+
+    config = load_config()
+    if args.command == 'serve':
+        from werkzeug.serving import run_simple
+        run_simple(args.host, args.port, build(config), threaded=True)
+    elif args.command == 'list':
+        for name, settings in config.items():
+            if name == 'default':
+                print(f'default -> {settings}')
+                continue
+            path = shard_path(name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            print(f"{name:16s} hosts={','.join(settings.get('hosts', [])) or '-'} shard={path} ({size} bytes)")
+    else:
+        if args.event not in config or not os.path.exists(shard_path(args.event)):
+            parser.error(f'No shard for event {args.event!r}')
+        archive(args.event, args.destination)
+        print(f'Archived {args.event} to {args.destination}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+else:
+    application = build() if os.path.exists(CONFIG_PATH) else None
@@ -1,27 +1,21 @@
 import qrcode
 import os
+import io
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 import textwrap
 
-# QR code data from our app
-QR_CODES = {
-    1: "DENTAL_CLINIC_STATUE",
-    2: "TEMPLE_GARDEN_PEACE",
-    3: "SECURITY_HUT_DENTAL",
-    4: "GREEN_PATCH_SHOLAY",
-    5: "LIBRARY_FIELD_CORNER",
-    6: "MAIN_BUILDING_STATUE",
-    7: "BUS_STOP_ENTRANCE",
-    8: "PRESS_GREEN_PATCH",
-    9: "ATM_LIBRARY_FRONT",
-    10: "MAIN_CAFETERIA_2025",
-    11: "OLD_CANTEEN_PRINT",
-    12: "SWIMMING_POOL_ADYPU",
-    13: "RAINBOW_STAIRS_2025",
-    14: "LUXURY_CAFE_CORNER",
-    15: "SPORTS_PARKING_VIEW",
-    16: "RESTRICTED_GATE_25"
-}
+from catalog import Catalog
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def location_codes(root=HERE):
+    """Location number (from 0, as in the catalog and /qr/<n>.png) -> the code verify_location accepts."""
+    return {number: location['code'] for number, location in enumerate(Catalog.load(root).locations)}
+
 
 LOCATION_HINTS = {
     1: """Where laughter's crafted and teeth align,  
@@ -31,14 +25,52 @@ Behind the halls where smiles are filled.""",
     # ... Add other hints as needed
 }
 
-def generate_qr_with_label(data, location_number, output_dir="qr_codes"):
-    """Generate a QR code with a label and location number."""
+# Everything that affects how a code looks. Changing any of it re-renders every image.
+QR_STYLE = {
+    "version": 1,
+    "error_correction": "H",
+    "box_size": 10,
+    "border": 4,
+    "label_height": 100,
+    "font": "Arial.ttf",
+    "font_size": 24,
+}
+
+MANIFEST_NAME = "manifest.json"
+CONTACT_SHEET_NAME = "contact_sheet.pdf"
+
+# Loaded once per process and reused for every code that process renders
+_font = None
+
+
+def _load_font():
+    global _font
+    if _font is None:
+        try:
+            _font = ImageFont.truetype(QR_STYLE["font"], QR_STYLE["font_size"])
+        except OSError:
+            _font = ImageFont.load_default()
+    return _font
+
+
+def qr_hash(data, location_number):
+    """Content hash of a code's label, payload and style."""
+    payload = json.dumps([location_number, data, QR_STYLE], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def qr_filename(location_number):
+    return f"location_{location_number}_qr.png"
+
+
+def render_qr_with_label(data, location_number):
+    """Render a QR code with a label and location number and return the image."""
     # Create QR code instance
     qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
+        version=QR_STYLE["version"],
+        error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{QR_STYLE['error_correction']}"),
+        box_size=QR_STYLE["box_size"],
+        border=QR_STYLE["border"],
     )
     
     # Add data
@@ -52,7 +84,7 @@ def generate_qr_with_label(data, location_number, output_dir="qr_codes"):
     qr_image = qr_image.convert('RGB')
     
     # Create a new image with space for label
-    label_height = 100
+    label_height = QR_STYLE["label_height"]
     new_image = Image.new('RGB', (qr_image.size[0], qr_image.size[1] + label_height), 'white')
     
     # Paste QR code
@@ -60,12 +92,7 @@ def generate_qr_with_label(data, location_number, output_dir="qr_codes"):
     
     # Add text
     draw = ImageDraw.Draw(new_image)
-    
-    # Try to use a nice font, fallback to default if not available
-    try:
-        font = ImageFont.truetype("Arial.ttf", 24)
-    except:
-        font = ImageFont.load_default()
+    font = _load_font()
 
     # Add location number and code
     label_text = f"Location {location_number}\n{data}"
@@ -78,61 +105,158 @@ def generate_qr_with_label(data, location_number, output_dir="qr_codes"):
     
     # Draw text
     draw.text((text_x, text_y), label_text, font=font, fill="black", align="center")
-    
+    return new_image
+
+
+def render_qr_png(data, location_number):
+    """Render a labelled QR code straight to PNG bytes."""
+    buffer = io.BytesIO()
+    render_qr_with_label(data, location_number).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def generate_qr_with_label(data, location_number, output_dir="qr_codes"):
+    """Generate a QR code with a label and location number."""
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
     # Save the image
-    output_path = os.path.join(output_dir, f"location_{location_number}_qr.png")
-    new_image.save(output_path)
+    output_path = os.path.join(output_dir, qr_filename(location_number))
+    render_qr_with_label(data, location_number).save(output_path)
     return output_path
 
-def generate_all_qr_codes():
-    """Generate QR codes for all locations."""
+
+def verify_qr_code(path, expected):
+    """Decode a QR image. Returns True/False, or None if pyzbar is not installed."""
+    try:
+        from pyzbar.pyzbar import decode
+    except ImportError:
+        return None
+    decoded = decode(Image.open(path))
+    return bool(decoded) and decoded[0].data.decode('utf-8') == expected
+
+
+def _build_qr_job(job):
+    """Render and verify one code. Runs in a pool worker."""
+    location_number, data, output_dir = job
+    path = generate_qr_with_label(data, location_number, output_dir)
+    return location_number, path, verify_qr_code(path, data)
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_contact_sheet(paths, output_path, columns=2, rows=3, dpi=150):
+    """Lay the codes out on A4 pages and save them as one printable multi-page PDF."""
+    page_size = (int(8.27 * dpi), int(11.69 * dpi))
+    margin = dpi // 2
+    cell_w = (page_size[0] - 2 * margin) // columns
+    cell_h = (page_size[1] - 2 * margin) // rows
+    per_page = columns * rows
+
+    pages = []
+    for start in range(0, len(paths), per_page):
+        page = Image.new('RGB', page_size, 'white')
+        for i, path in enumerate(paths[start:start + per_page]):
+            with Image.open(path) as img:
+                img = img.convert('RGB')
+                img.thumbnail((cell_w - 20, cell_h - 20))
+                x = margin + (i % columns) * cell_w + (cell_w - img.size[0]) // 2
+                y = margin + (i // columns) * cell_h + (cell_h - img.size[1]) // 2
+                page.paste(img, (x, y))
+        pages.append(page)
+
+    if pages:
+        pages[0].save(output_path, save_all=True, append_images=pages[1:], resolution=dpi)
+    return output_path
+
+
+def generate_all_qr_codes(output_dir="qr_codes", workers=None, force=False, codes=None):
+    """Generate QR codes for all locations, skipping images whose content hasn't changed."""
     print("Generating QR codes...")
-    generated_files = []
-    
-    for location_number, qr_data in QR_CODES.items():
-        output_path = generate_qr_with_label(qr_data, location_number)
-        generated_files.append(output_path)
-        print(f"Generated QR code for Location {location_number}: {output_path}")
-    
-    print(f"\nGenerated {len(generated_files)} QR codes successfully!")
+    codes = location_codes() if codes is None else codes
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+    hashes = {number: qr_hash(data, number) for number, data in codes.items()}
+
+    jobs = []
+    for location_number, qr_data in codes.items():
+        filename = qr_filename(location_number)
+        up_to_date = (manifest.get(filename) == hashes[location_number]
+                      and os.path.exists(os.path.join(output_dir, filename)))
+        if force or not up_to_date:
+            jobs.append((location_number, qr_data, output_dir))
+        else:
+            print(f"Unchanged QR code for Location {location_number}, skipping")
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_load_font) as pool:
+            for location_number, output_path, verified in pool.map(_build_qr_job, jobs):
+                manifest[qr_filename(location_number)] = hashes[location_number]
+                status = {True: "verified", False: "FAILED VERIFICATION", None: "not verified"}[verified]
+                print(f"Generated QR code for Location {location_number}: {output_path} ({status})")
+
+        with open(os.path.join(output_dir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    sheet_path = os.path.join(output_dir, CONTACT_SHEET_NAME)
+    if jobs or not os.path.exists(sheet_path):
+        paths = [os.path.join(output_dir, qr_filename(number)) for number in sorted(codes)]
+        build_contact_sheet(paths, sheet_path)
+        print(f"Wrote printable contact sheet: {sheet_path}")
+
+    print(f"\nGenerated {len(jobs)} QR codes, {len(codes) - len(jobs)} unchanged.")
     print("You can find the QR codes in the 'qr_codes' directory.")
 
-def test_qr_code_reading():
+def _check_qr_job(job):
+    location_number, qr_data, qr_path = job
+    if not os.path.exists(qr_path):
+        return location_number, qr_data, "missing", None
+    decoded = None
+    from pyzbar.pyzbar import decode
+    result = decode(Image.open(qr_path))
+    if result:
+        decoded = result[0].data.decode('utf-8')
+    return location_number, qr_data, "ok", decoded
+
+def test_qr_code_reading(output_dir="qr_codes", workers=None, codes=None):
     """Test if generated QR codes can be read correctly."""
     try:
-        from pyzbar.pyzbar import decode
-        print("\nTesting QR code readability...")
-        
-        for location_number, qr_data in QR_CODES.items():
-            qr_path = f"qr_codes/location_{location_number}_qr.png"
-            if os.path.exists(qr_path):
-                img = Image.open(qr_path)
-                decoded = decode(img)
-                if decoded:
-                    result = decoded[0].data.decode('utf-8')
-                    if result == qr_data:
-                        print(f"✓ Location {location_number}: QR code reads correctly")
-                    else:
-                        print(f"✗ Location {location_number}: QR code mismatch!")
-                        print(f"  Expected: {qr_data}")
-                        print(f"  Got: {result}")
-                else:
-                    print(f"✗ Location {location_number}: Could not decode QR code!")
-            else:
-                print(f"✗ Location {location_number}: QR code file not found!")
+        import pyzbar.pyzbar  # noqa: F401
     except ImportError:
         print("\nNote: Install 'pyzbar' package to test QR code reading:")
         print("pip install pyzbar")
+        return
+
+    print("\nTesting QR code readability...")
+    codes = location_codes() if codes is None else codes
+    jobs = [(number, data, os.path.join(output_dir, qr_filename(number))) for number, data in codes.items()]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for location_number, qr_data, status, result in pool.map(_check_qr_job, jobs):
+            if status == "missing":
+                print(f"✗ Location {location_number}: QR code file not found!")
+            elif result is None:
+                print(f"✗ Location {location_number}: Could not decode QR code!")
+            elif result == qr_data:
+                print(f"✓ Location {location_number}: QR code reads correctly")
+            else:
+                print(f"✗ Location {location_number}: QR code mismatch!")
+                print(f"  Expected: {qr_data}")
+                print(f"  Got: {result}")
 
 if __name__ == "__main__":
+    codes = location_codes()
+
     # Generate all QR codes
-    generate_all_qr_codes()
+    generate_all_qr_codes(codes=codes)
     
-    # Test QR code reading (if pyzbar is installed)
-    test_qr_code_reading()
+    # Freshly rendered codes are verified during generation, this re-checks every file
+    test_qr_code_reading(codes=codes)
     
     print("\nInstructions for use:")
     print("1. Print these QR codes in high quality")
@@ -140,5 +264,5 @@ if __name__ == "__main__":
     print("3. Place each QR code at its corresponding location")
     print("4. Test scanning with multiple devices to ensure readability")
     print("\nQR Code Locations and Their Codes:")
-    for location, code in QR_CODES.items():
+    for location, code in codes.items():
         print(f"Location {location:2d}: {code}")
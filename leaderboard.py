@@ -0,0 +1,121 @@
+"""
+In-memory ranked leaderboard.
+
+Users are kept in a list sorted by (level desc, submission time asc, id), so a
+rank lookup is a bisect and an update only moves one entry. Each worker rebuilds
+the board from the database when it gets older than `max_age` seconds, which
+picks up results recorded by other workers.
+
+`on_change`, if set, is called with every entry that was added or moved, both
+for local updates and for changes found while rebuilding.
+"""
+import hashlib
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class LeaderboardEntry(NamedTuple):
+    user_id: int
+    username: str
+    current_level: int
+    last_correct_submission: Optional[str]
+    last_correct_submission_serialized: int
+
+
+def _sort_key(entry: LeaderboardEntry) -> Tuple[int, int, int]:
+    return (-(entry.current_level or 0), entry.last_correct_submission_serialized or 0, entry.user_id)
+
+
+class RankedLeaderboard:
+    def __init__(self, max_age: float = 5.0,
+                 on_change: Optional[Callable[[LeaderboardEntry], None]] = None):
+        self.max_age = max_age
+        self.on_change = on_change
+        self._keys: List[Tuple[int, int, int]] = []
+        self._entries: Dict[int, LeaderboardEntry] = {}
+        self._total_levels = 0
+        self._etag: Optional[str] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+
+    def load(self, rows):
+        """Replace the board with `rows` of (id, username, level, last, serialized)."""
+        entries = {row[0]: LeaderboardEntry(*row) for row in rows}
+        keys = sorted(_sort_key(entry) for entry in entries.values())
+        changed = []
+        with self._lock:
+            if entries != self._entries:
+                # Nothing to announce on the very first load
+                if self._loaded_at is not None:
+                    changed = [entry for user_id, entry in entries.items()
+                               if self._entries.get(user_id) != entry]
+                self._entries = entries
+                self._keys = keys
+                self._total_levels = sum(entry.current_level or 0 for entry in entries.values())
+                self._etag = None
+            self._loaded_at = time.monotonic()
+        if self.on_change is not None:
+            for entry in changed:
+                self.on_change(entry)
+
+    def update(self, user_id, username, current_level, last_correct_submission,
+               last_correct_submission_serialized):
+        """Insert or move a single user."""
+        entry = LeaderboardEntry(user_id, username, current_level, last_correct_submission,
+                                 last_correct_submission_serialized)
+        with self._lock:
+            old = self._entries.get(user_id)
+            if old == entry:
+                return
+            if old is not None:
+                index = bisect_left(self._keys, _sort_key(old))
+                del self._keys[index]
+                self._total_levels -= old.current_level or 0
+            insort(self._keys, _sort_key(entry))
+            self._entries[user_id] = entry
+            self._total_levels += current_level or 0
+            self._etag = None
+        if self.on_change is not None:
+            self.on_change(entry)
+
+    def top(self, offset: int = 0, limit: int = 50) -> List[Tuple[int, LeaderboardEntry]]:
+        """Return (rank, entry) pairs for ranks offset+1 .. offset+limit."""
+        with self._lock:
+            keys = self._keys[offset:offset + limit]
+            return [(offset + i + 1, self._entries[key[2]]) for i, key in enumerate(keys)]
+
+    def rank(self, user_id) -> Optional[int]:
+        """1-based rank of a user, or None if they are not on the board."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return bisect_left(self._keys, _sort_key(entry)) + 1
+
+    def get(self, user_id) -> Optional[LeaderboardEntry]:
+        return self._entries.get(user_id)
+
+    @property
+    def total_users(self) -> int:
+        return len(self._keys)
+
+    @property
+    def total_levels(self) -> int:
+        return self._total_levels
+
+    @property
+    def etag(self) -> str:
+        """Content hash of the board, identical on every worker holding the same data."""
+        with self._lock:
+            if self._etag is None:
+                digest = hashlib.blake2b(digest_size=12)
+                for key in self._keys:
+                    entry = self._entries[key[2]]
+                    digest.update(repr(entry).encode('utf-8'))
+                self._etag = digest.hexdigest()
+            return self._etag
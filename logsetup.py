@@ -0,0 +1,108 @@
+"""
+Structured, sampled logging that never blocks a request.
+
+Records are put on an in-memory queue by a QueueHandler and written out by a
+QueueListener thread, so a slow terminal or disk doesn't slow requests down.
+Each record is one JSON line. Keyword arguments given to the logger returned by
+get_logger() become fields on that line:
+
+    log = get_logger('quicksnatch.app')
+    log.debug('level view', user=3, level=2)
+
+DEBUG records are sampled (1 in 1/sample_rate is kept); INFO and above are
+always written.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import Optional
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.sample_rate
+
+
+class StructuredFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            'ts': round(record.created, 3),
+            'severity': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        line.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            line['exc'] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+class StructuredLogger:
+    """Logger whose keyword arguments become structured fields."""
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def _log(self, levelno: int, msg: str, fields: dict, exc_info=None):
+        if self.logger.isEnabledFor(levelno):
+            self.logger.log(levelno, msg, exc_info=exc_info, extra={'fields': fields}, stacklevel=3)
+
+    def debug(self, msg: str, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg: str, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg: str, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg: str, **fields):
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(name))
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(logger_name: str = 'quicksnatch', level: int = logging.INFO,
+                  sample_rate: float = 0.01, stream=None) -> logging.handlers.QueueListener:
+    """Route `logger_name` and its children through a background queue. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    records: "queue.Queue" = queue.Queue(-1)
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter())
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+
+    queue_handler = logging.handlers.QueueHandler(records)
+    # Sample before enqueueing so dropped records cost next to nothing
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    logger = logging.getLogger(logger_name)
+    logger.setLevel(level)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records. Registered with atexit by the app."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,144 @@
+"""
+Bulk contestant management for organisers.
+
+    python manage_users.py import teams.csv            # columns: username,password
+    python manage_users.py import teams.jsonl --workers 8
+    python manage_users.py export standings.csv        # '-' writes to stdout
+
+Import reads the file as a stream and handles it in batches. For each batch
+it asks once which usernames already exist, hashes the rest in a process
+pool, and inserts them in one transaction. Duplicates that slip through (the
+same name twice in a file, or someone registering meanwhile) are dropped by
+the unique index on username, not by a query per row.
+
+Export streams the standings in leaderboard order without loading the table.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from passwords import hash_password
+
+
+def read_users(stream, fmt: str) -> Iterator[Dict[str, str]]:
+    rows = csv.DictReader(stream) if fmt == 'csv' else (json.loads(line) for line in stream if line.strip())
+    for row in rows:
+        username = str(row.get('username') or '').strip()
+        password = str(row.get('password') or '')
+        yield {'username': username, 'password': password}
+
+
+def batches(items: Iterable, size: int) -> Iterator[List]:
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_ignoring_duplicates(table, dialect: str):
+    """INSERT that skips rows clashing with a unique index."""
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing(index_elements=['username'])
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing(index_elements=['username'])
+    return table.insert().prefix_with('IGNORE')
+
+
+def import_users(A, stream, fmt: str, workers: int, batch_size: int, rounds: int) -> Dict[str, int]:
+    table = A.User.__table__
+    counts = {'read': 0, 'invalid': 0, 'existing': 0, 'inserted': 0, 'duplicates': 0}
+    hash_one = partial(hash_password, rounds=rounds)
+    # spawn: the pool must not fork a copy of the app's threads and connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool, \
+            A.app.app_context():
+        engine = A.db.engine
+        insert = insert_ignoring_duplicates(table, engine.dialect.name)
+        for batch in batches(read_users(stream, fmt), batch_size):
+            counts['read'] += len(batch)
+            valid = [row for row in batch if row['username'] and row['password']]
+            counts['invalid'] += len(batch) - len(valid)
+
+            # One lookup per batch so re-runs don't spend bcrypt time on people already imported
+            with engine.connect() as conn:
+                existing = set(conn.execute(table.select().with_only_columns(table.c.username).where(
+                    table.c.username.in_([row['username'] for row in valid]))).scalars())
+            fresh = [row for row in valid if row['username'] not in existing]
+            counts['existing'] += len(valid) - len(fresh)
+            if not fresh:
+                continue
+
+            hashes = pool.map(hash_one, [row['password'] for row in fresh],
+                              chunksize=max(1, len(fresh) // (workers * 4)))
+            values = [{'username': row['username'], 'password': hashed} for row, hashed in zip(fresh, hashes)]
+            with engine.begin() as conn:
+                inserted = conn.execute(insert, values).rowcount
+            counts['inserted'] += inserted
+            counts['duplicates'] += len(values) - inserted
+            print(json.dumps(counts), file=sys.stderr)
+    return counts
+
+
+def export_standings(A, stream, batch_size: int) -> int:
+    User = A.User
+    writer = csv.writer(stream)
+    writer.writerow(['rank', 'username', 'current_level', 'last_correct_submission'])
+    rows = 0
+    with A.app.app_context():
+        query = A.db.select(User.username, User.current_level, User.last_correct_submission).order_by(
+            User.current_level.desc(), User.last_correct_submission_serialized.asc(), User.id.asc())
+        # yield_per streams rows from the cursor in chunks instead of fetching them all
+        for rows, (username, level, last_correct) in enumerate(
+                A.db.session.execute(query.execution_options(yield_per=batch_size)), 1):
+            writer.writerow([rows, username, level, last_correct or ''])
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help='create users from a CSV or JSONL file')
+    importer.add_argument('path', help="input file, '-' for stdin")
+    importer.add_argument('--format', choices=('csv', 'jsonl'), default=None,
+                          help='default: from the file extension, csv for stdin')
+    importer.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='hashing processes')
+    importer.add_argument('--batch', type=int, default=500, help='users per transaction')
+    importer.add_argument('--rounds', type=int, default=None, help='bcrypt cost (default: BCRYPT_ROUNDS)')
+
+    exporter = commands.add_parser('export', help='write the standings as CSV')
+    exporter.add_argument('path', help="output file, '-' for stdout")
+    exporter.add_argument('--batch', type=int, default=1000, help='rows fetched at a time')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+    A.create_tables()
+
+    if args.command == 'import':
+        fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        rounds = args.rounds or A.app.config['BCRYPT_ROUNDS']
+        stream = sys.stdin if args.path == '-' else open(args.path, newline='', encoding='utf-8')
+        with stream:
+            counts = import_users(A, stream, fmt, max(1, args.workers), max(1, args.batch), rounds)
+        print(json.dumps(counts))
+    else:
+        stream = sys.stdout if args.path == '-' else open(args.path, 'w', newline='', encoding='utf-8')
+        with stream:
+            rows = export_standings(A, stream, max(1, args.batch))
+        print(f'Exported {rows} users', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
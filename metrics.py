@@ -0,0 +1,210 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are plain locked dicts keyed by label values; gauges are
+callbacks evaluated at scrape time, so things like cache sizes or bcrypt timings
+never need to be pushed. `instrument_app` adds per-endpoint request latency and
+per-request SQL query count/time (through SQLAlchemy cursor events).
+
+Each worker process keeps its own numbers; scrape every worker, or run a single
+worker per port, to see the whole picture.
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f'{self.name}{_labels(self.label_names, label_values)} {_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, label_values)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.label_names, label_values)} {count}'
+
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a dict of {label value tuple: number} when
+    the gauge has labels.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label_names = tuple(labels)
+
+    def samples(self) -> Iterable[str]:
+        value = self.read()
+        if not self.label_names:
+            yield f'{self.name} {_number(value)}'
+            return
+        for label_values, item in sorted(value.items()):
+            yield f'{self.name}{_labels(self.label_names, label_values)} {_number(item)}'
+
+
+class Registry:
+    def __init__(self, prefix: str = 'quicksnatch_'):
+        self.prefix = prefix
+        self._metrics: List = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help, read, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                # One broken callback shouldn't hide every other metric
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+class ActiveUsers:
+    """Distinct users seen within the last `window` seconds."""
+
+    def __init__(self, window: float = 300.0):
+        self.window = window
+        self._seen: Dict = {}
+        self._lock = threading.Lock()
+
+    def touch(self, user_id):
+        with self._lock:
+            self._seen[user_id] = time.monotonic()
+
+    def count(self) -> int:
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            for user_id in [u for u, seen in self._seen.items() if seen < cutoff]:
+                del self._seen[user_id]
+            return len(self._seen)
+
+
+def instrument_app(app: Flask, registry: Registry, engine: Engine):
+    """Time every request and count the SQL run on `engine`, the app's own. Returns the created metrics."""
+    request_seconds = registry.histogram('request_duration_seconds', 'Time spent handling a request',
+                                         ('endpoint', 'method', 'status'))
+    request_queries = registry.histogram('request_db_queries', 'SQL statements run per request',
+                                         ('endpoint',), buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+    query_seconds = registry.counter('db_query_seconds_total', 'Time spent in SQL statements',
+                                     ('endpoint',))
+    queries = registry.counter('db_queries_total', 'SQL statements run', ('endpoint',))
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        endpoint = request.endpoint if has_request_context() else None
+        queries.inc(endpoint or 'none')
+        query_seconds.inc(endpoint or 'none', amount=elapsed)
+        if has_request_context():
+            g.db_queries = g.get('db_queries', 0) + 1
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            endpoint = request.endpoint or 'unknown'
+            request_seconds.observe(time.perf_counter() - started, endpoint, request.method,
+                                    str(response.status_code))
+            request_queries.observe(g.get('db_queries', 0), endpoint)
+        return response
+
+    return request_seconds, request_queries
@@ -0,0 +1,87 @@
+"""
+Cache for rendered page fragments.
+
+Level, hint and landing pages render the same HTML for everyone who sees them,
+but they sit on top of base.html, which shows the signed-in user and their
+flashed messages. So only the page's own blocks (styles, content, scripts) are
+cached. base.html is still rendered per request around them by
+templates/cached_page.html.
+
+Fragments are rendered from the template's blocks with only the variables the
+caller passes in. Context processors are skipped, so current_user and the
+session can't end up in a shared fragment by accident. Callers put everything
+the output depends on (usually the catalog version plus their inputs) in `key`.
+The app also clears the cache whenever the catalog reloads.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from jinja2 import Environment, nodes
+from markupsafe import Markup
+
+PAGE_BLOCKS = ('styles', 'content', 'scripts')
+
+
+class FragmentCache:
+    def __init__(self, env: Environment, max_entries: int = 1024,
+                 blocks: Tuple[str, ...] = PAGE_BLOCKS):
+        self.env = env
+        self.max_entries = max_entries
+        self.blocks = blocks
+        self._entries: "OrderedDict[Hashable, Dict[str, Markup]]" = OrderedDict()
+        self._parents: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _parent(self, name: str) -> Optional[str]:
+        """Name of the template `name` extends, if it's a constant."""
+        if name not in self._parents:
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            extends = self.env.parse(source).find(nodes.Extends)
+            self._parents[name] = (extends.template.value
+                                   if extends is not None and isinstance(extends.template, nodes.Const)
+                                   else None)
+        return self._parents[name]
+
+    def render_blocks(self, template_name: str, **context) -> Dict[str, Markup]:
+        """Render the page blocks of a template without its base layout."""
+        template = self.env.get_template(template_name)
+        ctx = template.new_context(context)
+        # Do what {% extends %} does at runtime so inherited blocks resolve, child first
+        name = template_name
+        while True:
+            name = self._parent(name)
+            if name is None:
+                break
+            for block, render in self.env.get_template(name).blocks.items():
+                ctx.blocks.setdefault(block, []).append(render)
+        return {block: Markup(''.join(ctx.blocks[block][0](ctx))) if block in ctx.blocks else Markup('')
+                for block in self.blocks}
+
+    def get(self, template_name: str, key: Hashable, **context) -> Dict[str, Markup]:
+        """Return the cached fragments for (template_name, key), rendering on a miss."""
+        cache_key = (template_name, key)
+        with self._lock:
+            fragments = self._entries.get(cache_key)
+            if fragments is not None:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return fragments
+            self.misses += 1
+
+        fragments = self.render_blocks(template_name, **context)
+        with self._lock:
+            self._entries[cache_key] = fragments
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragments
+
+    def clear(self, *_):
+        """Drop every fragment. Accepts and ignores listener arguments."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
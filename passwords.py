@@ -0,0 +1,105 @@
+"""
+Password hashing on a bounded worker pool.
+
+bcrypt is deliberately slow, and running it on the request thread lets a burst
+of logins starve every other route. Hashing and checking run on a fixed-size
+thread pool instead (bcrypt releases the GIL while it works). Once too many jobs
+are queued, callers get PasswordPoolBusy instead of piling up behind it.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict, Union
+
+import bcrypt
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing queue is full or a job waited too long."""
+
+
+def _as_bytes(value: Union[str, bytes]) -> bytes:
+    return value if isinstance(value, bytes) else value.encode('utf-8')
+
+
+def hash_password(password: str, rounds: int = 12) -> bytes:
+    """Hash a password on the calling thread. Also usable from process pools."""
+    return bcrypt.hashpw(_as_bytes(password), bcrypt.gensalt(rounds))
+
+
+def hash_cost(hashed: Union[str, bytes]) -> int:
+    """Cost factor stored in a bcrypt hash such as b'$2b$12$...'."""
+    return int(_as_bytes(hashed).split(b'$')[2])
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 64,
+                 timeout: float = 10.0, sample_size: int = 1024):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # Running plus queued jobs, anything beyond this is rejected straight away
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._timings: Dict[str, deque] = {
+            'hash': deque(maxlen=sample_size),
+            'verify': deque(maxlen=sample_size),
+            'wait': deque(maxlen=sample_size),
+        }
+        self._counts = {'hash': 0, 'verify': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def _record(self, name, seconds):
+        with self._lock:
+            self._timings[name].append(seconds)
+
+    def _run(self, name, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts['rejected'] += 1
+            raise PasswordPoolBusy('Password queue is full')
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            self._record('wait', started - submitted)
+            try:
+                return func(*args)
+            finally:
+                self._record(name, time.perf_counter() - started)
+                self._slots.release()
+
+        future = self._executor.submit(job)
+        with self._lock:
+            self._counts[name] += 1
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise PasswordPoolBusy('Password check timed out')
+
+    def hash(self, password: str) -> bytes:
+        return self._run('hash', hash_password, password, self.rounds)
+
+    def verify(self, password: str, hashed: Union[str, bytes]) -> bool:
+        return self._run('verify', bcrypt.checkpw, _as_bytes(password), _as_bytes(hashed))
+
+    def needs_rehash(self, hashed: Union[str, bytes]) -> bool:
+        """True if a hash was made with a different cost than the configured one."""
+        try:
+            return hash_cost(hashed) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self) -> Dict[str, float]:
+        """Counts plus p50/p99 seconds for hashing, checking and queue wait."""
+        with self._lock:
+            stats = {f'{name}_count': count for name, count in self._counts.items()}
+            timings = {name: sorted(values) for name, values in self._timings.items()}
+        for name, values in timings.items():
+            for pct in (50, 99):
+                stats[f'{name}_p{pct}'] = values[min(len(values) - 1, len(values) * pct // 100)] if values else 0.0
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,232 @@
+"""
+Opt-in profiling of single requests.
+
+A request is profiled when an admin sends an `X-Profile` header, or when it is
+picked by the sampling rate. The header value lists the modes, e.g.
+`X-Profile: cpu,memory`:
+
+* cpu: cProfile of the request thread, kept as a .prof file (snakeviz,
+  pstats) plus the top functions by cumulative time;
+* stack: samples the request thread's stack every few milliseconds, in the
+  folded format flamegraph tools read. It has far less overhead than cpu;
+* memory: a tracemalloc snapshot with the lines that allocated most. tracemalloc
+  traces the whole process, so only one request at a time gets it.
+
+Reports go to a directory that keeps the newest `keep` of them. Requests that
+aren't profiled pay for one header lookup and, with sampling on, one random().
+"""
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, FrozenSet, List, Optional
+
+from flask import g, request
+
+MODES = ('cpu', 'stack', 'memory')
+HEADER = 'X-Profile'
+
+
+class StackSampler:
+    """Counts one thread's call stacks, sampled from another thread."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005, max_depth: int = 64):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Reports on disk, newest first, with old ones deleted past `keep`."""
+
+    def __init__(self, directory: str, keep: int = 200):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def save(self, report: Dict, files: Dict[str, bytes]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        # Sorts by time, which is what rotation relies on
+        profile_id = (f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}"
+                      f"-{os.getpid()}-{random.getrandbits(24):06x}")
+        report = {**report, 'id': profile_id, 'files': sorted(files)}
+        for suffix, content in files.items():
+            with open(os.path.join(self.directory, f'{profile_id}.{suffix}'), 'wb') as f:
+                f.write(content)
+        # The .json goes last: a report is only listed once all its files exist
+        with open(os.path.join(self.directory, f'{profile_id}.json'), 'w') as f:
+            json.dump(report, f)
+        self._rotate()
+        return profile_id
+
+    def _rotate(self):
+        with self._lock:
+            for profile_id in self.ids()[self.keep:]:
+                for name in os.listdir(self.directory):
+                    if name.startswith(profile_id + '.'):
+                        try:
+                            os.remove(os.path.join(self.directory, name))
+                        except OSError:
+                            pass
+
+    def ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+    def list(self, limit: int = 200) -> List[Dict]:
+        reports = []
+        for profile_id in self.ids()[:limit]:
+            report = self.get(profile_id)
+            if report is not None:
+                reports.append(report)
+        return reports
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        if not self._valid(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f'{profile_id}.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, profile_id: str, suffix: str) -> Optional[str]:
+        path = os.path.join(self.directory, f'{profile_id}.{suffix}')
+        return path if self._valid(profile_id) and suffix.isalnum() and os.path.exists(path) else None
+
+    @staticmethod
+    def _valid(profile_id: str) -> bool:
+        return bool(profile_id) and all(c.isalnum() or c == '-' for c in profile_id)
+
+
+class RequestProfiler:
+    def __init__(self, store: ProfileStore, sample_rate: float = 0.0,
+                 sample_modes: FrozenSet[str] = frozenset({'stack'}),
+                 routes: FrozenSet[str] = frozenset(), top: int = 40):
+        """`routes` limits sampling to these endpoints (all when empty); the header works anywhere."""
+        self.store = store
+        self.sample_rate = sample_rate
+        self.sample_modes = sample_modes
+        self.routes = routes
+        self.top = top
+        self._memory_lock = threading.Lock()
+
+    def modes_for_request(self, is_admin: Callable[[], bool]) -> FrozenSet[str]:
+        header = request.headers.get(HEADER)
+        if header is not None:
+            if not is_admin():
+                return frozenset()
+            modes = frozenset(mode.strip() for mode in header.lower().split(',')) & frozenset(MODES)
+            return modes or frozenset({'cpu'})
+        if self.sample_rate and random.random() < self.sample_rate and \
+                (not self.routes or request.endpoint in self.routes):
+            return self.sample_modes
+        return frozenset()
+
+    def start(self, modes: FrozenSet[str]) -> Dict:
+        state = {'modes': modes, 'started': time.perf_counter()}
+        if 'memory' in modes and self._memory_lock.acquire(blocking=False):
+            tracemalloc.start(16)
+            state['memory'] = True
+        if 'stack' in modes:
+            state['sampler'] = StackSampler(threading.get_ident())
+            state['sampler'].start()
+        if 'cpu' in modes:
+            state['cpu'] = cProfile.Profile()
+            state['cpu'].enable()
+        return state
+
+    def finish(self, state: Dict, status: int) -> Optional[str]:
+        duration = time.perf_counter() - state['started']
+        files: Dict[str, bytes] = {}
+        report = {
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'status': status,
+            'duration_ms': round(duration * 1000, 3),
+            'ts': time.time(),
+            'modes': sorted(state['modes']),
+        }
+        if 'cpu' in state:
+            profile = state['cpu']
+            profile.disable()
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(self.top)
+            report['cpu'] = text.getvalue()
+            profile.create_stats()
+            files['prof'] = marshal.dumps(profile.stats)
+        if 'sampler' in state:
+            sampler = state['sampler']
+            sampler.stop()
+            report['stack_samples'] = sum(sampler.stacks.values())
+            files['folded'] = sampler.folded().encode('utf-8')
+        if state.get('memory'):
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                self._memory_lock.release()
+            report['memory'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [{'where': str(stat.traceback[0]), 'size_bytes': stat.size, 'count': stat.count}
+                        for stat in snapshot.statistics('lineno')[:self.top]],
+            }
+        elif 'memory' in state['modes']:
+            report['memory'] = {'skipped': 'another request was tracing memory'}
+        return self.store.save(report, files)
+
+
+def install_profiler(app, profiler: RequestProfiler, is_admin: Callable[[], bool]):
+    """Hook the profiler into `app`. Register it early so it covers the other hooks."""
+
+    @app.before_request
+    def start_profile():
+        modes = profiler.modes_for_request(is_admin)
+        if modes:
+            g.profile_state = profiler.start(modes)
+
+    @app.after_request
+    def finish_profile(response):
+        state = g.pop('profile_state', None)
+        if state is not None:
+            response.headers['X-Profile-Id'] = profiler.finish(state, response.status_code)
+        return response
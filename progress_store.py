@@ -0,0 +1,252 @@
+"""
+Pluggable storage for per-user hunt progress.
+
+Every worker keeps a small read-through cache in front of a shared backend, and
+changed entries are written back at the end of the request. That way any worker
+can pick a contestant up where another one left off, and a restart no longer
+wipes everyone's place.
+
+Write-backs only carry the fields a worker changed, and each field is only
+written if the store still holds the value the worker started from. A worker
+with an older copy can't undo what another worker wrote in the meantime: when
+both changed the same field, the one that got to the store first wins.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import select
+
+
+def merge_changes(current: Dict[str, Any], base: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+    """`current` with the fields changed from `base` to `state`, where `current` still has the `base` value."""
+    merged = dict(current)
+    for key, value in state.items():
+        if base.get(key) != value and current.get(key) == base.get(key):
+            merged[key] = value
+    return merged
+
+
+class ProgressStore:
+    """Base class for progress backends. States are JSON-serialisable dicts."""
+
+    def load(self, user_id) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def add(self, user_id, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a new user's state. Returns the stored state, which is another worker's if it added one first."""
+        raise NotImplementedError
+
+    def update(self, user_id, base: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the changes from `base` to `state` (see merge_changes). Returns the stored state."""
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+
+class MemoryProgressStore(ProgressStore):
+    """Local key-value stand-in. Only shared between threads of one process."""
+
+    def __init__(self):
+        self._data: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        with self._lock:
+            raw = self._data.get(str(user_id))
+        return json.loads(raw) if raw is not None else None
+
+    def add(self, user_id, state):
+        # Keep serialised copies so callers can never alias stored state
+        with self._lock:
+            raw = self._data.setdefault(str(user_id), json.dumps(state))
+        return json.loads(raw)
+
+    def update(self, user_id, base, state):
+        with self._lock:
+            raw = self._data.get(str(user_id))
+            merged = merge_changes(json.loads(raw) if raw is not None else base, base, state)
+            self._data[str(user_id)] = json.dumps(merged)
+        return merged
+
+    def delete(self, user_id):
+        with self._lock:
+            self._data.pop(str(user_id), None)
+
+
+class SQLAlchemyProgressStore(ProgressStore):
+    """Stores progress as JSON in a table with `user_id`, `state` and `updated_at` columns.
+
+    Writes run in their own transaction, never the request's session, so they
+    don't commit anything else a view left pending. With a `writer` (see
+    sqlite_tuning.GroupCommitWriter) they are committed by the writer thread.
+    An update only replaces the exact row text it read, and reads again if
+    another worker got in between.
+    """
+
+    def __init__(self, db, model, writer=None):
+        self.db = db
+        self.model = model
+        self.table = model.__table__
+        self.writer = writer
+
+    def load(self, user_id):
+        raw = self.db.session.execute(select(self.table.c.state).where(self.table.c.user_id == user_id)).scalar()
+        return json.loads(raw) if raw is not None else None
+
+    def _write(self, job):
+        if self.writer is not None:
+            return self.writer.run(job)
+        with self.db.engine.begin() as conn:
+            return job(conn)
+
+    def add(self, user_id, state):
+        table = self.table
+
+        def job(conn):
+            raw = conn.execute(select(table.c.state).where(table.c.user_id == user_id)).scalar()
+            if raw is not None:
+                return json.loads(raw)
+            conn.execute(table.insert().values(user_id=user_id, state=json.dumps(state), updated_at=time.time()))
+            return state
+        return self._write(job)
+
+    def update(self, user_id, base, state):
+        table = self.table
+
+        def job(conn):
+            while True:
+                raw = conn.execute(select(table.c.state).where(table.c.user_id == user_id)).scalar()
+                if raw is None:
+                    conn.execute(table.insert().values(user_id=user_id, state=json.dumps(state),
+                                                       updated_at=time.time()))
+                    return state
+                current = json.loads(raw)
+                merged = merge_changes(current, base, state)
+                if merged == current:
+                    return current
+                result = conn.execute(table.update()
+                                      .where(table.c.user_id == user_id, table.c.state == raw)
+                                      .values(state=json.dumps(merged), updated_at=time.time()))
+                if result.rowcount:
+                    return merged
+        return self._write(job)
+
+    def delete(self, user_id):
+        table = self.table
+        self._write(lambda conn: conn.execute(table.delete().where(table.c.user_id == user_id)))
+
+
+class ProgressCache:
+    """Per-worker read-through/write-back cache in front of a ProgressStore.
+
+    `create(user_id)` builds the state of a user the store hasn't seen yet, and
+    `from_state` may return None for a state it can't read (such as an older format).
+    Entries younger than `ttl` seconds are served from memory; older ones are
+    re-read from the store so that changes made by other workers show up.
+    `sync` writes back only the fields that changed since the entry was loaded
+    (see ProgressStore.update); if another worker changed one of them first, the
+    entry takes the stored value.
+    With `idle_timeout`, entries nobody has asked for in that many seconds are
+    dropped (after saving any unsynced change) so memory follows active users.
+    """
+
+    def __init__(self, store: ProgressStore, create: Callable[[Any], Any],
+                 from_state: Callable[[Dict[str, Any]], Any],
+                 to_state: Callable[[Any], Dict[str, Any]],
+                 ttl: float = 1.0, max_entries: int = 10000,
+                 idle_timeout: Optional[float] = None):
+        self.store = store
+        self.create = create
+        self.from_state = from_state
+        self.to_state = to_state
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.idle_timeout = idle_timeout
+        # user_id -> [progress, loaded_at, snapshot of state when loaded/saved, last used]
+        self._entries: "OrderedDict[Any, list]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._swept_at = time.monotonic()
+
+    def get(self, user_id):
+        """Return the progress object for a user, loading or creating it."""
+        now = time.monotonic()
+        if self.idle_timeout and now - self._swept_at >= min(60.0, self.idle_timeout):
+            self.evict_idle()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                entry[3] = now
+                return entry[0]
+
+        state = self.store.load(user_id)
+        progress = self.from_state(state) if state is not None else None
+        if progress is None:
+            progress = self.create(user_id)
+            created = self.to_state(progress)
+            state = self.store.add(user_id, created) if state is None else self.store.update(user_id, state, created)
+            if state != created:
+                # Another worker set this user up first
+                progress = self.from_state(state) or progress
+
+        with self._lock:
+            self._entries[user_id] = [progress, now, state, now]
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return progress
+
+    def sync(self, user_id) -> bool:
+        """Write an entry's changes back to the store. Returns True if it had any."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return False
+            progress, _, snapshot, _ = entry
+            state = self.to_state(progress)
+            if state == snapshot:
+                return False
+        stored = self.store.update(user_id, snapshot, state)
+        with self._lock:
+            entry[1] = time.monotonic()
+            entry[2] = stored
+            if stored != state:
+                # Some of these fields were changed by another worker first; take its values
+                entry[0] = self.from_state(stored) or progress
+        return True
+
+    def evict_idle(self) -> int:
+        """Drop entries unused for `idle_timeout` seconds. Returns how many were dropped."""
+        now = time.monotonic()
+        self._swept_at = now
+        cutoff = now - self.idle_timeout
+        idle = []
+        with self._lock:
+            # Entries are kept in least-recently-used order, so stop at the first recent one
+            for user_id, entry in self._entries.items():
+                if entry[3] >= cutoff:
+                    break
+                idle.append(user_id)
+        for user_id in idle:
+            self.sync(user_id)
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry[3] < cutoff:
+                    del self._entries[user_id]
+        return len(idle)
+
+    def discard(self, user_id):
+        """Drop the cached copy so the next `get` re-reads the store."""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def items(self):
+        with self._lock:
+            return [(user_id, entry[0]) for user_id, entry in self._entries.items()]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,92 @@
+"""
+Cheap in-memory admission control for submission endpoints.
+
+Token buckets are refilled lazily when a key is looked at, so admitting or
+rejecting a request is O(1) and never touches the database. Bucket tables are
+bounded LRUs, which keeps a flood of spoofed keys from growing memory forever.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float, burst: int, max_keys: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, last refill time]
+        self._buckets: "OrderedDict[object, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key) -> float:
+        """Take a token for `key`. Returns 0 if allowed, else seconds until one is free."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [float(self.burst), now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+    def refund(self, key):
+        """Give back a token taken by `acquire` for a request that was turned away anyway."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + 1)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    def try_acquire(self) -> bool:
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+
+class AdmissionController:
+    """Per-user and per-IP token buckets plus a cap on in-flight requests for one route."""
+
+    def __init__(self, user_rate: float, user_burst: int, ip_rate: float, ip_burst: int,
+                 concurrency: int):
+        self.users = TokenBucketLimiter(user_rate, user_burst)
+        self.ips = TokenBucketLimiter(ip_rate, ip_burst)
+        self.in_flight = ConcurrencyLimiter(concurrency)
+
+    def admit(self, user_key, ip) -> Tuple[Optional[int], float]:
+        """Return (None, 0) if admitted, else (HTTP status, seconds to wait).
+
+        An admitted caller must call `done()` once the request finishes.
+        """
+        wait = self.users.acquire(user_key)
+        if wait:
+            return 429, wait
+        # A rejection by a later check doesn't cost the caller the tokens already taken
+        wait = self.ips.acquire(ip)
+        if wait:
+            self.users.refund(user_key)
+            return 429, wait
+        if not self.in_flight.try_acquire():
+            self.users.refund(user_key)
+            self.ips.refund(ip)
+            return 503, 1.0
+        return None, 0.0
+
+    def done(self):
+        self.in_flight.release()
@@ -1,5 +1,7 @@
 import random
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+
+from progress_store import MemoryProgressStore, ProgressCache, ProgressStore
 
 # Database of riddles with their answers and hints
 RIDDLES: List[Dict[str, str]] = [
@@ -80,32 +82,79 @@ RIDDLES: List[Dict[str, str]] = [
     }
 ]
 
+def normalize_answer(answer: str) -> str:
+    """Case-fold and collapse whitespace so 'Key  Board ' matches 'key board'."""
+    return ' '.join(answer.casefold().split())
+
+
+# Normalized once here instead of on every check
+ANSWERS: Tuple[str, ...] = tuple(normalize_answer(r['answer']) for r in RIDDLES)
+ALL_USED = (1 << len(RIDDLES)) - 1
+
+
+class RiddleState:
+    """A user's riddle progress: a bitmask of used riddle indices plus the current one."""
+
+    __slots__ = ('used', 'current', 'level')
+
+    def __init__(self, used: int = 0, current: int = -1, level: int = 0):
+        self.used = used
+        self.current = current
+        self.level = level
+
+    def to_state(self) -> Dict[str, int]:
+        return {'used': self.used, 'current': self.current, 'level': self.level}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, int]) -> 'RiddleState':
+        return cls(state.get('used', 0), state.get('current', -1), state.get('level', 0))
+
+
+def pick_unused(used: int, rng=random) -> int:
+    """Pick a random riddle index whose bit is not set in `used` (which must not be full)."""
+    # Random probes find a free slot in O(1) expected time while most riddles are unused
+    for _ in range(8):
+        index = rng.randrange(len(RIDDLES))
+        if not used >> index & 1:
+            return index
+    free = [index for index in range(len(RIDDLES)) if not used >> index & 1]
+    return rng.choice(free)
+
+
 class RiddleManager:
-    def __init__(self):
-        self.user_riddles: Dict[str, Dict] = {}  # Maps user_id to their current riddle
-        
+    """Hands out riddles without repeats per user.
+
+    State lives in a ProgressStore (in memory unless the app plugs in the database
+    one with `use_store`) behind a ProgressCache, so any worker can pick up a user
+    and idle users don't stay in memory.
+    """
+
+    def __init__(self, store: Optional[ProgressStore] = None, ttl: float = 1.0,
+                 max_entries: int = 10000, idle_timeout: float = 1800.0):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._idle_timeout = idle_timeout
+        self.use_store(store or MemoryProgressStore())
+
+    def use_store(self, store: ProgressStore):
+        self.states = ProgressCache(store, lambda user_id: RiddleState(), RiddleState.from_state,
+                                    RiddleState.to_state,
+                                    ttl=self._ttl, max_entries=self._max_entries,
+                                    idle_timeout=self._idle_timeout)
+
     def assign_riddle(self, user_id: str, level: int) -> Dict[str, str]:
         """Assign a random riddle to a user for a specific level."""
-        # Get riddles not yet used by this user
-        used_riddles = self.user_riddles.get(user_id, {}).get('used_riddles', set())
-        available_riddles = [r for i, r in enumerate(RIDDLES) if i not in used_riddles]
-        
+        state = self.states.get(user_id)
         # If all riddles used, reset the used riddles
-        if not available_riddles:
-            used_riddles = set()
-            available_riddles = RIDDLES
-        
-        # Select a random riddle
-        riddle = random.choice(available_riddles)
-        riddle_index = RIDDLES.index(riddle)
-        
-        # Store the riddle for this user
-        self.user_riddles[user_id] = {
-            'current_riddle': riddle,
-            'level': level,
-            'used_riddles': used_riddles | {riddle_index}
-        }
-        
+        if state.used & ALL_USED == ALL_USED:
+            state.used = 0
+        index = pick_unused(state.used)
+        state.used |= 1 << index
+        state.current = index
+        state.level = level
+        self.states.sync(user_id)
+
+        riddle = RIDDLES[index]
         return {
             'riddle': riddle['riddle'],
             'hint': riddle['hint']
@@ -113,24 +162,23 @@ class RiddleManager:
     
     def check_answer(self, user_id: str, answer: str) -> bool:
         """Check if the provided answer matches the user's current riddle."""
-        if user_id not in self.user_riddles:
+        state = self.states.get(user_id)
+        if state.current < 0:
             return False
-            
-        current_riddle = self.user_riddles[user_id]['current_riddle']
-        return answer.lower().strip() == current_riddle['answer'].lower()
+        return normalize_answer(answer) == ANSWERS[state.current]
     
     def get_hint(self, user_id: str) -> str:
         """Get the hint for the user's current riddle."""
-        if user_id not in self.user_riddles:
+        state = self.states.get(user_id)
+        if state.current < 0:
             return "No riddle assigned"
-            
-        return self.user_riddles[user_id]['current_riddle']['hint']
+        return RIDDLES[state.current]['hint']
     
     def clear_riddle(self, user_id: str):
         """Clear the current riddle for a user (called after level completion)."""
-        if user_id in self.user_riddles:
-            used_riddles = self.user_riddles[user_id].get('used_riddles', set())
-            self.user_riddles[user_id] = {'used_riddles': used_riddles}
+        state = self.states.get(user_id)
+        state.current = -1
+        self.states.sync(user_id)
 
 # Create a global instance of the riddle manager
 riddle_manager = RiddleManager()
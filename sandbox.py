@@ -0,0 +1,362 @@
+"""
+Pre-forked, resource-limited executor pool for the bash_compiler challenges.
+
+A fixed set of worker processes is started once (through a forkserver, so they
+don't inherit the web server's threads) and reused for every job. For each job a
+worker copies the challenge directory into a fresh temp dir and runs one command
+in its own session with rlimits, a wall-clock timeout and an output cap. Jobs
+wait in a bounded queue; when it is full, submit() raises SandboxBusy instead
+of letting a burst of contestants pile up on the box.
+
+Each command also runs in its own user, mount, network and PID namespaces.
+Its root is a fresh tmpfs holding read-only binds of the system directories
+(/usr, /lib, ...) and its copy of the challenge at /work, so nothing else on
+the server (the app, its config, other jobs) is reachable, whatever paths it
+is given. It sees only its own processes in /proc and has no network. When
+the server runs as root, the job additionally drops to an unprivileged uid
+(`run_as`, default nobody). The PID namespace comes from util-linux
+`unshare`; without it the pool refuses to run anything unless isolation is
+switched off. Callers still restrict what may be run (see
+SandboxPool.check_command).
+"""
+import ctypes
+import multiprocessing
+import os
+import pwd
+import queue
+import resource
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Mapping, Optional
+
+# Interpreters, debuggers and privileged tools that could run arbitrary code or touch the host,
+# and anything that inspects other processes, the kernel or the network
+DEFAULT_DENIED_COMMANDS = frozenset({
+    'awk', 'sed', 'gdb', 'strace', 'ltrace', 'ptrace', 'ftrace', 'dd', 'patch', 'hexedit',
+    'insmod', 'rmmod', 'modprobe', 'tcpdump', 'wireshark', 'python', 'python3', 'perl', 'sh',
+    'bash', 'dash', 'zsh', 'env', 'xargs', 'nice', 'timeout', 'sudo', 'su', 'chroot',
+    'unshare', 'nsenter', 'setpriv', 'mount', 'umount',
+    'ps', 'top', 'htop', 'pgrep', 'pkill', 'kill', 'killall', 'pstree', 'lsof', 'fuser',
+    'printenv', 'netstat', 'ss', 'ip', 'ifconfig', 'nc', 'ncat', 'curl', 'wget',
+    'dmesg', 'lsmod', 'sysctl', 'journalctl',
+})
+
+# Run inside the confined root: a new PID namespace with its own /proc
+UNSHARE_ARGS = ('--pid', '--fork', '--kill-child', '--mount-proc', '--')
+
+# What a job's root contains besides /work, bound read-only from the host when present
+SYSTEM_DIRS = ('usr', 'bin', 'sbin', 'lib', 'lib32', 'lib64', 'libx32')
+SYSTEM_FILES = ('etc/ld.so.cache', 'dev/null', 'dev/zero', 'dev/urandom')
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC = 1, 2, 4, 8
+MS_REMOUNT, MS_BIND, MS_REC, MS_PRIVATE = 32, 4096, 16384, 1 << 18
+PR_SET_DUMPABLE = 4
+# statvfs flags that a bind mount in a user namespace must keep when remounted
+ST_LOCKED = {os.ST_NODEV: MS_NODEV, os.ST_NOEXEC: MS_NOEXEC, os.ST_NOATIME: 1024,
+             os.ST_NODIRATIME: 2048, os.ST_RELATIME: 1 << 21}
+
+
+class SandboxBusy(Exception):
+    """Raised when the job queue is full."""
+
+
+class SandboxError(Exception):
+    """Raised when a command is not allowed. The message is safe to show."""
+
+
+def _libc_call(name: str, *args):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if getattr(libc, name)(*args) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f'{name}: {os.strerror(errno)}')
+
+
+def _mount(source: Optional[str], target: str, fstype: Optional[str], flags: int, data: Optional[str] = None):
+    encode = lambda value: value.encode() if value is not None else None
+    _libc_call('mount', encode(source), encode(target), encode(fstype), ctypes.c_ulong(flags), encode(data))
+
+
+def _bind_readonly(source: str, target: str):
+    _mount(source, target, None, MS_BIND | MS_REC)
+    locked = os.statvfs(source).f_flag
+    flags = MS_BIND | MS_REMOUNT | MS_RDONLY | MS_NOSUID
+    for st_flag, ms_flag in ST_LOCKED.items():
+        if locked & st_flag:
+            flags |= ms_flag
+    _mount(None, target, None, flags)
+
+
+def _confine(root: str, workdir: str):
+    """Move the calling process into new user, mount and network namespaces, chrooted into `root`.
+
+    `root` is an empty directory; it gets a tmpfs with the system directories and `workdir` at /work.
+    Runs in the job's child process, after any uid change and before exec.
+    """
+    uid, gid = os.getuid(), os.getgid()
+    # Switching uid cleared the dumpable flag, which leaves /proc/self/*_map owned by root
+    _libc_call('prctl', PR_SET_DUMPABLE, 1, 0, 0, 0)
+    _libc_call('unshare', CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWNET)
+    with open('/proc/self/setgroups', 'w') as f:
+        f.write('deny')
+    with open('/proc/self/uid_map', 'w') as f:
+        f.write(f'0 {uid} 1')
+    with open('/proc/self/gid_map', 'w') as f:
+        f.write(f'0 {gid} 1')
+    _mount(None, '/', None, MS_REC | MS_PRIVATE)
+    _mount('tmpfs', root, 'tmpfs', MS_NOSUID | MS_NODEV, 'size=1m,mode=755')
+    for name in SYSTEM_DIRS:
+        source = '/' + name
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), os.path.join(root, name))
+        elif os.path.isdir(source):
+            os.mkdir(os.path.join(root, name))
+            _bind_readonly(source, os.path.join(root, name))
+    for name in SYSTEM_FILES:
+        source = '/' + name
+        if os.path.exists(source):
+            target = os.path.join(root, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            open(target, 'w').close()
+            _bind_readonly(source, target)
+    for name in ('proc', 'work', 'tmp'):
+        os.mkdir(os.path.join(root, name))
+    os.chmod(os.path.join(root, 'tmp'), 0o1777)
+    _mount(workdir, os.path.join(root, 'work'), None, MS_BIND)
+    os.chroot(root)
+    os.chdir('/work')
+
+
+def _set_limits(cpu_seconds: int, memory_bytes: int, file_bytes: int, max_processes: Optional[int],
+                uid: Optional[int] = None, gid: Optional[int] = None, confine_to: Optional[str] = None):
+    def apply():
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_bytes, file_bytes))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        if max_processes is not None:
+            resource.setrlimit(resource.RLIMIT_NPROC, (max_processes, max_processes))
+        if uid is not None:
+            os.setgroups([])
+            os.setgid(gid)
+            os.setuid(uid)
+        if confine_to is not None:
+            _confine(os.path.join(confine_to, 'root'), os.path.join(confine_to, 'work'))
+    return apply
+
+
+def run_job(job: Mapping) -> Dict:
+    """Run a single job in a throwaway directory. Executed inside a pool worker."""
+    jobdir = tempfile.mkdtemp(prefix='qs-sandbox-')
+    # work/ holds the job's files; root/ is where a confined job's filesystem gets mounted
+    workdir = os.path.join(jobdir, 'work')
+    started = time.monotonic()
+    try:
+        os.mkdir(workdir)
+        os.mkdir(os.path.join(jobdir, 'root'))
+        for name, content in job.get('files', {}).items():
+            with open(os.path.join(workdir, os.path.basename(name)), 'w') as f:
+                f.write(content)
+        # Files shipped in the challenge directory take precedence over the inline copies
+        if job.get('source_dir'):
+            shutil.copytree(job['source_dir'], workdir, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns(*job.get('exclude', ())))
+        uid, gid = job.get('uid'), job.get('gid')
+        if uid is not None:
+            # The unprivileged user needs to own its copy of the challenge
+            for parent, dirs, names in os.walk(jobdir):
+                for name in [parent] + [os.path.join(parent, entry) for entry in dirs + names]:
+                    os.lchown(name, uid, gid)
+
+        argv = job['argv']
+        confined = bool(job.get('unshare'))
+        if confined:
+            argv = [job['unshare'], *UNSHARE_ARGS, *argv]
+        proc = subprocess.Popen(
+            argv, cwd=workdir, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, start_new_session=True,
+            env={'PATH': '/usr/local/bin:/usr/bin:/bin', 'HOME': '/work' if confined else workdir,
+                 'LANG': 'C.UTF-8'},
+            preexec_fn=_set_limits(job['cpu_seconds'], job['memory_bytes'], job['file_bytes'],
+                                   job.get('max_processes'), uid, gid, jobdir if confined else None),
+        )
+        deadline = started + job['timeout']
+        limit = job['output_limit']
+        chunks: List[bytes] = []
+        size = 0
+        timed_out = truncated = False
+        fd = proc.stdout.fileno()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > limit:
+                truncated = True
+                break
+        if timed_out or truncated:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        proc.stdout.close()
+        exit_code = proc.wait()
+        return {
+            'exit_code': exit_code,
+            'output': b''.join(chunks)[:limit].decode('utf-8', 'replace'),
+            'timed_out': timed_out,
+            'truncated': truncated,
+            'duration': time.monotonic() - started,
+        }
+    except (OSError, subprocess.SubprocessError) as e:
+        return {'exit_code': 127, 'output': str(e), 'timed_out': False, 'truncated': False,
+                'duration': time.monotonic() - started}
+    finally:
+        shutil.rmtree(jobdir, ignore_errors=True)
+
+
+def _worker_main(conn):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        conn.send(run_job(job))
+
+
+class SandboxPool:
+    def __init__(self, workers: int = 2, queue_size: int = 32, timeout: float = 5.0,
+                 output_limit: int = 64 * 1024, cpu_seconds: int = 2,
+                 memory_bytes: int = 256 * 1024 * 1024, file_bytes: int = 8 * 1024 * 1024,
+                 max_processes: Optional[int] = None,
+                 denied_commands: Iterable[str] = DEFAULT_DENIED_COMMANDS,
+                 isolate: bool = True, run_as: Optional[str] = 'nobody'):
+        """`isolate=False` runs commands without namespaces, for development machines only."""
+        self.workers = workers
+        self.timeout = timeout
+        self.limits = {
+            'timeout': timeout,
+            'output_limit': output_limit,
+            'cpu_seconds': cpu_seconds,
+            'memory_bytes': memory_bytes,
+            'file_bytes': file_bytes,
+            'max_processes': max_processes,
+        }
+        self.denied_commands = frozenset(denied_commands)
+        self.isolate = isolate
+        if isolate:
+            self.limits['unshare'] = shutil.which('unshare')
+        # Only root can switch to another uid; otherwise the user namespace is the boundary
+        if run_as and os.geteuid() == 0:
+            user = pwd.getpwnam(run_as)
+            self.limits['uid'], self.limits['gid'] = user.pw_uid, user.pw_gid
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._context = multiprocessing.get_context('forkserver')
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the workers. Called automatically by the first submit()."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._dispatch, name=f'sandbox-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _spawn(self):
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child,), daemon=True)
+        process.start()
+        child.close()
+        return process, parent
+
+    def _dispatch(self):
+        # Each dispatcher thread owns one warm worker and replaces it if it dies or hangs
+        process = conn = None
+        while True:
+            if process is None or not process.is_alive():
+                try:
+                    process, conn = self._spawn()
+                except Exception as e:
+                    process = None
+                    job, future = self._queue.get()
+                    if future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+                    time.sleep(1)
+                    continue
+            job, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                conn.send(job)
+                if conn.poll(job['timeout'] + 5):
+                    future.set_result(conn.recv())
+                    continue
+            except (EOFError, OSError):
+                pass
+            process.kill()
+            process.join()
+            process = None
+            future.set_result({'exit_code': -1, 'output': 'Sandbox worker stopped responding',
+                               'timed_out': True, 'truncated': False, 'duration': job['timeout']})
+
+    def check_command(self, argv: List[str], allowed: Iterable[str], scripts: Iterable[str]):
+        """Raise SandboxError unless argv is an allowed tool or one of the challenge's scripts."""
+        if not argv:
+            raise SandboxError('No command given')
+        if self.isolate and not self.limits['unshare']:
+            raise SandboxError('The sandbox is not available on this server')
+        for arg in argv[1:]:
+            # Keep file arguments inside the job's directory. Options get no paths at all, since
+            # they can carry one glued on (-f/etc/x, --file=x/y), and @file reads arguments from a file
+            if arg.startswith(('/', '~', '@')) or '..' in arg.split('/') or '=/' in arg or \
+                    (arg.startswith('-') and '/' in arg):
+                raise SandboxError(f'{argv[0]}: only files in the challenge directory can be used')
+        scripts = set(scripts)
+        name = argv[0]
+        if name.startswith('./') and name[2:] in scripts and len(argv) == 1:
+            argv[:] = ['bash', name[2:]]
+            return
+        if name == 'bash' and len(argv) == 2 and argv[1] in scripts:
+            return
+        if name not in set(allowed) or name in self.denied_commands:
+            raise SandboxError(f'{name}: command not available in this challenge')
+        if shutil.which(name) is None:
+            raise SandboxError(f'{name}: command not installed on this server')
+
+    def submit(self, argv: List[str], source_dir: Optional[str] = None,
+               files: Optional[Mapping[str, str]] = None, exclude: Iterable[str] = ()) -> Future:
+        self.start()
+        future: Future = Future()
+        job = dict(self.limits, argv=list(argv), source_dir=source_dir, files=dict(files or {}),
+                   exclude=list(exclude))
+        try:
+            self._queue.put_nowait((job, future))
+        except queue.Full:
+            raise SandboxBusy('Too many jobs queued')
+        return future
+
+    def run(self, argv: List[str], source_dir: Optional[str] = None,
+            files: Optional[Mapping[str, str]] = None, exclude: Iterable[str] = ()) -> Dict:
+        """Submit a job and wait for its result."""
+        return self.submit(argv, source_dir, files, exclude).result()
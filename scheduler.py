@@ -0,0 +1,254 @@
+"""
+Location assignment for the physical part of the hunt.
+
+When a contestant moves on, a scheduler picks their next checkpoint from the
+locations they haven't visited yet. It also tracks how many contestants are
+currently heading to each checkpoint; an assignment counts until the contestant
+verifies it (release) or it goes stale.
+
+* SeededScheduler keeps each contestant's seeded order as is.
+* RandomScheduler picks uniformly, the original behaviour.
+* LeastLoadedScheduler picks the checkpoint with the fewest contestants on
+  the way, preferring ones under their capacity and breaking ties randomly.
+  Loads live in a heap with lazy deletion, so each update is O(log k).
+
+Loads are tracked per worker process, so with several workers each one balances
+its own share of contestants.
+
+`python scheduler.py` runs an offline discrete-event simulation of a hunt and
+compares completion times across strategies.
+"""
+import argparse
+import heapq
+import json
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class Scheduler:
+    def __init__(self, capacity: int = 10, capacities: Optional[Dict[int, int]] = None,
+                 stale_after: float = 3600.0, rng: Optional[random.Random] = None):
+        """`capacities` overrides `capacity` per location. Only LeastLoadedScheduler uses them."""
+        self.capacity = capacity
+        self.capacities = dict(capacities or {})
+        self.stale_after = stale_after
+        self.rng = rng or random.Random()
+        self._loads: Dict[int, int] = {}
+        # user_id -> (location, assigned_at)
+        self._assignments: Dict[object, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._expired_at = time.monotonic()
+
+    def _pick(self, remaining: Sequence[int]) -> int:
+        raise NotImplementedError
+
+    def _set_load(self, location: int, load: int):
+        self._loads[location] = load
+
+    def choose(self, user_id, remaining: Sequence[int], now: Optional[float] = None) -> int:
+        """Pick a location for `user_id` out of `remaining` and count them as heading there."""
+        now = time.monotonic() if now is None else now
+        if now - self._expired_at >= min(60.0, self.stale_after):
+            self._expired_at = now
+            self.expire(now)
+        with self._lock:
+            self._release(user_id)
+            location = self._pick(remaining)
+            self._assignments[user_id] = (location, now)
+            self._set_load(location, self._loads.get(location, 0) + 1)
+        return location
+
+    def _release(self, user_id):
+        assignment = self._assignments.pop(user_id, None)
+        if assignment is not None:
+            location = assignment[0]
+            self._set_load(location, self._loads.get(location, 1) - 1)
+
+    def release(self, user_id):
+        """The contestant reached their location, or left the hunt."""
+        with self._lock:
+            self._release(user_id)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Forget assignments older than `stale_after` seconds (contestants who wandered off)."""
+        cutoff = (time.monotonic() if now is None else now) - self.stale_after
+        with self._lock:
+            stale = [user_id for user_id, (_, at) in self._assignments.items() if at < cutoff]
+            for user_id in stale:
+                self._release(user_id)
+        return len(stale)
+
+    def loads(self) -> Dict[int, int]:
+        with self._lock:
+            return {location: load for location, load in self._loads.items() if load}
+
+
+class SeededScheduler(Scheduler):
+    """Keeps the contestant's own seeded order."""
+
+    def _pick(self, remaining):
+        return remaining[0]
+
+
+class RandomScheduler(Scheduler):
+    def _pick(self, remaining):
+        return self.rng.choice(remaining)
+
+
+class LeastLoadedScheduler(Scheduler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # (load, random tie-break, location); stale entries are skipped when popped
+        self._heap: List[Tuple[int, float, int]] = []
+
+    def _set_load(self, location, load):
+        super()._set_load(location, load)
+        heapq.heappush(self._heap, (load, self.rng.random(), location))
+
+    def _pick(self, remaining):
+        candidates = set(remaining)
+        # Locations nobody has been sent to yet have load 0 and may not be in the heap
+        idle = [location for location in remaining if not self._loads.get(location)]
+        if idle:
+            return self.rng.choice(idle)
+
+        popped = []
+        chosen = fallback = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            load, _, location = entry
+            if self._loads.get(location, 0) != load:
+                continue
+            popped.append(entry)
+            if location not in candidates:
+                continue
+            if load < self.capacities.get(location, self.capacity):
+                chosen = location
+                break
+            if fallback is None:
+                # Everything left is full; the least-loaded one takes the overflow
+                fallback = location
+        for entry in popped:
+            heapq.heappush(self._heap, entry)
+        if len(self._heap) > 4 * max(len(self._loads), 16):
+            self._compact()
+        if chosen is not None:
+            return chosen
+        return fallback if fallback is not None else self.rng.choice(remaining)
+
+    def _compact(self):
+        self._heap = [(load, self.rng.random(), location) for location, load in self._loads.items()]
+        heapq.heapify(self._heap)
+
+
+STRATEGIES = {
+    'seeded': SeededScheduler,
+    'random': RandomScheduler,
+    'least_loaded': LeastLoadedScheduler,
+}
+
+
+def make_scheduler(name: str, **kwargs) -> Scheduler:
+    if name not in STRATEGIES:
+        raise ValueError(f'Unknown scheduler {name!r}, expected one of {", ".join(STRATEGIES)}')
+    return STRATEGIES[name](**kwargs)
+
+
+def simulate(strategy: str, contestants: int = 100, locations: int = 16, levels: int = 5,
+             solve_time: float = 300.0, walk_time: Tuple[float, float] = (60.0, 240.0),
+             scan_time: float = 20.0, scanners: int = 2, capacity: int = 4,
+             start_spread: float = 60.0, seed: int = 1) -> Dict:
+    """Simulate a hunt and return completion-time statistics in seconds.
+
+    As in the app, a contestant is assigned the checkpoint when they start a level
+    and counts towards its load until they have scanned it. They then solve the
+    level (exponential, mean `solve_time`), walk there, queue for one of
+    `scanners` spots and scan for `scan_time` seconds, so crowded checkpoints
+    cost queueing time.
+    """
+    rng = random.Random(seed)
+    scheduler = make_scheduler(strategy, capacity=capacity, rng=random.Random(seed + 1),
+                               stale_after=float('inf'))
+    orders = []
+    for _ in range(contestants):
+        order = list(range(locations))
+        rng.shuffle(order)
+        orders.append(order)
+    visited: List[List[int]] = [[] for _ in range(contestants)]
+    target = [0] * contestants
+    started = [rng.uniform(0, start_spread) for _ in range(contestants)]
+    finished = [0.0] * contestants
+    # Per checkpoint: times at which each scanner becomes free
+    free_at = {location: [0.0] * scanners for location in range(locations)}
+    waits = []
+    longest_queue = 0
+
+    # (time, sequence, kind, contestant); the sequence keeps ties in push order
+    events = [(started[c], c, 'start', c) for c in range(contestants)]
+    heapq.heapify(events)
+    sequence = contestants
+    while events:
+        now, _, kind, c = heapq.heappop(events)
+        if kind == 'start':
+            remaining = [location for location in orders[c] if location not in visited[c]] or orders[c]
+            target[c] = scheduler.choose(c, remaining, now=now)
+            visited[c].append(target[c])
+            at = now + rng.expovariate(1 / solve_time) + rng.uniform(*walk_time)
+            kind = 'arrive'
+        elif kind == 'arrive':
+            slots = free_at[target[c]]
+            slot = min(range(scanners), key=slots.__getitem__)
+            begin = max(now, slots[slot])
+            waits.append(begin - now)
+            longest_queue = max(longest_queue, int((begin - now) // scan_time) + 1 if begin > now else 0)
+            slots[slot] = at = begin + scan_time
+            kind = 'done'
+        else:
+            scheduler.release(c)
+            if len(visited[c]) >= levels:
+                finished[c] = now - started[c]
+                continue
+            at, kind = now, 'start'
+        sequence += 1
+        heapq.heappush(events, (at, sequence, kind, c))
+
+    finished.sort()
+    waits.sort()
+    return {
+        'strategy': strategy,
+        'mean_completion_s': sum(finished) / len(finished),
+        'p95_completion_s': finished[int(0.95 * (len(finished) - 1))],
+        'max_completion_s': finished[-1],
+        'mean_queue_wait_s': sum(waits) / len(waits),
+        'p95_queue_wait_s': waits[int(0.95 * (len(waits) - 1))],
+        'longest_queue': longest_queue,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare location scheduling strategies offline.')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES))
+    parser.add_argument('--contestants', type=int, default=100)
+    parser.add_argument('--locations', type=int, default=16)
+    parser.add_argument('--levels', type=int, default=5)
+    parser.add_argument('--solve-time', type=float, default=300.0, help='mean seconds to solve a level')
+    parser.add_argument('--walk-time', type=float, nargs=2, default=(60.0, 240.0), metavar=('MIN', 'MAX'))
+    parser.add_argument('--scan-time', type=float, default=20.0, help='seconds spent at a checkpoint')
+    parser.add_argument('--scanners', type=int, default=2, help='contestants a checkpoint serves at once')
+    parser.add_argument('--capacity', type=int, default=4, help='least_loaded: contestants per checkpoint')
+    parser.add_argument('--start-spread', type=float, default=60.0, help='seconds over which people start')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    results = [simulate(name, contestants=args.contestants, locations=args.locations, levels=args.levels,
+                        solve_time=args.solve_time, walk_time=tuple(args.walk_time),
+                        scan_time=args.scan_time, scanners=args.scanners, capacity=args.capacity,
+                        start_spread=args.start_spread, seed=args.seed)
+               for name in args.strategies.split(',')]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Opt-in SQLite settings for many simultaneous contestants.
+
+By default SQLite uses a rollback journal: a writer locks out readers, and a
+second writer gives up with "database is locked" almost at once. In tuned mode:
+
+* every pooled connection is switched to WAL (readers never block the writer),
+  waits up to busy_timeout for a lock instead of failing, uses
+  synchronous=NORMAL (safe with WAL, one fsync per checkpoint instead of per
+  commit) and gets a bigger page cache;
+* hot writes go through GroupCommitWriter, a single thread with its own
+  connection. It takes whatever writes are queued and commits them together, so
+  a burst of N submissions costs one transaction instead of N competing ones.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, event
+
+
+def engine_options(busy_timeout_ms: int = 5000, pool_size: int = 8) -> Dict[str, Any]:
+    """SQLALCHEMY_ENGINE_OPTIONS for a file-backed SQLite database."""
+    return {
+        'pool_size': pool_size,
+        'max_overflow': pool_size,
+        'connect_args': {
+            'timeout': busy_timeout_ms / 1000,
+            # Pooled connections move between request threads
+            'check_same_thread': False,
+        },
+    }
+
+
+def apply_pragmas(engine, busy_timeout_ms: int = 5000, cache_size_kb: int = 20000,
+                  synchronous: str = 'NORMAL'):
+    """Set the tuning pragmas on every new connection the engine opens."""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        # Negative means KiB rather than pages
+        cursor.execute(f'PRAGMA cache_size=-{int(cache_size_kb)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+
+def writer_engine(url, busy_timeout_ms: int = 5000, cache_size_kb: int = 20000):
+    """A one-connection engine for GroupCommitWriter.
+
+    The writer must not share the request pool. Requests hold their pooled
+    connection while they wait for the writer, so under load the writer would
+    wait for a connection that is never released.
+    """
+    engine = create_engine(url, pool_size=1, max_overflow=0,
+                           connect_args={'timeout': busy_timeout_ms / 1000, 'check_same_thread': False})
+    apply_pragmas(engine, busy_timeout_ms, cache_size_kb)
+    return engine
+
+
+class WriterBusy(Exception):
+    """Raised when the write queue is full."""
+
+
+class GroupCommitWriter:
+    """Runs write jobs on one thread, committing each batch of queued jobs together.
+
+    `engine` should be dedicated to the writer, see writer_engine(). A job is a
+    callable taking a SQLAlchemy Connection. It must only write to the
+    database, because if a batch fails its jobs are retried one by one, each in its
+    own transaction, so one bad job can't fail the others.
+    """
+
+    def __init__(self, engine, max_batch: int = 64, max_delay: float = 0.002,
+                 queue_size: int = 10000, timeout: float = 10.0):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue: "queue.Queue[Tuple[Callable, Future]]" = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.jobs = 0
+        self.retried = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='sqlite-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, job: Callable) -> Future:
+        self.start()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((job, future))
+        except queue.Full:
+            raise WriterBusy('Too many writes queued')
+        return future
+
+    def run(self, job: Callable):
+        """Queue a job and wait until its batch is committed. Returns the job's result."""
+        return self.submit(job).result(timeout=self.timeout)
+
+    def _next_batch(self) -> List[Tuple[Callable, Future]]:
+        batch = [self._queue.get()]
+        # Give writers arriving in the same instant a moment to join this commit
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                with self.engine.begin() as conn:
+                    results = [job(conn) for job, _ in batch]
+            except Exception:
+                self.retried += len(batch)
+                for job, future in batch:
+                    try:
+                        with self.engine.begin() as conn:
+                            result = job(conn)
+                    except Exception as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self.batches += 1
+            self.jobs += len(batch)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'batches': self.batches,
+            'jobs': self.jobs,
+            'retried': self.retried,
+            'queued': self._queue.qsize(),
+            'mean_batch': self.jobs / self.batches if self.batches else 0.0,
+        }
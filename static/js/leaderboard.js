@@ -0,0 +1,147 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const body = document.getElementById('leaderboard-body');
+    const pageSize = parseInt(body.dataset.pageSize, 10) || 100;
+    const PODIUM = {
+        1: '<i class="fas fa-crown"></i><div class="crown-glow"></div>',
+        2: '<i class="fas fa-medal"></i><div class="silver-glow"></div>',
+        3: '<i class="fas fa-award"></i><div class="bronze-glow"></div>',
+    };
+
+    // Add row highlight animation for updates
+    function highlightRow(row) {
+        row.classList.add('highlight');
+        setTimeout(() => row.classList.remove('highlight'), 2000);
+    }
+
+    function findRow(username) {
+        return body.querySelector(`tr[data-user="${CSS.escape(username)}"]`);
+    }
+
+    function setRank(row, rank) {
+        const cell = row.querySelector('.rank');
+        row.classList.remove('rank-1', 'rank-2', 'rank-3');
+        cell.className = 'rank';
+        if (PODIUM[rank]) {
+            row.classList.add(`rank-${rank}`);
+            cell.classList.add(`rank-${rank}`);
+            cell.innerHTML = PODIUM[rank];
+        } else {
+            cell.textContent = rank;
+        }
+    }
+
+    function setProgress(row, level, key, time) {
+        row.dataset.level = level;
+        row.dataset.key = key;
+        row.querySelector('.level-progress').style.width = `${(level / 5) * 100}%`;
+        row.querySelector('.level-number').textContent = `QS ${level}`;
+        const cell = row.querySelector('.mission-time');
+        if (time) {
+            cell.innerHTML = '<i class="fas fa-hourglass-half"></i> ';
+            cell.appendChild(document.createTextNode(`${time}m`));
+        } else {
+            cell.textContent = '--';
+        }
+    }
+
+    function buildRow(username) {
+        const row = document.createElement('tr');
+        row.dataset.user = username;
+        row.innerHTML = '<td><div class="rank"></div></td>' +
+            '<td><div class="hacker-tag"><span class="hacker-name"></span></div></td>' +
+            '<td><div class="level-display"><div class="level-bar"><div class="level-progress"></div></div>' +
+            '<span class="level-number"></span></div></td>' +
+            '<td><div class="mission-time"></div></td>';
+        row.querySelector('.hacker-name').textContent = username;
+        return row;
+    }
+
+    function compareRows(a, b) {
+        return (b.dataset.level - a.dataset.level) || (a.dataset.key - b.dataset.key);
+    }
+
+    // Keep rows ordered by level (desc) then submission time (asc), trim to the
+    // rendered page and refresh ranks, podium included
+    function reorderRows() {
+        const rows = Array.from(body.querySelectorAll('tr'));
+        rows.sort(compareRows);
+        rows.forEach((row, i) => {
+            if (i >= pageSize) {
+                row.remove();
+                return;
+            }
+            body.appendChild(row);
+            setRank(row, i + 1);
+        });
+    }
+
+    function applyDelta(delta) {
+        let row = findRow(delta.user);
+        if (!row) {
+            row = buildRow(delta.user);
+            setProgress(row, delta.level, delta.key, delta.time);
+            const last = body.lastElementChild;
+            // Moves below the rendered page don't change what this page shows
+            if (body.children.length >= pageSize && last && compareRows(row, last) >= 0) {
+                return;
+            }
+            body.appendChild(row);
+        } else {
+            setProgress(row, delta.level, delta.key, delta.time);
+        }
+        reorderRows();
+        if (row.parentNode === body) {
+            highlightRow(row);
+        }
+    }
+
+    // While the board is being refetched, deltas wait here and are replayed on top of it
+    let pending = null;
+
+    function rebuild(users) {
+        body.textContent = '';
+        users.forEach(user => {
+            const row = buildRow(user.username);
+            setProgress(row, user.current_level, user.key, user.last_correct_submission);
+            body.appendChild(row);
+        });
+        reorderRows();
+    }
+
+    function refetch() {
+        if (pending) {
+            return;
+        }
+        pending = [];
+        // Every open page gets the reset at once, so spread the refetches out
+        setTimeout(function() {
+            fetch(`${body.dataset.apiUrl}?per_page=${Math.min(pageSize, 200)}`, {credentials: 'same-origin'})
+                .then(response => response.json())
+                .then(data => {
+                    if (data.success) {
+                        rebuild(data.users);
+                    }
+                })
+                .catch(() => {})
+                .finally(() => {
+                    const queued = pending;
+                    pending = null;
+                    queued.forEach(applyDelta);
+                });
+        }, Math.random() * 5000);
+    }
+
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource(body.dataset.streamUrl);
+    source.onmessage = function(event) {
+        const delta = JSON.parse(event.data);
+        if (pending) {
+            pending.push(delta);
+        } else {
+            applyDelta(delta);
+        }
+    };
+    source.addEventListener('reset', refetch);
+});
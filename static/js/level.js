@@ -0,0 +1,49 @@
+function copyCurlCommand() {
+    const curlCommand = document.getElementById('curl-command');
+    curlCommand.select();
+    document.execCommand('copy');
+    
+    // Show copy feedback
+    const copyBtn = document.querySelector('.copy-btn');
+    copyBtn.classList.add('copied');
+    copyBtn.innerHTML = '<i class="fas fa-check"></i>';
+    
+    setTimeout(() => {
+        copyBtn.classList.remove('copied');
+        copyBtn.innerHTML = '<i class="fas fa-copy"></i>';
+    }, 2000);
+}
+
+async function submitFlag(event) {
+    event.preventDefault();
+    const flagInput = document.getElementById('flag-input');
+    const flag = flagInput.value.trim();
+    
+    if (!flag) {
+        alert('Please enter a flag');
+        return;
+    }
+
+    try {
+        const response = await fetch(`${window.scriptRoot}/check_flag/${window.currentLevel}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ flag: flag })
+        });
+
+        const data = await response.json();
+        
+        if (data.success) {
+            window.location.href = data.redirect;
+        } else {
+            alert(data.message || 'Incorrect flag. Try again!');
+            flagInput.value = '';
+            flagInput.focus();
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        alert('Error submitting flag. Please try again.');
+    }
+}
@@ -0,0 +1,86 @@
+let html5QrcodeScanner = null;
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Prevent going back
+    history.pushState(null, null, location.href);
+    window.onpopstate = function(event) {
+        history.go(1);
+    };
+});
+
+document.getElementById('startButton').addEventListener('click', function() {
+    if (html5QrcodeScanner === null) {
+        html5QrcodeScanner = new Html5QrcodeScanner(
+            "reader", 
+            { 
+                fps: 10,
+                qrbox: { width: 250, height: 250 }
+            }
+        );
+        
+        html5QrcodeScanner.render(onScanSuccess, onScanError);
+        this.innerHTML = '<i class="fas fa-stop me-2"></i>Stop Scanner';
+        this.style.background = '#ff5f56';
+    } else {
+        html5QrcodeScanner.clear();
+        html5QrcodeScanner = null;
+        this.innerHTML = '<i class="fas fa-camera me-2"></i>Start Scanner';
+        this.style.background = '#27c93f';
+    }
+});
+
+function onScanSuccess(decodedText, decodedResult) {
+    // Stop scanning
+    if (html5QrcodeScanner) {
+        html5QrcodeScanner.clear();
+        html5QrcodeScanner = null;
+        document.getElementById('startButton').innerHTML = '<i class="fas fa-camera me-2"></i>Start Scanner';
+        document.getElementById('startButton').style.background = '#27c93f';
+    }
+    
+    // Submit the scanned code
+    document.getElementById('locationCode').value = decodedText;
+    submitLocationCode();
+}
+
+function onScanError(errorMessage) {
+    // Handle scan error if needed
+    console.error(errorMessage);
+}
+
+async function submitLocationCode() {
+    const code = document.getElementById('locationCode').value.trim();
+    if (!code) {
+        showAlert('Please enter a location code', 'error');
+        return;
+    }
+
+    try {
+        const response = await fetch(`${window.scriptRoot}/verify_location/${window.currentLevel}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ code: code })
+        });
+
+        const data = await response.json();
+        
+        if (data.success) {
+            window.location.href = data.redirect;
+        } else {
+            showAlert(data.message || 'Incorrect location code. Try again!', 'error');
+            document.getElementById('locationCode').value = '';
+            document.getElementById('locationCode').focus();
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        showAlert('Error submitting location code. Please try again.', 'error');
+    }
+}
+
+function showAlert(message, type) {
+    const alertContent = document.querySelector('.alert-content');
+    alertContent.style.background = type === 'error' ? 'linear-gradient(45deg, #ff5f56, #ff8a80)' : 'linear-gradient(45deg, #2193b0, #6dd5ed)';
+    document.querySelector('.alert-message').textContent = message;
+}
@@ -0,0 +1,84 @@
+"""
+Per-worker cache of signed-in users.
+
+Flask-Login calls the user loader on every authenticated request. Instead of a
+SELECT each time, the loader serves a small read-only UserSnapshot from a bounded
+LRU. Entries expire after `ttl` seconds, so changes made by other workers show up
+within that time. Code that changes a user in this worker calls put() or
+invalidate() straight away.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from flask_login import UserMixin
+
+
+class UserSnapshot(UserMixin):
+    """The fields pages and views read from current_user. Not an ORM object."""
+
+    __slots__ = ('id', 'username', 'current_level', 'last_correct_submission',
+                 'last_correct_submission_serialized')
+
+    def __init__(self, id, username, current_level, last_correct_submission,
+                 last_correct_submission_serialized):
+        self.id = id
+        self.username = username
+        self.current_level = current_level
+        self.last_correct_submission = last_correct_submission
+        self.last_correct_submission_serialized = last_correct_submission_serialized
+
+    @classmethod
+    def from_user(cls, user) -> 'UserSnapshot':
+        return cls(user.id, user.username, user.current_level, user.last_correct_submission,
+                   user.last_correct_submission_serialized)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.id} {self.username!r}>'
+
+
+class UserCache:
+    def __init__(self, load: Callable[[int], Any], ttl: float = 10.0, max_entries: int = 10000):
+        """`load(user_id)` returns the ORM user or None."""
+        self.load = load
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # user_id -> (snapshot, loaded_at)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        user = self.load(user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        return self.put(user)
+
+    def put(self, user) -> UserSnapshot:
+        """Store a fresh snapshot of an ORM user and return it."""
+        snapshot = UserSnapshot.from_user(user)
+        with self._lock:
+            self._entries[snapshot.id] = (snapshot, time.monotonic())
+            self._entries.move_to_end(snapshot.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,529 @@
+"""
+Server-side virtual filesystem for the terminal levels.
+
+Each level's `files` map from challenges/levelN/level_info.json is built once
+into a read-only BaseImage (a path trie with permissions, hidden files and
+symlinks). A contestant's Session only records what they changed, as a
+copy-on-write overlay keyed by path, so thousands of sessions can share one
+base image. Session.execute runs a small shell (ls, cd, cat, find, grep, base64,
+chmod, touch, rm, ...) against the combined view.
+"""
+import base64
+import binascii
+import fnmatch
+import posixpath
+import re
+import shlex
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+DIR, FILE, LINK = 'd', 'f', 'l'
+
+# Marks an overlay path that has no entry of its own, so base lookups fall through
+_MISSING = object()
+
+MAX_OUTPUT = 64 * 1024
+MAX_LINK_DEPTH = 8
+
+
+class VFSError(Exception):
+    """A command failed. The message is shown to the contestant as-is."""
+
+
+class Node:
+    __slots__ = ('kind', 'mode', 'content', 'children', 'target')
+
+    def __init__(self, kind, mode, content='', children=None, target=None):
+        self.kind = kind
+        self.mode = mode
+        self.content = content
+        self.children = children
+        self.target = target
+
+    def with_mode(self, mode):
+        # Content and children are shared with the original, only the node is copied
+        return Node(self.kind, mode, self.content, self.children, self.target)
+
+    @property
+    def size(self):
+        if self.kind == FILE:
+            return len(self.content.encode('utf-8'))
+        if self.kind == LINK:
+            return len(self.target)
+        return 4096
+
+
+def mode_string(node: Node) -> str:
+    bits = ''
+    for shift in (6, 3, 0):
+        part = (node.mode >> shift) & 7
+        bits += ('r' if part & 4 else '-') + ('w' if part & 2 else '-') + ('x' if part & 1 else '-')
+    return {DIR: 'd', FILE: '-', LINK: 'l'}[node.kind] + bits
+
+
+class BaseImage:
+    """Read-only tree shared by every session of one level."""
+
+    def __init__(self, files: Mapping[str, str], permissions: Optional[Mapping[str, str]] = None,
+                 symlinks: Optional[Mapping[str, str]] = None):
+        self.root = Node(DIR, 0o755, children={})
+        for path, content in files.items():
+            mode = 0o755 if path.endswith('.sh') else 0o644
+            self._add(path, Node(FILE, mode, content))
+        for path, target in (symlinks or {}).items():
+            self._add(path, Node(LINK, 0o777, target=target))
+        for path, mode in (permissions or {}).items():
+            node = self.get(posixpath.normpath(path))
+            if node is not None:
+                node.mode = int(mode, 8)
+
+    def _add(self, path: str, node: Node):
+        parts = [part for part in posixpath.normpath(path).split('/') if part]
+        parent = self.root
+        for part in parts[:-1]:
+            child = parent.children.get(part)
+            if child is None:
+                child = parent.children[part] = Node(DIR, 0o755, children={})
+            parent = child
+        parent.children[parts[-1]] = node
+
+    def get(self, path: str) -> Optional[Node]:
+        """Exact lookup of a normalised absolute path, without following links."""
+        node = self.root
+        for part in path.split('/'):
+            if not part:
+                continue
+            if node.kind != DIR:
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+
+class Session:
+    __slots__ = ('image', 'changes', 'opaque', 'cwd', 'home', 'allowed', 'last_used')
+
+    def __init__(self, image: BaseImage, allowed: Iterable[str], home: str = '/home/user'):
+        self.image = image
+        # path -> Node, or None for a deleted path
+        self.changes: Dict[str, Optional[Node]] = {}
+        # Directories re-created after deletion, base entries below them stay hidden
+        self.opaque = set()
+        self.home = home if image.get(home) is not None else '/'
+        self.cwd = self.home
+        self.allowed = frozenset(allowed)
+        self.last_used = time.monotonic()
+
+    # Lookup
+
+    def _base_visible(self, path: str) -> bool:
+        while path != '/':
+            path = posixpath.dirname(path)
+            if path in self.opaque or self.changes.get(path, _MISSING) is None:
+                return False
+        return True
+
+    def _get(self, path: str) -> Optional[Node]:
+        node = self.changes.get(path, _MISSING)
+        if node is not _MISSING:
+            return node
+        if self.changes and not self._base_visible(path):
+            return None
+        return self.image.get(path)
+
+    def _abspath(self, path: str) -> str:
+        if path == '~' or path.startswith('~/'):
+            path = self.home + path[1:]
+        return posixpath.normpath(posixpath.join(self.cwd, path)).replace('//', '/')
+
+    def resolve(self, path: str, follow: bool = True) -> Tuple[str, Optional[Node]]:
+        """Walk `path` following symlinks. Returns the real path and its node (None if missing)."""
+        parts = [part for part in self._abspath(path).split('/') if part]
+        real = '/'
+        hops = 0
+        while parts:
+            part = parts.pop(0)
+            candidate = posixpath.join(real, part)
+            node = self._get(candidate)
+            if node is not None and node.kind == LINK and (parts or follow):
+                hops += 1
+                if hops > MAX_LINK_DEPTH:
+                    raise VFSError(f'{path}: Too many levels of symbolic links')
+                target = posixpath.join(real, node.target)
+                parts = [p for p in posixpath.normpath(target).split('/') if p] + parts
+                real = '/'
+                continue
+            if node is None:
+                return (posixpath.join(candidate, *parts) if parts else candidate), None
+            if parts and node.kind != DIR:
+                raise VFSError(f'{path}: Not a directory')
+            real = candidate
+        return real, self._get(real)
+
+    def listdir(self, path: str) -> Dict[str, Node]:
+        entries = {}
+        base = None
+        # A chmod'ed base directory still takes its contents from the image
+        if (path not in self.opaque and self.changes.get(path, _MISSING) is not None
+                and self._base_visible(path)):
+            base = self.image.get(path)
+        if base is not None and base.kind == DIR:
+            for name in base.children:
+                node = self._get(posixpath.join(path, name))
+                if node is not None:
+                    entries[name] = node
+        for changed, node in self.changes.items():
+            if node is not None and changed != '/' and posixpath.dirname(changed) == path:
+                entries[posixpath.basename(changed)] = node
+        return dict(sorted(entries.items()))
+
+    # Helpers used by the commands
+
+    def _read(self, path: str, command: str) -> str:
+        real, node = self.resolve(path)
+        if node is None:
+            raise VFSError(f'{command}: {path}: No such file or directory')
+        if node.kind == DIR:
+            raise VFSError(f'{command}: {path}: Is a directory')
+        if not node.mode & 0o400:
+            raise VFSError(f'{command}: {path}: Permission denied')
+        return node.content
+
+    def _dir(self, path: str, command: str) -> str:
+        real, node = self.resolve(path)
+        if node is None:
+            raise VFSError(f'{command}: {path}: No such file or directory')
+        if node.kind != DIR:
+            raise VFSError(f'{command}: {path}: Not a directory')
+        return real
+
+    def _walk(self, path: str):
+        """Yield (path, node) for `path` and everything below it that is readable."""
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            node = self._get(current)
+            if node is None:
+                continue
+            yield current, node
+            if node.kind == DIR and node.mode & 0o500 == 0o500:
+                children = self.listdir(current)
+                stack.extend(posixpath.join(current, name) for name in reversed(list(children)))
+
+    # Shell
+
+    def execute(self, command_line: str) -> str:
+        """Run one command line (optionally a `|` pipeline) and return its output."""
+        self.last_used = time.monotonic()
+        try:
+            lexer = shlex.shlex(command_line, posix=True, punctuation_chars='|')
+            lexer.whitespace_split = True
+            tokens = list(lexer)
+        except ValueError as e:
+            return f'bash: {e}'
+
+        pipeline: List[List[str]] = [[]]
+        for token in tokens:
+            if token == '|':
+                pipeline.append([])
+            else:
+                pipeline[-1].append(token)
+
+        output = None
+        for argv in pipeline:
+            if not argv:
+                return 'bash: syntax error near unexpected token `|\''
+            name = argv[0]
+            handler = getattr(self, f'cmd_{name}', None)
+            if handler is None:
+                return f'{name}: command not found'
+            if name not in self.allowed and name != 'help':
+                return f'{name}: command not available in this level'
+            try:
+                output = handler(argv[1:], output)
+            except VFSError as e:
+                return str(e)
+        output = output or ''
+        if len(output) > MAX_OUTPUT:
+            output = output[:MAX_OUTPUT] + '\n[output truncated]'
+        return output
+
+    def cmd_help(self, args, stdin):
+        return 'Available commands: ' + ' '.join(sorted(self.allowed | {'help'}))
+
+    def cmd_pwd(self, args, stdin):
+        return self.cwd
+
+    def cmd_echo(self, args, stdin):
+        return ' '.join(args)
+
+    def cmd_cd(self, args, stdin):
+        target = args[0] if args else self.home
+        real = self._dir(target, 'cd')
+        if not self._get(real).mode & 0o100:
+            raise VFSError(f'cd: {target}: Permission denied')
+        self.cwd = real
+        return ''
+
+    def cmd_ls(self, args, stdin):
+        flags = ''.join(arg[1:] for arg in args if arg.startswith('-'))
+        paths = [arg for arg in args if not arg.startswith('-')] or ['.']
+        show_all = 'a' in flags
+        long = 'l' in flags
+        blocks = []
+        for path in paths:
+            real, node = self.resolve(path)
+            if node is None:
+                raise VFSError(f"ls: cannot access '{path}': No such file or directory")
+            if node.kind != DIR:
+                entries = {posixpath.basename(real) if path.startswith('/') else path: node}
+            else:
+                if not node.mode & 0o400:
+                    raise VFSError(f"ls: cannot open directory '{path}': Permission denied")
+                entries = self.listdir(real)
+                if show_all:
+                    entries = {'.': node, '..': self._get(posixpath.dirname(real)) or node, **entries}
+                else:
+                    entries = {name: child for name, child in entries.items() if not name.startswith('.')}
+            if long:
+                lines = [f'total {len(entries)}']
+                for name, child in entries.items():
+                    suffix = f' -> {child.target}' if child.kind == LINK else ''
+                    lines.append(f'{mode_string(child)} 1 user user {child.size:>5} Jan 17 12:00 {name}{suffix}')
+                listing = '\n'.join(lines)
+            else:
+                listing = '  '.join(entries)
+            blocks.append(f'{path}:\n{listing}' if len(paths) > 1 else listing)
+        return '\n\n'.join(blocks)
+
+    def cmd_cat(self, args, stdin):
+        if not args:
+            return stdin or ''
+        return '\n'.join(self._read(path, 'cat') for path in args)
+
+    def _lines_command(self, name, args, stdin, pick):
+        count = 10
+        paths = []
+        i = 0
+        while i < len(args):
+            if args[i] == '-n' and i + 1 < len(args):
+                count = int(args[i + 1]) if args[i + 1].isdigit() else count
+                i += 2
+                continue
+            if args[i].startswith('-') and args[i][1:].isdigit():
+                count = int(args[i][1:])
+            elif not args[i].startswith('-'):
+                paths.append(args[i])
+            i += 1
+        text = '\n'.join(self._read(path, name) for path in paths) if paths else (stdin or '')
+        return '\n'.join(pick(text.split('\n'), count))
+
+    def cmd_head(self, args, stdin):
+        return self._lines_command('head', args, stdin, lambda lines, n: lines[:n])
+
+    def cmd_tail(self, args, stdin):
+        return self._lines_command('tail', args, stdin, lambda lines, n: lines[-n:] if n else [])
+
+    def cmd_find(self, args, stdin):
+        start = '.'
+        if args and not args[0].startswith('-'):
+            start, args = args[0], args[1:]
+        pattern = kind = None
+        i = 0
+        while i < len(args):
+            if args[i] in ('-name', '-iname') and i + 1 < len(args):
+                pattern = args[i + 1].lower() if args[i] == '-iname' else args[i + 1]
+                ignore_case = args[i] == '-iname'
+                i += 2
+            elif args[i] == '-type' and i + 1 < len(args):
+                kind = args[i + 1]
+                i += 2
+            else:
+                raise VFSError(f"find: unknown predicate '{args[i]}'")
+        real = self._dir(start, 'find')
+        results = []
+        for path, node in self._walk(real):
+            name = posixpath.basename(path) or '/'
+            if pattern is not None:
+                if not fnmatch.fnmatchcase(name.lower() if ignore_case else name, pattern):
+                    continue
+            if kind is not None and node.kind != kind:
+                continue
+            # Print paths the way they were asked for, e.g. ./notes/todo.txt
+            shown = _display_path(start, real, path)
+            results.append(shown)
+        return '\n'.join(results)
+
+    def cmd_grep(self, args, stdin):
+        flags = ''
+        rest = []
+        for arg in args:
+            if arg.startswith('-') and len(arg) > 1 and not rest:
+                flags += arg[1:]
+            else:
+                rest.append(arg)
+        if not rest:
+            raise VFSError('Usage: grep [-inrv] PATTERN [FILE]...')
+        try:
+            regex = re.compile(rest[0], re.IGNORECASE if 'i' in flags else 0)
+        except re.error as e:
+            raise VFSError(f'grep: {e}')
+        invert = 'v' in flags
+
+        sources = []
+        if len(rest) == 1:
+            if 'r' in flags:
+                rest.append('.')
+            else:
+                sources.append((None, stdin or ''))
+        for path in rest[1:]:
+            real, node = self.resolve(path)
+            if node is not None and node.kind == DIR:
+                if 'r' not in flags:
+                    raise VFSError(f'grep: {path}: Is a directory')
+                for child_path, child in self._walk(real):
+                    if child.kind == FILE and child.mode & 0o400:
+                        shown = _display_path(path, real, child_path)
+                        sources.append((shown, child.content))
+            else:
+                sources.append((path, self._read(path, 'grep')))
+
+        prefix_names = len(sources) > 1 or 'r' in flags
+        matches = []
+        for name, text in sources:
+            for number, line in enumerate(text.split('\n'), 1):
+                if bool(regex.search(line)) != invert:
+                    prefix = f'{name}:' if prefix_names and name else ''
+                    if 'n' in flags:
+                        prefix += f'{number}:'
+                    matches.append(prefix + line)
+        return '\n'.join(matches)
+
+    def cmd_base64(self, args, stdin):
+        decode = any(arg in ('-d', '--decode') for arg in args)
+        paths = [arg for arg in args if not arg.startswith('-')]
+        text = self._read(paths[0], 'base64') if paths else (stdin or '')
+        if decode:
+            try:
+                return base64.b64decode(''.join(text.split()), validate=True).decode('utf-8', 'replace')
+            except (binascii.Error, ValueError):
+                raise VFSError('base64: invalid input')
+        return base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+    def cmd_chmod(self, args, stdin):
+        if len(args) < 2:
+            raise VFSError('Usage: chmod MODE FILE...')
+        spec = args[0]
+        for path in args[1:]:
+            real, node = self.resolve(path)
+            if node is None:
+                raise VFSError(f"chmod: cannot access '{path}': No such file or directory")
+            self.changes[real] = node.with_mode(_apply_mode(spec, node.mode))
+        return ''
+
+    def cmd_touch(self, args, stdin):
+        for path in args:
+            real, node = self.resolve(path)
+            if node is None:
+                self._dir(posixpath.dirname(real), 'touch')
+                self.changes[real] = Node(FILE, 0o644, '')
+        return ''
+
+    def cmd_mkdir(self, args, stdin):
+        for path in (arg for arg in args if not arg.startswith('-')):
+            real, node = self.resolve(path)
+            if node is not None:
+                raise VFSError(f"mkdir: cannot create directory '{path}': File exists")
+            self._dir(posixpath.dirname(real), 'mkdir')
+            if real in self.changes:
+                # Recreating something deleted: don't let the old base entries show through
+                self.opaque.add(real)
+            self.changes[real] = Node(DIR, 0o755, children={})
+        return ''
+
+    def cmd_rm(self, args, stdin):
+        recursive = any(arg.startswith('-') and ('r' in arg or 'R' in arg) for arg in args)
+        for path in (arg for arg in args if not arg.startswith('-')):
+            real, node = self.resolve(path, follow=False)
+            if node is None:
+                raise VFSError(f"rm: cannot remove '{path}': No such file or directory")
+            if node.kind == DIR and not recursive:
+                raise VFSError(f"rm: cannot remove '{path}': Is a directory")
+            for changed in [p for p in self.changes if p.startswith(real + '/')]:
+                del self.changes[changed]
+            self.opaque.discard(real)
+            self.changes[real] = None
+        return ''
+
+
+def _display_path(asked: str, real: str, path: str) -> str:
+    """Show `path` (found below `real`) relative to how the user spelled `real`."""
+    if path == real:
+        return asked
+    suffix = path if real == '/' else path[len(real):]
+    return asked.rstrip('/') + suffix
+
+
+def _apply_mode(spec: str, mode: int) -> int:
+    if re.fullmatch(r'[0-7]{1,4}', spec):
+        return int(spec, 8) & 0o777
+    match = re.fullmatch(r'([ugoa]*)([+\-=])([rwx]*)', spec)
+    if match is None:
+        raise VFSError(f"chmod: invalid mode: '{spec}'")
+    who, op, perms = match.groups()
+    shifts = {'u': [6], 'g': [3], 'o': [0], 'a': [6, 3, 0]}
+    targets = sorted({shift for w in (who or 'a') for shift in shifts[w]})
+    bits = sum({'r': 4, 'w': 2, 'x': 1}[p] for p in set(perms))
+    for shift in targets:
+        if op == '+':
+            mode |= bits << shift
+        elif op == '-':
+            mode &= ~(bits << shift)
+        else:
+            mode = (mode & ~(7 << shift)) | (bits << shift)
+    return mode
+
+
+class TerminalSessions:
+    """Builds each level's BaseImage once and keeps an LRU of per-user sessions."""
+
+    def __init__(self, max_sessions: int = 10000, idle_timeout: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._images: Dict[tuple, BaseImage] = {}
+        self._sessions: "OrderedDict[tuple, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def image(self, catalog_version: str, level: int, level_info: Mapping) -> BaseImage:
+        key = (catalog_version, level)
+        image = self._images.get(key)
+        if image is None:
+            image = BaseImage(level_info.get('files', {}), level_info.get('permissions'),
+                              level_info.get('symlinks'))
+            with self._lock:
+                # Images from an older catalog are no longer needed
+                for old in [k for k in self._images if k[1] == level and k != key]:
+                    del self._images[old]
+                self._images[key] = image
+        return image
+
+    def get(self, user_key, level: int, catalog_version: str, level_info: Mapping) -> Session:
+        key = (user_key, level)
+        image = self.image(catalog_version, level, level_info)
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None or session.image is not image or now - session.last_used > self.idle_timeout:
+                allowed = {command.split()[0] for command in level_info.get('commands', [])}
+                session = Session(image, allowed)
+                self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def __len__(self):
+        return len(self._sessions)